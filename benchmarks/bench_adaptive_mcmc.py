@@ -0,0 +1,90 @@
+"""
+Benchmark of sampling efficiency of Metropolis-Hastings on a correlated, badly scaled posterior, comparing fixed-length
+moves of step_size with adaptive_proposal = 1 and target_acceptance.
+
+Simulations are not run. The objective of each PSet is the negative log density of a multivariate normal distribution
+in the parameter values, which is fed back to BasicBayesMCMCAlgorithm.got_result(). The effective sample size (ESS) of
+the sampled chain is estimated from its autocorrelation.
+
+Usage: python benchmarks/bench_adaptive_mcmc.py [number of iterations] [correlation]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import BasicBayesMCMCAlgorithm, Result
+from pybnf.config import Configuration
+
+DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'demo')
+
+
+def ess(x):
+    """Effective sample size of a 1D chain, summing autocorrelations up to the first negative pair (Geyer)"""
+    n = len(x)
+    x = x - np.mean(x)
+    f = np.fft.rfft(x, 2 * n)
+    acf = np.fft.irfft(f * np.conjugate(f))[:n] / (n * np.var(x))
+    tau = -1.
+    for k in range(0, n - 1, 2):
+        pair = acf[k] + acf[k + 1]
+        if pair < 0:
+            break
+        tau += 2 * pair
+    return n / tau
+
+
+def run(iterations, rho, extra_settings, seed=0):
+    """Runs one chain, and returns the minimum ESS over the parameters and the move acceptance rate"""
+    np.random.seed(seed)
+    model = os.path.join(DEMO, 'parabola.xml')
+    exp = os.path.join(DEMO, 'par1.exp')
+    settings = {
+        'population_size': 1, 'max_iterations': iterations, 'step_size': 0.2, 'output_hist_every': 10 ** 9,
+        'sample_every': 1, 'burn_in': iterations // 10, 'output_dir': 'bench_adaptive_mcmc', 'verbosity': 0,
+        ('uniform_var', 'v1'): [-20, 20], ('uniform_var', 'v2'): [-20, 20], ('uniform_var', 'v3'): [-20, 20],
+        'models': {model}, 'exp_data': {exp}, model: [exp], 'time_course': [{'time': '20', 'suffix': 'par1'}],
+        'fit_type': 'mh', 'save_samples_txt': 0, 'output_every': 10 ** 9}
+    settings.update(extra_settings)
+    alg = BasicBayesMCMCAlgorithm(Configuration(settings))
+    alg.output_results = lambda name='', no_move=False: None
+
+    # Posterior with standard deviations 5, 1, 0.2 and correlation rho between the first two parameters
+    sd = np.array([5., 1., 0.2])
+    corr = np.eye(3)
+    corr[0, 1] = corr[1, 0] = rho
+    precision = np.linalg.inv(corr * np.outer(sd, sd))
+
+    pending = alg.start_run()
+    while pending:
+        p = pending.pop()
+        res = Result(p, None, p.name)
+        x = p.vector
+        res.score = 0.5 * x.dot(precision).dot(x)
+        response = alg.got_result(res)
+        if response == 'STOP':
+            break
+        pending += response
+    alg.sample_store.flush()
+    return min(ess(np.array(alg.sample_store.column(v))) for v in ('v1', 'v2', 'v3')), alg.accepted / alg.attempts
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rho = float(sys.argv[2]) if len(sys.argv) > 2 else 0.95
+    os.makedirs('bench_adaptive_mcmc/Results', exist_ok=True)
+    print('%i iterations, correlation %s' % (iterations, rho))
+    variants = [('step_size moves', {}),
+                ('target_acceptance 0.3', {'target_acceptance': 0.3}),
+                ('adaptive_proposal', {'adaptive_proposal': 1}),
+                ('adaptive_proposal + target', {'adaptive_proposal': 1, 'target_acceptance': 0.3})]
+    for label, extra_settings in variants:
+        min_ess, rate = run(iterations, rho, extra_settings)
+        print('%-28s min ESS %7.1f, ESS per 1000 simulations %6.2f, acceptance %.2f'
+              % (label + ':', min_ess, 1000. * min_ess / iterations, rate))
+
+
+if __name__ == '__main__':
+    main()
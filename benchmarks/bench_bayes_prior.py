@@ -0,0 +1,110 @@
+"""
+Benchmark of the per-generation work done on the scheduler by the Bayesian algorithms, comparing the previous
+per-parameter ln_prior() loop and one-chain-at-a-time DREAM proposals with ln_priors() on the compiled prior arrays and
+DreamAlgorithm.calculate_new_psets()
+
+Usage: python benchmarks/bench_bayes_prior.py [number of chains] [number of parameters]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import DreamAlgorithm
+from pybnf.pset import PSet, FreeParameter, OutOfBoundsException
+
+
+class BenchConfig:
+    def __init__(self):
+        self.config = {'zeta': 1e-6, 'lambda': 0.1}
+
+
+class BenchDream(DreamAlgorithm):
+    """Holds only the state used for priors and proposals"""
+
+    def __init__(self, variables, n):
+        self.config = BenchConfig()
+        self.variables = variables
+        self.num_parallel = n
+        self.n_dim = len(variables)
+        self.all_idcs = np.arange(self.n_dim)
+        self.ncr = [1/3, 2/3, 1.]
+        self.g_prob = 0.1
+        self.step_size = 0.2
+        self.load_priors()
+        self.current_pset = [PSet([v.sample_value() for v in variables]) for _ in range(n)]
+
+
+def loop_ln_prior(alg, pset):
+    """The prior previously computed by BayesianAlgorithm.ln_prior()"""
+    total = 0.
+    for v in alg.prior:
+        (space, dist, x1, x2) = alg.prior[v]
+        if space == 'log':
+            val = np.log10(pset[v])
+        else:
+            val = pset[v]
+        if dist == 'n':
+            total += -1. / (2. * x2 ** 2.) * (x1 - val)**2.
+        else:
+            if x1 <= val <= x2:
+                total += -np.log(x2-x1)
+            else:
+                total += -np.inf
+    return total
+
+
+def loop_new_pset(alg, idx):
+    """The proposal previously computed by DreamAlgorithm.calculate_new_pset() for one chain"""
+    all_chains = np.arange(alg.num_parallel)
+    sel = np.random.choice(all_chains[all_chains != idx], 2, replace=False)
+    x0 = alg.current_pset[idx]
+    x1 = alg.current_pset[sel[0]]
+    x2 = alg.current_pset[sel[1]]
+    cr = np.random.choice(alg.ncr)
+    while True:
+        ds = np.random.uniform(size=alg.n_dim) <= cr
+        if np.any(ds):
+            break
+    gamma = 1 if np.random.uniform() < alg.g_prob else alg.step_size
+    new_vars = []
+    for i, d in enumerate(np.random.permutation(ds)):
+        k = alg.variables[i]
+        diff = x1.get_param(k.name).diff(x2.get_param(k.name)) if d else 0.0
+        zeta = np.random.normal(0, alg.config.config['zeta'])
+        lamb = np.random.uniform(-alg.config.config['lambda'], alg.config.config['lambda'])
+        try:
+            new_vars.append(x0.get_param(k.name).add(zeta + (1. + lamb) * gamma * diff, False))
+        except OutOfBoundsException:
+            return None
+    return PSet(new_vars)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    d = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    types = ['uniform_var', 'loguniform_var', 'normal_var', 'lognormal_var']
+    bounds = {'uniform_var': (0., 10.), 'loguniform_var': (1e-3, 1e3), 'normal_var': (5., 1.),
+              'lognormal_var': (0., 1.)}
+    variables = [FreeParameter('k%i' % i, types[i % 4], *bounds[types[i % 4]]) for i in range(d)]
+    alg = BenchDream(variables, n)
+    psets = alg.current_pset
+
+    assert np.allclose([loop_ln_prior(alg, p) for p in psets], alg.ln_priors(np.array([p.vector for p in psets])))
+    t_prior_old = min(timeit.repeat(lambda: [loop_ln_prior(alg, p) for p in psets], number=1, repeat=3))
+    t_prior_new = min(timeit.repeat(lambda: alg.ln_priors(np.array([p.vector for p in psets])), number=1, repeat=3))
+    t_prop_old = min(timeit.repeat(lambda: [loop_new_pset(alg, i) for i in range(n)], number=1, repeat=3))
+    t_prop_new = min(timeit.repeat(alg.calculate_new_psets, number=1, repeat=3))
+
+    print('%i chains, %i parameters, times per generation' % (n, d))
+    print('ln prior:       per-parameter loop %.5f s, arrays %.5f s, speedup %.1fx'
+          % (t_prior_old, t_prior_new, t_prior_old / t_prior_new))
+    print('DREAM proposal: per-chain          %.5f s, matrix %.5f s, speedup %.1fx'
+          % (t_prop_old, t_prop_new, t_prop_old / t_prop_new))
+
+
+if __name__ == '__main__':
+    main()
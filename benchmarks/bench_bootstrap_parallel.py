@@ -0,0 +1,105 @@
+"""
+Benchmark of wall time and worker utilization of bootstrapping with differential evolution, comparing replicates run
+one after another with bootstrap_parallel replicates run concurrently by run_concurrently() on the same client.
+
+Simulations are not run. Each Job is a dask task on a local threaded cluster that sleeps for a random duration
+(lognormal, to mimic stochastic simulations) and returns the sum of squares of its parameter values as the objective.
+
+Usage: python benchmarks/bench_bootstrap_parallel.py [workers] [replicates] [bootstrap_parallel]
+"""
+
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import DifferentialEvolution, Result, run_concurrently
+from pybnf.config import Configuration
+from pybnf import printing
+
+DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'demo')
+MEDIAN_DURATION = 0.02
+
+
+def fake_job(j):
+    """Stands in for run_job(): sleeps, and returns a scored Result"""
+    duration = MEDIAN_DURATION * np.random.lognormal(0., 1.)
+    time.sleep(duration)
+    res = Result(j.params, None, j.job_id)
+    res.score = float(np.sum((j.params.vector - 3.) ** 2))
+    res.wall_time = duration
+    return res
+
+
+class BenchDE(DifferentialEvolution):
+    """Submits fake_job() in place of run_job(), and adds up the time spent in jobs"""
+
+    busy = [0.]
+
+    def add_to_trajectory(self, res):
+        self.busy[0] += res.wall_time
+        super(BenchDE, self).add_to_trajectory(res)
+
+    def _submit_jobs(self, client, jobs, batch_size, debug, pending):
+        futures = []
+        for j in jobs:
+            f = client.submit(fake_job, j, pure=False)
+            pending[f] = [(j.params, j.job_id)]
+            futures.append(f)
+        return futures
+
+
+def new_fit(workers):
+    model = os.path.join(DEMO, 'parabola.xml')
+    exp = os.path.join(DEMO, 'par1.exp')
+    alg = BenchDE(Configuration({
+        'population_size': 2 * workers, 'max_iterations': 10, 'output_every': 10 ** 6, 'verbosity': 0,
+        ('uniform_var', 'v1'): [0, 10], ('uniform_var', 'v2'): [0, 10], ('uniform_var', 'v3'): [0, 10],
+        'models': {model}, 'exp_data': {exp}, model: [exp], 'time_course': [{'time': '20', 'suffix': 'par1'}],
+        'fit_type': 'de', 'objfunc': 'chi_sq', 'output_dir': 'bench_bootstrap_parallel', 'delete_old_files': 1,
+        'save_best_data': 0, 'bootstrap': 100}))
+    return alg
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    replicates = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    parallel = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    os.makedirs('bench_bootstrap_parallel/Results', exist_ok=True)
+    printing.verbosity = 0
+    cluster = LocalCluster(n_workers=1, threads_per_worker=workers, processes=False, dashboard_address=None)
+    client = Client(cluster)
+    print('%i workers, %i replicates of DE with %i individuals and 10 iterations, median job %.3f s'
+          % (workers, replicates, 2 * workers, MEDIAN_DURATION))
+    try:
+        for label, concurrent in (('one at a time', 1), ('bootstrap_parallel = %i' % parallel, parallel)):
+            np.random.seed(0)
+            alg = new_fit(workers)
+            alg.run(client)
+            BenchDE.busy[0] = 0.
+            start = time.time()
+            if concurrent == 1:
+                for i in range(replicates):
+                    alg.bootstrap_replicate(i).run(client)
+            else:
+                remaining = list(range(concurrent, replicates))
+
+                def next_run(replicate):
+                    return (alg.bootstrap_replicate(remaining.pop(0)), None) if remaining else None
+
+                run_concurrently(client, [(alg.bootstrap_replicate(i), None) for i in range(concurrent)], next_run)
+            elapsed = time.time() - start
+            print('%-26s %.2f s, worker utilization %.2f'
+                  % (label + ':', elapsed, BenchDE.busy[0] / (workers * elapsed)))
+    finally:
+        client.close()
+        cluster.close()
+        shutil.rmtree('bench_bootstrap_parallel')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Microbenchmark comparing the bulk data file reader with the line-by-line reader
+
+Usage: python benchmarks/bench_data_reader.py [rows] [columns]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.data import Data
+
+
+def make_gdat_lines(rows, cols):
+    """Generate the lines of a gdat file in the format written by BioNetGen"""
+    arr = np.random.RandomState(0).rand(rows, cols) * 1e4
+    arr[:, 0] = np.arange(rows)
+    header = '#%16s' % 'time' + ''.join('%17s' % ('obs%i' % i) for i in range(1, cols)) + '\n'
+    return [header] + [' ' + ' '.join('%16.8e' % v for v in r) + '\n' for r in arr]
+
+
+def line_by_line(lines):
+    d = Data()
+    ncols = d._read_header(lines[0], '\s+')
+    return d._read_body_lines(lines[1:], '\s+', ncols)
+
+
+def bulk(lines):
+    return Data()._read_file_lines(lines, '\s+')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    lines = make_gdat_lines(rows, cols)
+    assert np.array_equal(line_by_line(lines), bulk(lines))
+
+    reps = 5
+    t_old = min(timeit.repeat(lambda: line_by_line(lines), number=1, repeat=reps))
+    t_new = min(timeit.repeat(lambda: bulk(lines), number=1, repeat=reps))
+    print('%i rows x %i columns' % (rows, cols))
+    print('Line by line: %.4f s' % t_old)
+    print('Bulk:         %.4f s' % t_new)
+    print('Speedup:      %.1fx' % (t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of proposing a full differential evolution generation, comparing the previous per-individual,
+per-parameter proposal with DifferentialEvolutionBase.new_generation()
+
+Usage: python benchmarks/bench_de_generation.py [population size] [number of parameters]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import DifferentialEvolutionBase
+from pybnf.pset import PSet, FreeParameter
+
+
+class BenchDE(DifferentialEvolutionBase):
+    """Holds only the settings used to propose new individuals"""
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self.mutation_rate = 0.5
+        self.mutation_factor = 0.5
+
+
+def per_parameter_individual(de, individuals, base_index=None):
+    """The per-parameter proposal previously done by new_individual()"""
+    pickn = 3 if '1' in de.strategy else 5
+    picks = np.random.choice(len(individuals), pickn, replace=False)
+    if base_index is not None:
+        if base_index in picks:
+            picks[list(picks).index(base_index)] = picks[0]
+        picks[0] = base_index
+    base = individuals[picks[0]]
+    others = [individuals[p] for p in picks[1:]]
+    new_pset_vars = []
+    for p in base:
+        if np.random.random() < de.mutation_rate:
+            update_val = de.mutation_factor * others[0].get_param(p.name).diff(others[1].get_param(p.name))
+            if pickn == 5:
+                update_val += de.mutation_factor * others[2].get_param(p.name).diff(others[3].get_param(p.name))
+            new_pset_vars.append(p.add(update_val))
+        else:
+            new_pset_vars.append(p)
+    return PSet(new_pset_vars)
+
+
+def main():
+    pop = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    variables = [FreeParameter('k%i' % i, 'loguniform_var' if i % 2 else 'uniform_var', 1e-3, 1e3, bounded=True)
+                 for i in range(n)]
+    individuals = [PSet([v.sample_value() for v in variables]) for _ in range(pop)]
+
+    print('Population %i, %i parameters' % (pop, n))
+    for strategy in ('rand1', 'best2', 'all1'):
+        de = BenchDE(strategy)
+        if 'best' in strategy:
+            bases = [0] * pop
+        elif 'all' in strategy:
+            bases = list(range(pop))
+        else:
+            bases = [None] * pop
+        t_old = min(timeit.repeat(lambda: [per_parameter_individual(de, individuals, b) for b in bases],
+                                  number=1, repeat=3))
+        t_new = min(timeit.repeat(lambda: de.new_generation(individuals, bases), number=1, repeat=3))
+        print('%s: per-parameter %.4f s, vectorized %.4f s per generation (%.1fx)' %
+              (strategy, t_old, t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark of the data sent to the scheduler with each Job, comparing Jobs that contain the model list with Jobs that
+refer to JobSettings scattered once per run
+
+Usage: python benchmarks/bench_job_payload.py [path/to/file.net]
+"""
+
+import os
+import pickle
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import Job, JobSettings
+from pybnf.pset import NetModel, PSet, FreeParameter
+
+DEFAULT_NET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'fceri_gamma',
+                           'fceri_gamma2.net')
+
+
+def main():
+    netfile = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_NET
+    model = NetModel('bench', ['simulate({method=>"ode",t_end=>100,n_steps=>10})'], [], [], nf=netfile)
+    params = [FreeParameter(name, 'loguniform_var', 1e-10, 1e10, value=1.2345) for name, _ in model._template[1]]
+    pset = PSet(params)
+
+    full = Job([model], pset, 'sim_1', '/tmp', 3600, None, None, dict())
+    shared = Job(None, pset, 'sim_1', '/tmp', 3600, None, None, None, settings_id=0)
+    settings = JobSettings([model], None, dict())
+
+    full_bytes = len(pickle.dumps(full))
+    shared_bytes = len(pickle.dumps(shared))
+    settings_bytes = len(pickle.dumps(settings))
+    number = 100
+    t_full = min(timeit.repeat(lambda: pickle.dumps(full), number=number, repeat=5)) / number
+    t_shared = min(timeit.repeat(lambda: pickle.dumps(shared), number=number, repeat=5)) / number
+
+    print('%s: %i lines, %i parameters' % (os.path.basename(netfile), len(model.netfile_lines), len(params)))
+    print('Job with models:        %9i bytes, %.6f s to pickle' % (full_bytes, t_full))
+    print('Job with settings_id:   %9i bytes, %.6f s to pickle' % (shared_bytes, t_shared))
+    print('Scattered once per run: %9i bytes' % settings_bytes)
+    print('Reduction per Job:      %.1fx' % (full_bytes / shared_bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark of building and saving a NetModel with new parameter values, comparing the compiled template with the
+previous approach of regex-matching every line of the .net file
+
+Usage: python benchmarks/bench_net_template.py [path/to/file.net]
+"""
+
+import copy
+import os
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.pset import NetModel, PSet, FreeParameter
+
+DEFAULT_NET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'fceri_gamma',
+                           'fceri_gamma2.net')
+
+
+def regex_copy_and_save(lines, pset, file_prefix):
+    """The per-line regex substitution and save previously done by NetModel"""
+    lines_copy = copy.deepcopy(lines)
+    in_params_block = False
+    for i, l in enumerate(lines_copy):
+        if re.match('begin\s+parameters', l.strip()):
+            in_params_block = True
+        elif re.match('end\s+parameters', l.strip()):
+            in_params_block = False
+        elif in_params_block:
+            m = re.match('(\s+)(\d+)\s+([A-Za-z_]\w*)(\s+)([-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)(?=\s+)', l)
+            if m:
+                if m.group(3) in pset.keys():
+                    lines_copy[i] = '%s%s %s%s%s\n' % (m.group(1), m.group(2), m.group(3), m.group(4),
+                                                       str(pset[m.group(3)]))
+    with open(file_prefix + '.net', 'w') as wf:
+        wf.write(''.join(lines_copy))
+    return lines_copy
+
+
+def template_copy_and_save(model, pset, file_prefix):
+    new = model.copy_with_param_set(pset)
+    new.save(file_prefix)
+    return new
+
+
+def main():
+    netfile = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_NET
+    model = NetModel('bench', [], [], [], nf=netfile)
+    lines = model.netfile_lines
+    params = [FreeParameter(name, 'loguniform_var', 1e-10, 1e10, value=1.2345) for name, _ in model._template[1]]
+    pset = PSet(params)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        prefix = os.path.join(tmp, 'bench')
+        assert ''.join(regex_copy_and_save(lines, pset, prefix)) == template_copy_and_save(model, pset, prefix)\
+            .netfile_text
+
+        reps = 5
+        t_old = min(timeit.repeat(lambda: regex_copy_and_save(lines, pset, prefix), number=1, repeat=reps))
+        t_new = min(timeit.repeat(lambda: template_copy_and_save(model, pset, prefix), number=1, repeat=reps))
+        t_compile = min(timeit.repeat(lambda: NetModel._compile_template(model.netfile_text), number=1, repeat=reps))
+    finally:
+        shutil.rmtree(tmp)
+
+    print('%s: %i lines, %i parameters' % (os.path.basename(netfile), len(lines), len(params)))
+    print('Regex copy + save:    %.4f s' % t_old)
+    print('Template copy + save: %.4f s' % t_new)
+    print('Speedup:              %.1fx' % (t_old / t_new))
+    print('One-time template compilation: %.4f s' % t_compile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark of proposing a new PSet from an old one by a random move in search space, comparing the per-parameter
+FreeParameter.add() path with the vectorized PSet.add_search_vector()
+
+Usage: python benchmarks/bench_pset_vector.py [number of parameters]
+"""
+
+import os
+import pickle
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.pset import PSet, FreeParameter
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    fps = []
+    for i in range(n):
+        if i % 2:
+            fps.append(FreeParameter('k%i' % i, 'loguniform_var', 1e-3, 1e3, value=1.))
+        else:
+            fps.append(FreeParameter('k%i' % i, 'uniform_var', 0., 10., value=5.))
+    pset = PSet(fps)
+    delta = np.random.normal(size=n) * 0.1
+
+    def per_parameter():
+        return PSet([fp.add(d) for fp, d in zip(pset, delta)])
+
+    def vectorized():
+        return pset.add_search_vector(delta)
+
+    assert np.allclose(per_parameter().vector, vectorized().vector)
+    number = 200
+    t_old = min(timeit.repeat(per_parameter, number=number, repeat=5)) / number
+    t_new = min(timeit.repeat(vectorized, number=number, repeat=5)) / number
+    t_hash_old = min(timeit.repeat(lambda: hash(frozenset(per_parameter().fps)), number=number, repeat=5)) / number
+    t_hash_new = min(timeit.repeat(lambda: hash(vectorized()), number=number, repeat=5)) / number
+
+    print('%i parameters' % n)
+    print('FreeParameter.add:        %.6f s per PSet' % t_old)
+    print('PSet.add_search_vector:   %.6f s per PSet' % t_new)
+    print('Speedup:                  %.1fx' % (t_old / t_new))
+    print('New PSet + hash:          %.6f s -> %.6f s' % (t_hash_old, t_hash_new))
+    print('Pickled size:             %i -> %i bytes' % (len(pickle.dumps(per_parameter().fps)),
+                                                        len(pickle.dumps(vectorized()))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark of the particle swarm update done for each Result, comparing the previous per-parameter velocity dicts with
+the (particles x parameters) arrays used by ParticleSwarm.got_result()
+
+Usage: python benchmarks/bench_pso_update.py [number of particles] [number of parameters]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import ParticleSwarm, Result
+from pybnf.pset import PSet, FreeParameter
+
+
+class BenchConfig:
+    def __init__(self):
+        self.config = {'v_stop': 1e-10}
+
+
+class BenchPSO(ParticleSwarm):
+    """Holds only the state used by got_result()"""
+
+    def __init__(self, variables, n):
+        self.config = BenchConfig()
+        self.variables = variables
+        self.num_particles = n
+        self.max_evals = 10**9
+        self.output_every = 10**9
+        self.num_evals = 0
+        self.c1 = self.c2 = 1.5
+        self.w0 = self.wf = 0.7
+        self.nv = 0
+        self.nmax = 30
+        self.n_stop = 10**9
+        self.absolute_tol = self.relative_tol = 0.
+        self.last_best = np.inf
+        psets = [PSet([v.sample_value() for v in variables]) for _ in range(n)]
+        for i, p in enumerate(psets):
+            p.name = 'iter0p%i' % i
+        self.pset_map = {p: i for i, p in enumerate(psets)}
+        self.running = list(psets)
+        self.positions = np.array([p.search_vector() for p in psets])
+        self.velocities = np.zeros(self.positions.shape)
+        self.best_positions = self.positions.copy()
+        self.speeds = np.zeros(n)
+        self.swarm = [[p, self.velocities[i]] for i, p in enumerate(psets)]
+        self.bests = [[p, np.inf] for p in psets]
+        self.global_best = [psets[0], np.inf]
+        self.global_best_position = self.positions[0].copy()
+        # Per-parameter state, as previously stored
+        self.dict_swarm = [[p, {v.name: 0. for v in variables}] for p in psets]
+
+
+def per_parameter_update(pso, p):
+    """The per-parameter velocity and position update previously done by got_result()"""
+    w = pso.w0
+    pso.dict_swarm[p][1] = \
+        {v.name:
+            w * pso.dict_swarm[p][1][v.name] +
+            pso.c1 * np.random.random() * pso.bests[p][0].get_param(v.name).diff(pso.dict_swarm[p][0].get_param(v.name)) +
+            pso.c2 * np.random.random() * pso.global_best[0].get_param(v.name).diff(pso.dict_swarm[p][0].get_param(v.name))
+         for v in pso.variables}
+    new_vars = []
+    for v in pso.dict_swarm[p][0]:
+        new_vars.append(v.add(pso.dict_swarm[p][1][v.name]))
+        if v.log_space:
+            new_val = 10.**(np.log10(v.value) + pso.dict_swarm[p][1][v.name])
+        else:
+            new_val = v.value + pso.dict_swarm[p][1][v.name]
+        if new_val < v.lower_bound or v.upper_bound < new_val:
+            pso.dict_swarm[p][1][v.name] = 0.0
+    pso.dict_swarm[p][0] = PSet(new_vars)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    d = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    variables = [FreeParameter('k%i' % i, 'loguniform_var' if i % 2 else 'uniform_var', 1e-3, 1e3, bounded=True)
+                 for i in range(d)]
+    pso = BenchPSO(variables, n)
+
+    def vectorized():
+        for p in range(n):
+            res = Result(pso.running[p], None, pso.running[p].name)
+            res.score = np.random.random()
+            pso.running[p] = pso.got_result(res)[0]
+
+    def per_parameter():
+        for p in range(n):
+            per_parameter_update(pso, p)
+
+    t_old = min(timeit.repeat(per_parameter, number=1, repeat=3)) / n
+    t_new = min(timeit.repeat(vectorized, number=1, repeat=3)) / n
+    print('%i particles, %i parameters' % (n, d))
+    print('Per-parameter dicts: %.6f s per result' % t_old)
+    print('Arrays:              %.6f s per result' % t_new)
+    print('Speedup:             %.1fx' % (t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
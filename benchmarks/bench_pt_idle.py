@@ -0,0 +1,82 @@
+"""
+Benchmark of worker utilization in parallel tempering with heterogeneous simulation times, comparing the global
+barrier at each replica exchange with async_exchange = 1.
+
+Simulations are not run. Instead, a discrete-event loop gives each job a random duration (lognormal, to mimic
+stochastic simulations) on one of a fixed number of workers, and feeds results back to
+BasicBayesMCMCAlgorithm.got_result() in order of completion.
+
+Usage: python benchmarks/bench_pt_idle.py [number of replicas] [exchange_every] [duration sigma]
+"""
+
+import heapq
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import BasicBayesMCMCAlgorithm, Result
+from pybnf.config import Configuration
+from pybnf.printing import print1
+
+DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'demo')
+
+
+def simulate(replicas, exchange_every, sigma, async_exchange, iterations=200, seed=0):
+    """
+    Runs a parallel tempering fit with one worker per replica, and returns the fraction of worker time spent idle,
+    the total time, and the exchange acceptance rate
+    """
+    np.random.seed(seed)
+    model = os.path.join(DEMO, 'parabola.xml')
+    exp = os.path.join(DEMO, 'par1.exp')
+    conf = Configuration({
+        'population_size': replicas, 'max_iterations': iterations, 'step_size': 0.2, 'output_hist_every': 10 ** 6,
+        'sample_every': 10, 'burn_in': 10 ** 6, 'exchange_every': exchange_every,
+        'beta_range': [0.1, 1.], 'output_dir': 'bench_pt_idle', 'async_exchange': async_exchange, 'verbosity': 0,
+        ('uniform_var', 'v1'): [0, 10], ('uniform_var', 'v2'): [0, 10], ('uniform_var', 'v3'): [0, 10],
+        'models': {model}, 'exp_data': {exp}, model: [exp], 'time_course': [{'time': '20', 'suffix': 'par1'}],
+        'fit_type': 'pt', 'save_samples_txt': 0})
+    alg = BasicBayesMCMCAlgorithm(conf)
+    alg.output_results = lambda name='', no_move=False: None
+
+    now = 0.
+    busy = 0.
+    running = []  # Heap of (finish time, sequence number, PSet)
+    count = 0
+
+    def submit(psets):
+        nonlocal busy, count
+        for p in psets:
+            duration = np.random.lognormal(0., sigma)
+            busy += duration
+            heapq.heappush(running, (now + duration, count, p))
+            count += 1
+
+    submit(alg.start_run())
+    while running:
+        now, _, p = heapq.heappop(running)
+        res = Result(p, None, p.name)
+        res.score = sum((p[v] - 3.) ** 2 for v in p.keys())
+        response = alg.got_result(res)
+        if response == 'STOP':
+            break
+        submit(response)
+    return 1. - busy / (replicas * now), now, alg.exchange_accepted / max(alg.exchange_attempts, 1)
+
+
+def main():
+    replicas = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    exchange_every = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sigma = float(sys.argv[3]) if len(sys.argv) > 3 else 1.
+    os.makedirs('bench_pt_idle/Results', exist_ok=True)
+    print1('%i replicas, exchange_every %i, lognormal duration sigma %s' % (replicas, exchange_every, sigma))
+    for async_exchange in (0, 1):
+        idle, total, rate = simulate(replicas, exchange_every, sigma, async_exchange)
+        print('async_exchange = %i: idle fraction %.3f, total time %.0f, exchange acceptance %.2f'
+              % (async_exchange, idle, total, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark of the histogram and credible interval update of the Bayesian algorithms, comparing re-reading samples.txt
+and sorting each column with reading the memory-mapped samples.npy and partitioning each column
+
+Usage: python benchmarks/bench_sample_histograms.py [number of samples] [number of parameters]
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.pset import PSet, FreeParameter, SampleStore
+
+
+def bounds(n, interval):
+    want = n * (interval / 100)
+    return int(np.round(n/2 - want/2)), int(np.round(n/2 + want/2 - 1))
+
+
+def text_update(samples_file, d):
+    """The update previously done by BayesianAlgorithm.update_histograms(), without writing files"""
+    dat_array = np.genfromtxt(samples_file, delimiter='\t', dtype=float, usecols=range(2, d + 2))
+    out = []
+    for i in range(d):
+        np.histogram(dat_array[:, i], bins=10)
+        sorted_data = sorted(dat_array[:, i])
+        for interval in (68., 95.):
+            lo, hi = bounds(len(sorted_data), interval)
+            out.append((sorted_data[lo], sorted_data[hi]))
+    return out
+
+
+def store_update(store, names):
+    """The update done by BayesianAlgorithm.update_histograms() with a SampleStore, without writing files"""
+    store.flush()
+    out = []
+    for name in names:
+        data = store.column(name)
+        np.histogram(data, bins=10)
+        n = len(data)
+        pairs = [bounds(n, interval) for interval in (68., 95.)]
+        partitioned = np.partition(data, sorted(set([b for pair in pairs for b in pair])))
+        out += [(partitioned[lo], partitioned[hi]) for lo, hi in pairs]
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    d = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    names = ['k%02i' % i for i in range(d)]
+    variables = [FreeParameter(name, 'uniform_var', 0., 10.) for name in names]
+    tmp = tempfile.mkdtemp()
+    samples_file = os.path.join(tmp, 'samples.txt')
+    store = SampleStore(os.path.join(tmp, 'samples.npy'), names)
+    with open(samples_file, 'w') as f:
+        f.write('# Name\tLn_probability\t%s\n' % '\t'.join(names))
+        for i in range(n):
+            pset = PSet([v.sample_value() for v in variables])
+            pset.name = 'iter%irun0' % i
+            f.write(pset.name + '\t' + str(-1.) + '\t' + pset.values_to_string() + '\n')
+            store.append(pset, -1.)
+
+    assert np.allclose(text_update(samples_file, d), store_update(store, names))
+    t_old = min(timeit.repeat(lambda: text_update(samples_file, d), number=1, repeat=3))
+    t_new = min(timeit.repeat(lambda: store_update(store, names), number=1, repeat=3))
+    print('%i samples, %i parameters' % (n, d))
+    print('samples.txt, sorted:      %.4f s per update' % t_old)
+    print('samples.npy, partitioned: %.4f s per update' % t_new)
+    print('Speedup:                  %.1fx' % (t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
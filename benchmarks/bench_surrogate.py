@@ -0,0 +1,89 @@
+"""
+Benchmark of surrogate screening in asynchronous differential evolution, comparing the best objective value found
+after a given number of simulations with surrogate = 0 and surrogate = 1, and timing a fit of the RBF model.
+
+Simulations are not run. The objective of each PSet is the Rosenbrock function of its parameter values, which is fed
+back to AsynchronousDifferentialEvolution.got_result(). The surrogate model is refitted after every
+population_size results, standing in for the background thread used during a real run.
+
+Usage: python benchmarks/bench_surrogate.py [number of simulations] [number of repeats]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.algorithms import AsynchronousDifferentialEvolution, RBFSurrogate, Result
+from pybnf.config import Configuration
+
+DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'demo')
+
+
+def rosenbrock(x):
+    return np.sum(100. * (x[1:] - x[:-1] ** 2) ** 2 + (1. - x[:-1]) ** 2)
+
+
+def run(simulations, surrogate, seed):
+    """
+    Runs one fit, and returns the best objective value found after each simulation and the number of replaced PSets
+    """
+    np.random.seed(seed)
+    model = os.path.join(DEMO, 'parabola.xml')
+    exp = os.path.join(DEMO, 'par1.exp')
+    popsize = 20
+    alg = AsynchronousDifferentialEvolution(Configuration({
+        'population_size': popsize, 'max_iterations': 10 ** 6, 'output_every': 10 ** 6, 'verbosity': 0,
+        ('uniform_var', 'v1'): [-3, 3], ('uniform_var', 'v2'): [-3, 3], ('uniform_var', 'v3'): [-3, 3],
+        'models': {model}, 'exp_data': {exp}, model: [exp], 'time_course': [{'time': '20', 'suffix': 'par1'}],
+        'fit_type': 'ade', 'stop_tolerance': 0., 'output_dir': 'bench_surrogate', 'surrogate': surrogate}))
+    if surrogate:
+        alg.surrogate = RBFSurrogate(min_points=alg.surrogate.min_points, background=False)
+
+    best = np.inf
+    history = []
+    pending = alg.start_run()
+    for i in range(simulations):
+        p = pending.pop(0)
+        res = Result(p, None, p.name)
+        res.score = rosenbrock(p.vector)
+        best = min(best, res.score)
+        history.append(best)
+        if surrogate:
+            alg.surrogate.add(p.search_vector(), res.score)
+            if i % popsize == popsize - 1:
+                alg.surrogate.fit()
+        response = alg.got_result(res)
+        if response == 'STOP':
+            break
+        pending += alg.screen_psets(response)
+    return history, alg.surrogate_replaced
+
+
+def main():
+    simulations = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    checkpoints = [simulations * k // 4 for k in (1, 2, 3, 4)]
+    print('ADE with 20 individuals on the 3-parameter Rosenbrock function, %i repeats' % repeats)
+    print('Median best objective after %s simulations' % ', '.join(str(c) for c in checkpoints))
+    for surrogate in (0, 1):
+        results = [run(simulations, surrogate, seed) for seed in range(repeats)]
+        history = np.array([r[0] for r in results])
+        print('surrogate = %i: %s (replaced %.0f PSets per run)'
+              % (surrogate, ', '.join('%.3g' % np.median(history[:, c - 1]) for c in checkpoints),
+                 np.mean([r[1] for r in results])))
+
+    model = RBFSurrogate(background=False)
+    x = np.random.uniform(-3, 3, size=(1000, 3))
+    for xi in x:
+        model.add(xi, rosenbrock(xi))
+    t_fit = min(timeit.repeat(model.fit, number=1, repeat=3))
+    t_predict = min(timeit.repeat(lambda: model.predict(x[:10]), number=1, repeat=3))
+    print('RBF model with 1000 points: fit %.3f s (in the background thread), predict 10 PSets %.5f s'
+          % (t_fit, t_predict))
+
+
+if __name__ == '__main__':
+    main()
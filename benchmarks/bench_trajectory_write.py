@@ -0,0 +1,59 @@
+"""
+Benchmark of writing sorted_params files during a fit, comparing the previous re-sort and string concatenation of the
+whole Trajectory with the incremental merge and single join of Trajectory._write()
+
+Usage: python benchmarks/bench_trajectory_write.py [num_to_output] [results between outputs] [number of parameters]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pybnf.pset import PSet, FreeParameter, Trajectory
+
+
+def full_sort_write(traj):
+    """The output previously done by Trajectory._write()"""
+    s = '#\tSimulation\tObj\t%s\n' % traj._trajectory[0][2].keys_to_string()
+    num_output = 0
+    for k in sorted(traj._trajectory, reverse=True):
+        s += '\t%s\t%s\t%s\n' % (k[1], -k[0], k[2].values_to_string())
+        num_output += 1
+        if num_output == traj.max_output:
+            break
+    return s
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    every = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    n = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    variables = [FreeParameter('k%i' % i, 'loguniform_var', 1e-3, 1e3) for i in range(n)]
+    psets = [PSet([v.sample_value() for v in variables]) for _ in range(k + 10 * every)]
+    scores = np.random.random(len(psets))
+
+    def run(write):
+        traj = Trajectory(k)
+        for i in range(k):
+            traj.add(psets[i], scores[i], 'p%i' % i)
+        assert write(traj) == full_sort_write(traj)
+        t = 0.
+        for i in range(k, len(psets), every):
+            for j in range(i, i + every):
+                traj.add(psets[j], scores[j], 'p%i' % j)
+            t += min(timeit.repeat(lambda: write(traj), number=1, repeat=1))
+        return t / 10
+
+    t_old = run(full_sort_write)
+    t_new = run(Trajectory._write)
+    print('num_to_output %i, %i results between outputs, %i parameters' % (k, every, n))
+    print('Sort and concatenate: %.5f s per output' % t_old)
+    print('Merge and join:       %.5f s per output' % t_new)
+    print('Speedup:              %.1fx' % (t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
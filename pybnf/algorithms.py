@@ -9,9 +9,12 @@ from subprocess import STDOUT
 from .data import Data
 from .pset import PSet
 from .pset import Trajectory
+from .pset import EvaluationStore
+from .pset import EvaluationCache
+from .pset import SampleStore
+from .pset import SampleWriter
 
 from .pset import NetModel, BNGLModel, SbmlModelNoTimeout
-from .pset import OutOfBoundsException
 from .pset import FailedSimulationError
 from .printing import print0, print1, print2, PybnfError
 from .objective import ObjectiveCalculator, ConstraintCounter
@@ -21,10 +24,14 @@ import numpy as np
 import os
 import re
 import shutil
+import socket
 import copy
 import sys
+import threading
+import time
 import traceback
 import pickle
+from collections import deque
 from glob import glob
 from tornado import gen
 from distributed.client import _wait
@@ -57,6 +64,9 @@ class Result(object):
         self.name = name
         self.score = None  # To be set later when the Result is scored.
         self.failed = False
+        self.wall_time = None  # Seconds spent running the simulations, if known
+        self.cached = False  # True if the score was taken from an EvaluationCache instead of simulations
+        self.outputs = None  # AlignedOutputs of simdata, if kept for an EvaluationCache
 
     def normalize(self, settings):
         """
@@ -137,12 +147,21 @@ class FailedSimulation(Result):
         return
 
 
-def run_job(j, debug=False, failed_logs_dir=''):
+def run_job(j, debug=False, failed_logs_dir='', settings=None, calculator=None):
     """
     Runs the Job j.
     This function is passed to Dask instead of j.run_simulation because if you pass j.run_simulation, Dask leaks memory
     associated with j.
+
+    :param settings: List of JobSettings scattered to the workers. If the Job was created with a settings_id, its models
+    and settings are taken from this list.
+    :param calculator: The ObjectiveCalculator scattered to the workers, passed as a task argument so that Dask resolves
+    it (a Future pickled inside the Job cannot be resolved on the worker). Used instead of j.calc_future.
     """
+    if j.settings_id is not None:
+        j.use_settings(settings[j.settings_id])
+    if calculator is not None:
+        j.calculator = calculator
     try:
         return j.run_simulation(debug, failed_logs_dir)
     except RuntimeError as e:
@@ -155,6 +174,25 @@ def run_job(j, debug=False, failed_logs_dir=''):
             raise
 
 
+def run_jobs(jobs, debug=False, failed_logs_dir='', settings=None, calculator=None):
+    """
+    Runs a batch of Jobs in a single task, and returns the list of their Results.
+    """
+    return [run_job(j, debug, failed_logs_dir, settings, calculator) for j in jobs]
+
+
+class JobSettings(object):
+    """
+    The models and data processing settings used by a group of Jobs. These are scattered to the workers once per run,
+    so that each Job only needs to carry its PSet and an index into the scattered list.
+    """
+
+    def __init__(self, models, norm_settings, postproc_settings):
+        self.models = models
+        self.norm_settings = norm_settings
+        self.postproc_settings = postproc_settings
+
+
 class Job:
     """
     Container for information necessary to perform a single evaluation in the fitting algorithm
@@ -165,7 +203,7 @@ class Job:
     jlogger = logging.getLogger('pybnf.algorithms.job')
 
     def __init__(self, models, params, job_id, output_dir, timeout, calc_future, norm_settings, postproc_settings,
-                 delete_folder=False):
+                 delete_folder=False, scratch_dir=None, settings_id=None):
         """
         Instantiates a Job
 
@@ -187,11 +225,19 @@ class Job:
         run on the result.
         :param delete_folder: If True, delete the folder and files created after the simulation runs
         :type delete_folder: bool
+        :param scratch_dir: If not None, run the simulation in a per-worker folder inside this directory (typically
+        node-local storage), and copy the files to output_dir only if the simulation fails or delete_folder is False.
+        May contain environment variables such as $TMPDIR, which are expanded on the worker.
+        :type scratch_dir: str
+        :param settings_id: If not None, models, norm_settings, and postproc_settings should be None, and are instead
+        taken from the JobSettings at this index of the list passed to run_job()
+        :type settings_id: int
         """
         self.models = models
         self.params = params
         self.job_id = job_id
         self.calc_future = calc_future
+        self.calculator = None  # The result of calc_future, if provided by run_job()
         self.norm_settings = norm_settings
         self.postproc_settings = postproc_settings
         # Whether to show warnings about missing data if the job includes an objective evaluation. Toggle this after
@@ -208,6 +254,18 @@ class Job:
         # Folder where we save the model files and outputs.
         self.folder = '%s/%s' % (self.output_dir, self.job_id)
         self.delete_folder = delete_folder
+        self.scratch_dir = scratch_dir
+        self.settings_id = settings_id
+
+    def use_settings(self, settings):
+        """
+        Takes the models and data processing settings for this Job from a JobSettings instance
+
+        :type settings: JobSettings
+        """
+        self.models = settings.models
+        self.norm_settings = settings.norm_settings
+        self.postproc_settings = settings.postproc_settings
 
     def _name_with_id(self, model):
         return '%s_%s' % (model.name, self.job_id)
@@ -230,13 +288,11 @@ class Job:
                 self.jlogger.debug('Copying log file %s' % lf)
                 shutil.copy(lf, failed_logs_dir)
 
-    def run_simulation(self, debug=False, failed_logs_dir=''):
-        """Runs the simulation and reads in the result"""
-
-        # Force absolute path for failed_logs_dir
-        if len(failed_logs_dir) > 0 and failed_logs_dir[0] != '/':
-            failed_logs_dir = self.home_dir + '/' + failed_logs_dir
-
+    def _make_shared_folder(self):
+        """
+        Create self.folder in output_dir, renaming it if it already exists
+        :return: True if successful
+        """
         # The check here is in case dask decides to run the same job twice, both of them can complete.
         made_folder = False
         failures = 0
@@ -252,7 +308,52 @@ class Job:
                 if failures > 1000:
                     self.jlogger.error('Job %s failed because it was unable to write to the Simulations folder' %
                                        self.job_id)
-                    return FailedSimulation(self.params, self.job_id, 1)
+                    return False
+        return True
+
+    def _make_scratch_folder(self):
+        """
+        Get this worker's folder inside scratch_dir, creating it if it is the first job on this worker.
+        The folder is reused by every job that runs on the same worker thread.
+        :return: Path to the folder, or None if it could not be created
+        """
+        scratch_dir = os.path.abspath(os.path.expandvars(self.scratch_dir))
+        folder = '%s/pybnf_%s_%i_%i' % (scratch_dir, socket.gethostname(), os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(folder, exist_ok=True)
+            # Leftovers from a job that was interrupted
+            self._clear_folder(folder)
+        except OSError:
+            self.jlogger.exception('Failed to create scratch folder %s. Running job %s in the Simulations folder '
+                                   'instead.' % (folder, self.job_id))
+            return None
+        return folder
+
+    def _clear_folder(self, folder):
+        """Delete the contents of folder, leaving the folder itself in place"""
+        try:
+            for entry in os.scandir(folder):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+        except OSError:
+            self.jlogger.error('Failed to clear scratch folder %s.' % folder)
+
+    def _copy_folder_contents(self, src, dest):
+        """Copy the files in folder src into the existing folder dest"""
+        try:
+            for entry in os.scandir(src):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.copytree(entry.path, '%s/%s' % (dest, entry.name))
+                else:
+                    shutil.copy(entry.path, dest)
+            self.jlogger.debug('Copied scratch folder %s to %s' % (src, dest))
+        except OSError:
+            self.jlogger.error('Failed to copy scratch folder %s to %s.' % (src, dest))
+
+    def _simulate_and_score(self, debug, failed_logs_dir):
+        """Runs the models in self.folder, and returns the Result with its score, or a FailedSimulation"""
         try:
             simdata = self._run_models()
             res = Result(self.params, simdata, self.job_id)
@@ -286,13 +387,46 @@ class Job:
                     print0('User-defined post-processing script failed')
                     res.score = np.inf
                 else:
-                    res.score = self.calc_future.result().evaluate_objective(res.simdata, show_warnings=self.show_warnings)
+                    calc = self.calculator if self.calculator is not None else self.calc_future.result()
+                    if calc.keep_outputs:
+                        res.score, res.outputs = calc.evaluate_outputs(res.simdata, show_warnings=self.show_warnings)
+                    else:
+                        res.score = calc.evaluate_objective(res.simdata, show_warnings=self.show_warnings)
                     if res.score is None:
                         res.score = np.inf
                         logger.warning('Simulation corresponding to Result %s contained NaNs or Infs' % res.name)
                         logger.warning('Discarding Result %s as having an infinite objective function value' % res.name)
                 res.simdata = None
-        if self.delete_folder:
+        return res
+
+    def run_simulation(self, debug=False, failed_logs_dir=''):
+        """Runs the simulation and reads in the result"""
+
+        start_time = time.time()
+        # Force absolute path for failed_logs_dir
+        if len(failed_logs_dir) > 0 and failed_logs_dir[0] != '/':
+            failed_logs_dir = self.home_dir + '/' + failed_logs_dir
+
+        scratch_folder = None
+        if self.scratch_dir is not None:
+            scratch_folder = self._make_scratch_folder()
+        if scratch_folder is not None:
+            shared_folder = self.folder
+            self.folder = scratch_folder
+        elif not self._make_shared_folder():
+            return FailedSimulation(self.params, self.job_id, 1)
+        res = None
+        try:
+            res = self._simulate_and_score(debug, failed_logs_dir)
+        finally:
+            if scratch_folder is not None:
+                # Ran in the scratch folder. Keep the files only if they are needed, or if scoring raised an exception.
+                self.folder = shared_folder
+                if res is None or res.failed or not self.delete_folder:
+                    if self._make_shared_folder():
+                        self._copy_folder_contents(scratch_folder, self.folder)
+                self._clear_folder(scratch_folder)
+        if scratch_folder is None and self.delete_folder:
             if os.name == 'nt':  # Windows
                 try:
                     shutil.rmtree(self.folder)
@@ -306,6 +440,7 @@ class Job:
                 except (CalledProcessError, TimeoutExpired):
                     self.jlogger.error('Failed to remove folder %s.' % self.folder)
 
+        res.wall_time = time.time() - start_time
         return res
 
 
@@ -361,7 +496,14 @@ class JobGroup:
             avedata[m] = dict()
             for suf in self.result_list[0].simdata[m]:
                 avedata[m][suf] = Data.average([r.simdata[m][suf] for r in self.result_list])
-        return Result(self.result_list[0].pset, avedata, self.job_id)
+        res = Result(self.result_list[0].pset, avedata, self.job_id)
+        res.wall_time = self.total_wall_time()
+        return res
+
+    def total_wall_time(self):
+        """Returns the total wall time of the Results in this group, or None if any is unknown"""
+        times = [r.wall_time for r in self.result_list]
+        return None if None in times else sum(times)
 
 
 class MultimodelJobGroup(JobGroup):
@@ -381,6 +523,7 @@ class MultimodelJobGroup(JobGroup):
 
         # Merge all models into a single Result object
         final_result = Result(self.result_list[0].pset, dict(), self.job_id)
+        final_result.wall_time = self.total_wall_time()
         for res in self.result_list:
             final_result.add_result(res)
         return final_result
@@ -423,12 +566,229 @@ class DaskError:
         self.traceback = tb
 
 
+class RunState(object):
+    """
+    State of the main loop of an Algorithm during a run, kept between calls to Algorithm.advance()
+    """
+
+    def __init__(self, client, pool, debug, backup_every, batch_size):
+        self.client = client
+        self.pool = pool  # custom_as_completed that new futures are added to, possibly shared with other Algorithms
+        self.debug = debug
+        self.backup_every = backup_every
+        self.batch_size = batch_size
+        self.pending = dict()  # Maps pending futures to list of tuples (PSet, job_id), one per Job in the batch.
+        self.ready = deque()  # Results of completed batches that have not been handled yet
+        self.unsubmitted = []  # New Jobs waiting to fill a batch
+        self.sim_count = 0
+        self.backed_up = True
+
+
+def run_concurrently(client, runs, next_run, debug=False):
+    """
+    Runs several Algorithms at the same time on one client. Their futures are multiplexed through a single completion
+    loop, so the workers stay busy as long as any of the Algorithms has Jobs to run, including while another one is
+    waiting for the last Jobs of its run.
+
+    :param client: The dask Client
+    :param runs: Tuples (Algorithm, PSets to resume or None) to start
+    :type runs: list
+    :param next_run: Function called with each Algorithm after its run finishes, which returns a tuple (Algorithm,
+    PSets to resume or None) to start in its place, or None
+    :type next_run: callable
+    :param debug: Whether to save logs of all failed simulations
+    """
+    pool = custom_as_completed([], with_results=True, raise_errors=False)
+    active = []
+    to_advance = deque()
+
+    def start(alg, resume):
+        alg.begin_run(client, pool, resume, debug)
+        active.append(alg)
+        to_advance.append(alg)
+
+    for alg, resume in runs:
+        start(alg, resume)
+    while active:
+        while to_advance:
+            alg = to_advance.popleft()
+            if alg.advance():
+                alg.finish_run()
+                active.remove(alg)
+                following = next_run(alg)
+                if following is not None:
+                    start(*following)
+        if not active:
+            break
+        future, res = next(pool)
+        for alg in active:
+            if future in alg.run_state.pending:
+                alg.receive(future, res)
+                to_advance.append(alg)
+                break
+        else:
+            logger.debug('Ignoring a future from a finished run')
+
+
+class RBFSurrogate(object):
+    """
+    Cheap regression model of the objective function, used to screen candidate parameter sets before simulating them.
+
+    Interpolates the archive of (search space vector, score) pairs with cubic radial basis functions plus a linear
+    term. Scores are fitted as log(1 + score - min score), so the model is not dominated by a few very bad results.
+    Failed simulations (infinite scores) are left out.
+
+    With background=True, the model is refitted in a separate thread whenever new points have been added, and
+    predict() uses the most recent fit, so adding points and predicting never wait for a fit. Which fit is used then
+    depends on thread timing, so with background=False and refit_every, the model is instead refitted by add() after
+    fixed numbers of points, and the predictions do not depend on timing.
+    """
+
+    def __init__(self, max_points=1000, min_points=10, background=True, refit_every=0):
+        """
+        :param max_points: Maximum number of points to fit. If the archive is larger, the best points are used.
+        :param min_points: Number of points needed before the first fit
+        :param background: Whether to fit in a background thread. If False, fit() must be called, unless refit_every
+        is set.
+        :param refit_every: If background is False and this is positive, add() refits the model when min_points points
+        are reached, and then each time this many more points have been added.
+        """
+        self.max_points = max_points
+        self.min_points = min_points
+        self.background = background
+        self.refit_every = refit_every
+        self.points = []
+        self.scores = []
+        self.model = None  # Tuple (centers, rbf weights, linear coefficients, scaling offset, scaling width)
+        self.fit_size = 0  # Number of points in the archive at the last fit
+        self._init_thread_state()
+
+    def _init_thread_state(self):
+        self._lock = threading.Lock()
+        self._new_points = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ('_lock', '_new_points', '_thread', '_closed'):
+            del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_thread_state()
+
+    def add(self, x, score):
+        """
+        Adds a point to the archive
+
+        :param x: Parameter vector in search space
+        :param score: Objective value
+        """
+        if not np.isfinite(score):
+            return
+        with self._lock:
+            self.points.append(np.array(x, dtype=float))
+            self.scores.append(float(score))
+        if self.background and len(self.scores) >= self.min_points:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._fit_loop, name='surrogate', daemon=True)
+                self._thread.start()
+            self._new_points.set()
+        elif self.refit_every > 0 and len(self.scores) >= self.min_points and \
+                (self.model is None or len(self.scores) - self.fit_size >= self.refit_every):
+            self.fit()
+
+    def _fit_loop(self):
+        while True:
+            self._new_points.wait()
+            if self._closed:
+                return
+            self._new_points.clear()
+            try:
+                self.fit()
+            except Exception:
+                logger.exception('Failed to fit surrogate model')
+
+    def close(self):
+        """Stops the background thread. It is restarted by the next call to add()."""
+        if self._thread is None:
+            return
+        self._closed = True
+        self._new_points.set()
+        self._thread.join()
+        self._thread = None
+        self._closed = False
+        self._new_points.clear()
+
+    def fit(self):
+        """Fits the model to the current archive"""
+        with self._lock:
+            x = np.array(self.points)
+            y = np.array(self.scores)
+        if len(y) < self.min_points:
+            return
+        fit_size = len(y)
+        if len(y) > self.max_points:
+            keep = np.argpartition(y, self.max_points - 1)[:self.max_points]
+            x, y = x[keep], y[keep]
+        y = np.log1p(y - np.min(y))
+        offset = np.min(x, axis=0)
+        width = np.max(x, axis=0) - offset
+        width[width == 0.] = 1.
+        x = (x - offset) / width
+
+        # Solve for the RBF weights w and linear coefficients c: [[Phi, P], [P^T, 0]] [w, c] = [y, 0]
+        n, d = x.shape
+        phi = np.sqrt(np.sum((x[:, np.newaxis, :] - x[np.newaxis, :, :]) ** 2, axis=2)) ** 3
+        poly = np.hstack((np.ones((n, 1)), x))
+        a = np.zeros((n + d + 1, n + d + 1))
+        a[:n, :n] = phi + 1e-8 * np.eye(n)
+        a[:n, n:] = poly
+        a[n:, :n] = poly.T
+        b = np.concatenate((y, np.zeros(d + 1)))
+        try:
+            coef = np.linalg.solve(a, b)
+        except np.linalg.LinAlgError:
+            coef = np.linalg.lstsq(a, b, rcond=None)[0]
+        self.model = (x, coef[:n], coef[n:], offset, width)
+        self.fit_size = fit_size
+
+    def predict(self, x):
+        """
+        Predicts the fitted value for each row of x
+
+        :param x: Matrix of parameter vectors in search space, one per row
+        :return: Array of predicted values (on the fitted log scale, which preserves the order of scores), or None if
+        there is no fit yet
+        """
+        model = self.model
+        if model is None:
+            return None
+        centers, weights, linear, offset, width = model
+        x = (np.array(x, dtype=float) - offset) / width
+        r = np.sqrt(np.sum((x[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2, axis=2))
+        return (r ** 3).dot(weights) + linear[0] + x.dot(linear[1:])
+
+    def threshold(self, n):
+        """The median of the fitted values of the last n points, or None if there is no fit yet"""
+        if self.model is None:
+            return None
+        with self._lock:
+            recent = np.array(self.points[-n:])
+        return np.median(self.predict(recent))
+
+
 class Algorithm(object):
     """
     A superclass containing the structures common to all metaheuristic and MCMC-based algorithms
     defined in this software suite
     """
 
+    supports_surrogate = False  # Whether the subclass implements alternative_psets() and replace_pset()
+    backup_name = 'alg_backup'  # Name of the backup file in the output directory, without the .bp extension
+
     def __init__(self, config):
         """
         Instantiates an Algorithm with a Configuration object.  Also initializes a
@@ -441,8 +801,6 @@ class Algorithm(object):
         self.config = config
         self.exp_data = self.config.exp_data
         self.objective = self.config.obj
-        logger.debug('Instantiating Trajectory object')
-        self.trajectory = Trajectory(self.config.config['num_to_output'])
         self.job_id_counter = 0
         self.output_counter = 0
         self.job_group_dir = dict()
@@ -461,6 +819,11 @@ class Algorithm(object):
         self.res_dir = self.config.config['output_dir'] + '/Results'
         self.failed_logs_dir = self.config.config['output_dir'] + '/FailedSimLogs'
 
+        logger.debug('Instantiating Trajectory object')
+        self.trajectory = self._new_trajectory()
+        self.eval_store = self._new_eval_store()
+        self.eval_cache = self._new_eval_cache()
+
         # Generate a list of variable names
         self.variables = self.config.variables
 
@@ -468,9 +831,15 @@ class Algorithm(object):
         logger.debug('Initializing models')
         self.model_list = self._initialize_models()
 
+        self.surrogate = self._new_surrogate()
+        self.surrogate_screened = 0
+        self.surrogate_replaced = 0
+
         self.bootstrap_number = None
         self.best_fit_obj = None
         self.calc_future = None  # Created during Algorithm.run()
+        self.settings_futures = None  # Created during Algorithm.run()
+        self.run_state = None  # RunState of the run in progress
         self.refine = False
 
     def reset(self, bootstrap):
@@ -482,7 +851,7 @@ class Algorithm(object):
         :return:
         """
         logger.info('Resetting Algorithm for another run')
-        self.trajectory = Trajectory(self.config.config['num_to_output'])
+        self.trajectory.close()
         self.job_id_counter = 0
         self.output_counter = 0
         self.job_group_dir = dict()
@@ -503,7 +872,118 @@ class Algorithm(object):
                         logger.error('Failed to remove bootstrap directory '+boot_dir)
                 os.mkdir(boot_dir)
 
+        self.trajectory = self._new_trajectory()
+        self.eval_store = self._new_eval_store()
         self.best_fit_obj = None
+        if bootstrap is not None and self.eval_cache is not None:
+            # The objective changes with the bootstrap weights
+            self.eval_cache.invalidate()
+        if self.surrogate is not None:
+            self.surrogate.close()
+        self.surrogate = self._new_surrogate()
+        self.surrogate_screened = 0
+        self.surrogate_replaced = 0
+
+    def bootstrap_replicate(self, bootstrap):
+        """
+        Creates an independent copy of this Algorithm, reset for bootstrap replicate number bootstrap, so that several
+        replicates can run at the same time. The copy has its own output directories, backup file, and experimental
+        data with newly sampled bootstrap weights. The configuration, objective function and models are shared.
+
+        :param bootstrap: The bootstrap number
+        :type bootstrap: int
+        :return: Algorithm
+        """
+        shared = ('config', 'objective', 'model_list', 'variables', 'trajectory', 'eval_store', 'surrogate',
+                  'calc_future', 'settings_futures', 'run_state')
+        memo = {id(self.__dict__[k]): self.__dict__[k] for k in shared if k in self.__dict__}
+        replicate = self.__class__.__new__(self.__class__)
+        replicate.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        replicate.reset(bootstrap=bootstrap)
+        replicate.backup_name = 'alg_backup_boot%i' % bootstrap
+        for model in replicate.exp_data:
+            for name, data in replicate.exp_data[model].items():
+                data.gen_bootstrap_weights()
+                data.weights_to_file('%s/%s_weights_%s.txt' % (replicate.res_dir, name, bootstrap))
+        return replicate
+
+    def refinement(self):
+        """
+        Creates the SimplexAlgorithm that refines the best fit of this Algorithm. It continues the Trajectory, and uses
+        the same experimental data, output directories and backup file.
+
+        :return: SimplexAlgorithm
+        """
+        self.config.config['simplex_start_point'] = self.trajectory.best_fit()
+        simplex = SimplexAlgorithm(self.config, refine=True)
+        simplex.trajectory = self.trajectory  # Reuse existing trajectory; don't start a new one.
+        simplex.eval_store = self.eval_store
+        simplex.eval_cache = self.eval_cache
+        simplex.exp_data = self.exp_data
+        simplex.bootstrap_number = self.bootstrap_number
+        simplex.sim_dir = self.sim_dir
+        simplex.res_dir = self.res_dir
+        simplex.failed_logs_dir = self.failed_logs_dir
+        simplex.backup_name = self.backup_name
+        return simplex
+
+    def _new_trajectory(self):
+        """
+        Creates an empty Trajectory. If trajectory_log is set, the Trajectory also logs every result to
+        trajectory.bin in the results directory.
+
+        :return: Trajectory
+        """
+        log_file = '%s/trajectory.bin' % self.res_dir if self.config.config['trajectory_log'] else None
+        return Trajectory(self.config.config['num_to_output'], log_file)
+
+    def _new_eval_store(self):
+        """
+        Creates the EvaluationStore recording every result in the evaluations directory of the results directory,
+        or returns None if save_evaluations is off.
+
+        :return: EvaluationStore or None
+        """
+        if not self.config.config['save_evaluations']:
+            return None
+        return EvaluationStore('%s/evaluations' % self.res_dir, [v.name for v in self.config.variables])
+
+    def _new_eval_cache(self):
+        """
+        Creates the EvaluationCache used to skip simulations of PSets that were already evaluated, or returns None if
+        eval_cache is off.
+
+        :return: EvaluationCache or None
+        """
+        if not self.config.config['eval_cache']:
+            return None
+        if self.config.config['smoothing'] > 1:
+            logger.warning('Not using eval_cache because smoothing is enabled')
+            print1('Warning: eval_cache is not used with smoothing > 1, so I am ignoring it')
+            return None
+        if any(m.stochastic for m in self.config.models.values()):
+            # A repeated PSet should get a new sample of the stochastic simulation, not the score of an earlier one
+            logger.warning('Not using eval_cache because a model uses a stochastic simulation method')
+            print1('Warning: eval_cache is not used with stochastic simulation methods, so I am ignoring it')
+            return None
+        return EvaluationCache(self.config.config['eval_cache'], self.config.config['eval_cache_tolerance'],
+                               int(self.config.config['eval_cache_data'] * 1e6))
+
+    def _new_surrogate(self):
+        """
+        Creates the RBFSurrogate used to screen proposed PSets, or returns None if surrogate is off or the algorithm
+        does not support screening.
+
+        :return: RBFSurrogate or None
+        """
+        if not self.config.config['surrogate'] or not self.supports_surrogate:
+            return None
+        min_points = max(2 * len(self.variables) + 1, 10)
+        if self.config.config['random_seed'] is not None:
+            # Refit in step with the results rather than in the background, so that seeded runs are reproducible
+            return RBFSurrogate(min_points=min_points, background=False,
+                                refit_every=self.config.config['population_size'])
+        return RBFSurrogate(min_points=min_points)
 
     @staticmethod
     def should_pickle(k):
@@ -514,7 +994,7 @@ class Algorithm(object):
         :param k:
         :return:
         """
-        return k not in set(['trajectory', 'calc_future'])
+        return k not in set(['trajectory', 'calc_future', 'settings_futures', 'run_state'])
 
     def __getstate__(self):
         return {k: v for k, v in self.__dict__.items() if self.should_pickle(k)}
@@ -525,11 +1005,12 @@ class Algorithm(object):
             backup_params = 'sorted_params_backup.txt' if not self.refine else 'sorted_params_refine_backup.txt'
             self.trajectory = Trajectory.load_trajectory('%s/%s' % (self.res_dir, backup_params),
                                                          self.config.variables, self.config.config['num_to_output'])
+            self.trajectory.log_file = self._new_trajectory().log_file
         except IOError:
             logger.exception('Failed to load trajectory from file')
             print1('Failed to load Results/sorted_params_backup.txt . Still resuming your run, but when I save the '
                    'best fits, it will only be the ones I\'ve seen since resuming.')
-            self.trajectory = Trajectory(self.config.config['num_to_output'])
+            self.trajectory = self._new_trajectory()
 
     def _initialize_models(self):
         """
@@ -589,6 +1070,7 @@ class Algorithm(object):
                              (m.name, init_dir, gnm_name))
                 final_model_list.append(NetModel(m.name, m.actions, m.suffixes, m.mutants, nf=init_dir + '/' + gnm_name + '.net'))
                 final_model_list[-1].bng_command = m.bng_command
+                final_model_list[-1].set_direct(bool(self.config.config['direct_run_network']))
             else:
                 logger.info('Model %s does not require network generation' % m.name)
                 final_model_list.append(m)
@@ -635,7 +1117,11 @@ class Algorithm(object):
                 print0('User-defined post-processing script failed')
                 res.score = np.inf
             else:
-                res.score = self.objective.evaluate_multiple(res.simdata, self.exp_data, self.config.constraints)
+                if self.eval_cache is not None and self.eval_cache.keep_data:
+                    res.outputs = self.objective.aligned_outputs(res.simdata, self.exp_data, self.config.constraints)
+                    res.score = self.objective.evaluate_outputs(res.outputs, self.exp_data)
+                else:
+                    res.score = self.objective.evaluate_multiple(res.simdata, self.exp_data, self.config.constraints)
             if res.score is None:  # Check if the above evaluation failed
                 res.score = np.inf
                 logger.warning('Simulation corresponding to Result %s contained NaNs or Infs' % res.name)
@@ -694,6 +1180,93 @@ class Algorithm(object):
             psets.append(PSet(pset_vars))
         return psets
 
+    def alternative_psets(self, pset, n):
+        """
+        Draws n alternatives to a proposed PSet from the same proposal distribution, for surrogate screening.
+        Subclasses with supports_surrogate = True must implement this.
+
+        :param pset: The proposed PSet
+        :param n: Number of alternatives
+        :return: list of PSets
+        """
+        raise NotImplementedError("Subclasses with supports_surrogate must implement alternative_psets()")
+
+    def replace_pset(self, old, new):
+        """
+        Replaces a proposed PSet that has not been submitted yet with one of its alternatives, updating the
+        algorithm's bookkeeping. Subclasses with supports_surrogate = True must implement this.
+
+        :param old: The proposed PSet
+        :param new: The alternative, from alternative_psets()
+        :return: The PSet to submit in place of old
+        """
+        raise NotImplementedError("Subclasses with supports_surrogate must implement replace_pset()")
+
+    def screen_psets(self, psets):
+        """
+        Screens proposed PSets with the surrogate model. A PSet predicted to be worse than the median of the recent
+        results is replaced with the best of surrogate_candidates alternatives, if one is predicted to be better. At
+        most a fraction surrogate_budget of the proposed PSets are replaced, so the model's errors cannot take over
+        the search.
+
+        :param psets: list of proposed PSets
+        :return: list of PSets to submit
+        """
+        if self.surrogate is None:
+            return psets
+        threshold = self.surrogate.threshold(self.config.config['population_size'])
+        if threshold is None:
+            return psets
+        screened = []
+        for ps in psets:
+            self.surrogate_screened += 1
+            if self.surrogate_replaced + 1 > self.config.config['surrogate_budget'] * self.surrogate_screened:
+                screened.append(ps)
+                continue
+            predicted = self.surrogate.predict(ps.search_vector()[np.newaxis, :])[0]
+            if predicted <= threshold:
+                screened.append(ps)
+                continue
+            alternatives = self.alternative_psets(ps, self.config.config['surrogate_candidates'])
+            if len(alternatives) == 0:
+                screened.append(ps)
+                continue
+            alt_predicted = self.surrogate.predict(np.array([a.search_vector() for a in alternatives]))
+            best = np.argmin(alt_predicted)
+            if alt_predicted[best] < predicted:
+                logger.debug('Surrogate model replaced proposed PSet %s' % ps.name)
+                screened.append(self.replace_pset(ps, alternatives[best]))
+                self.surrogate_replaced += 1
+            else:
+                screened.append(ps)
+        return screened
+
+    def cached_result(self, pset):
+        """
+        Looks up pset in the evaluation cache. An entry whose score is out of date is scored again from its simulation
+        outputs.
+
+        :param pset: The proposed PSet
+        :type pset: PSet
+        :return: A Result with the cached score, or None if pset needs to be simulated
+        """
+        if self.eval_cache is None:
+            return None
+        entry = self.eval_cache.get(pset)
+        if entry is None:
+            return None
+        name, score, outputs = entry
+        if score is None:
+            score = self.objective.evaluate_outputs(outputs, self.exp_data)
+            if score is None:
+                score = np.inf
+            self.eval_cache.update(pset, score)
+        logger.debug('Scored PSet %s with the evaluation cache entry from Job %s' % (pset.name, name))
+        res = Result(pset, None, name)
+        res.score = score
+        res.cached = True
+        return res
+
     def make_job(self, params):
         """
         Creates a new Job using the specified params, and additional specifications that are already saved in the
@@ -719,10 +1292,7 @@ class Algorithm(object):
                 newnames.append(thisname)
                 # calc_future is supposed to be None here - the workers don't have enough info to calculate the
                 # objective on their own
-                newjobs.append(Job(self.model_list, params, thisname,
-                                   self.sim_dir, self.config.config['wall_time_sim'], self.calc_future,
-                                   self.config.config['normalization'], dict(),
-                                   bool(self.config.config['delete_old_files'])))
+                newjobs.append(self._new_job(params, thisname, 0))
             new_group = JobGroup(job_id, newnames)
             for n in newnames:
                 self.job_group_dir[n] = new_group
@@ -731,28 +1301,51 @@ class Algorithm(object):
             # Partition our model list into n different jobs
             newjobs = []
             newnames = []
-            model_count = len(self.model_list)
             rep_count = self.config.config['parallelize_models']
             for i in range(rep_count):
                 thisname = '%s_part%i' % (job_id, i)
                 newnames.append(thisname)
                 # calc_future is supposed to be None here - the workers don't have enough info to calculate the
                 # objective on their own
-                newjobs.append(Job(self.model_list[model_count*i//rep_count:model_count*(i+1)//rep_count],
-                                   params, thisname, self.sim_dir, self.config.config['wall_time_sim'],
-                                   self.calc_future, self.config.config['normalization'], dict(),
-                                   bool(self.config.config['delete_old_files'])))
+                newjobs.append(self._new_job(params, thisname, i))
             new_group = MultimodelJobGroup(job_id, newnames)
             for n in newnames:
                 self.job_group_dir[n] = new_group
             return newjobs
         else:
             # Create a single job
-            return [Job(self.model_list, params, job_id,
-                    self.sim_dir, self.config.config['wall_time_sim'], self.calc_future,
-                    self.config.config['normalization'], self.config.postprocessing,
-                    bool(self.config.config['delete_old_files']))]
+            return [self._new_job(params, job_id, 0)]
 
+    def _job_settings(self):
+        """
+        Returns the list of JobSettings used by make_job(): one containing all models, or if parallelize_models > 1,
+        one for each partition of the model list.
+        """
+        norm = self.config.config['normalization']
+        if self.config.config['smoothing'] > 1:
+            return [JobSettings(self.model_list, norm, dict())]
+        elif self.config.config['parallelize_models'] > 1:
+            model_count = len(self.model_list)
+            rep_count = self.config.config['parallelize_models']
+            return [JobSettings(self.model_list[model_count*i//rep_count:model_count*(i+1)//rep_count], norm, dict())
+                    for i in range(rep_count)]
+        else:
+            return [JobSettings(self.model_list, norm, self.config.postprocessing)]
+
+    def _new_job(self, params, job_id, settings_id):
+        """
+        Creates a Job using the JobSettings at index settings_id of _job_settings(). During run(), the Job only refers
+        to the copy of the JobSettings scattered to the workers; otherwise it contains the models and settings.
+        """
+        if self.settings_futures is not None:
+            models, norm, postproc = None, None, None
+        else:
+            settings = self._job_settings()[settings_id]
+            models, norm, postproc = settings.models, settings.norm_settings, settings.postproc_settings
+            settings_id = None
+        return Job(models, params, job_id, self.sim_dir, self.config.config['wall_time_sim'], self.calc_future,
+                   norm, postproc, bool(self.config.config['delete_old_files']), self.config.config['scratch_dir'],
+                   settings_id)
 
     def output_results(self, name='', no_move=False):
         """
@@ -775,6 +1368,8 @@ class Algorithm(object):
         filepath = '%s/sorted_params_%s.txt' % (self.res_dir, name)
         logger.info('Outputting results to file %s' % filepath)
         self.trajectory.write_to_file(filepath)
+        if self.eval_store is not None:
+            self.eval_store.flush()
 
         # If the user has asked for fewer output files, each time we're here, move the new file to
         # Results/sorted_params.txt, overwriting the previous one.
@@ -800,8 +1395,8 @@ class Algorithm(object):
 
         # Pickle the algorithm
         # Save to a temporary file first, so we can't get interrupted and left with no backup.
-        picklepath = '%s/alg_backup.bp' % self.config.config['output_dir']
-        temppicklepath = '%s/alg_backup_temp.bp' % self.config.config['output_dir']
+        picklepath = '%s/%s.bp' % (self.config.config['output_dir'], self.backup_name)
+        temppicklepath = '%s/%s_temp.bp' % (self.config.config['output_dir'], self.backup_name)
         try:
             f = open(temppicklepath, 'wb')
             pickle.dump((self, pending_psets), f)
@@ -829,15 +1424,55 @@ class Algorithm(object):
         """
         self.max_iterations += n
 
+    def _submit_jobs(self, client, jobs, batch_size, debug, pending):
+        """
+        Submits Jobs to the client, batch_size Jobs per task
+
+        :param jobs: List of Jobs to submit
+        :param batch_size: Number of Jobs to run in each task
+        :param debug: Whether to save logs of failed simulations
+        :param pending: Dict mapping pending futures to lists of (PSet, job_id), which is updated with the new futures
+        :return: List of the new futures
+        """
+        futures = []
+        for i in range(0, len(jobs), batch_size):
+            batch = jobs[i:i+batch_size]
+            # pure=False: an identical Job from an earlier run (e.g. refinement or a bootstrap replicate starting from
+            # the same points) would otherwise get the key of that run's future, which may have been cancelled.
+            if batch_size == 1:
+                f = client.submit(run_job, batch[0], debug, self.failed_logs_dir, self.settings_futures,
+                                  self.calc_future, pure=False)
+            else:
+                f = client.submit(run_jobs, batch, debug, self.failed_logs_dir, self.settings_futures,
+                                  self.calc_future, pure=False)
+            pending[f] = [(j.params, j.job_id) for j in batch]
+            futures.append(f)
+        return futures
+
     def run(self, client, resume=None, debug=False):
         """Main loop for executing the algorithm"""
+        pool = custom_as_completed([], with_results=True, raise_errors=False)
+        self.begin_run(client, pool, resume, debug)
+        while not self.advance():
+            self.receive(*next(pool))
+        self.finish_run()
+
+    def begin_run(self, client, pool, resume=None, debug=False):
+        """
+        Sets up a run of the algorithm and submits its initial Jobs. The run then proceeds by passing each completed
+        future of the Algorithm to receive(), and calling advance() until it returns True, and ends with finish_run().
+        run() does this for a single Algorithm, and run_concurrently() for several Algorithms sharing one client.
+
+        :param client: The dask Client
+        :param pool: The custom_as_completed that the futures of the Algorithm are added to
+        :param resume: PSets to submit instead of calling start_run(), when resuming from a backup
+        :type resume: list of PSet or None
+        :param debug: Whether to save logs of all failed simulations
+        """
 
         if self.refine:
             logger.debug('Setting up Simplex refinement of previous algorithm')
 
-        backup_every = self.get_backup_every()
-        sim_count = 0
-
         logger.debug('Generating initial parameter sets')
         if resume:
             psets = resume
@@ -850,45 +1485,78 @@ class Algorithm(object):
 
         if self.config.config['local_objective_eval'] == 0 and self.config.config['smoothing'] == 1 and \
                 self.config.config['parallelize_models'] == 1:
-            calculator = ObjectiveCalculator(self.objective, self.exp_data, self.config.constraints)
-            [self.calc_future] = client.scatter([calculator], broadcast=True)
+            calculator = ObjectiveCalculator(self.objective, self.exp_data, self.config.constraints,
+                                             keep_outputs=self.eval_cache is not None and self.eval_cache.keep_data)
+            [self.calc_future] = client.scatter([calculator], broadcast=True, hash=False)
         else:
             self.calc_future = None
+        # Send the models and settings to the workers once, instead of with every Job
+        self.settings_futures = client.scatter(self._job_settings(), broadcast=True, hash=False)
 
+        state = RunState(client, pool, debug, self.get_backup_every(), max(1, self.config.config['job_batch_size']))
+        self.run_state = state
         jobs = []
-        pending = dict()  # Maps pending futures to tuple (PSet, job_id).
         for p in psets:
-            jobs += self.make_job(p)
-        jobs[0].show_warnings = True  # For only the first job submitted, show warnings if exp data is unused.
+            cached = self.cached_result(p)
+            if cached is None:
+                jobs += self.make_job(p)
+            else:
+                state.ready.append(cached)
+        if jobs:
+            jobs[0].show_warnings = True  # For only the first job submitted, show warnings if exp data is unused.
         logger.info('Submitting initial set of %d Jobs' % len(jobs))
-        futures = []
-        for job in jobs:
-            f = client.submit(run_job, job, True, self.failed_logs_dir)
-            futures.append(f)
-            pending[f] = (job.params, job.job_id)
-        pool = custom_as_completed(futures, with_results=True, raise_errors=False)
-        backed_up = True
+        pool.update(self._submit_jobs(client, jobs, state.batch_size, True, state.pending))
+
+    def receive(self, future, res):
+        """
+        Takes the result of a completed future that this Algorithm submitted. The Results are handled in the next call
+        to advance().
+
+        :param future: The completed future
+        :param res: Result or list of Results returned by the future, or DaskError if it raised an exception
+        """
+        batch = self.run_state.pending.pop(future)
+        if isinstance(res, DaskError):
+            if isinstance(res.error, PybnfError):
+                raise res.error  # User-targeted error should be raised instead of skipped
+            logger.error('Job failed with an exception')
+            logger.error(res.traceback)
+            res = [FailedSimulation(ps, job_id, 3) for ps, job_id in batch]
+        elif not isinstance(res, list):
+            res = [res]
+        self.run_state.ready.extend(res)
+
+    def advance(self):
+        """
+        Handles the Results received so far, and submits the Jobs they lead to
+
+        :return: True if the run is finished, or False if it needs more Results
+        """
+        state = self.run_state
         while True:
-            if sim_count % backup_every == 0 and not backed_up:
-                self.backup(set([pending[fut][0] for fut in pending]))
-                backed_up = True
-            f, res = next(pool)
-            if isinstance(res, DaskError):
-                if isinstance(res.error, PybnfError):
-                    raise res.error  # User-targeted error should be raised instead of skipped
-                logger.error('Job failed with an exception')
-                logger.error(res.traceback)
-                res = FailedSimulation(pending[f][0], pending[f][1], 3)
+            if state.sim_count % state.backup_every == 0 and not state.backed_up:
+                self.backup(set([ps for fut in state.pending for ps, _ in state.pending[fut]] +
+                                [r.pset for r in state.ready] + [j.params for j in state.unsubmitted]))
+                state.backed_up = True
+            if not state.ready:
+                if state.unsubmitted:
+                    # About to wait for results, so submit the partially filled batch
+                    logger.debug('Submitting %d new Jobs' % len(state.unsubmitted))
+                    state.pool.update(self._submit_jobs(state.client, state.unsubmitted, state.batch_size,
+                                                        (state.debug or self.fail_count < 10), state.pending))
+                    state.unsubmitted = []
+                return False
+            res = state.ready.popleft()
             # Handle if this result is one of multiple instances for smoothing
-            del pending[f]
-            if self.config.config['smoothing'] > 1 or self.config.config['parallelize_models'] > 1:
+            if not res.cached and (self.config.config['smoothing'] > 1 or
+                                   self.config.config['parallelize_models'] > 1):
                 group = self.job_group_dir.pop(res.name)
                 done = group.job_finished(res)
                 if not done:
                     continue
                 res = group.average_results()
-            sim_count += 1
-            backed_up = False
+            state.sim_count += 1
+            state.backed_up = False
             if isinstance(res, FailedSimulation):
                 if res.fail_type >= 1:
                     self.fail_count += 1
@@ -909,30 +1577,60 @@ class Algorithm(object):
                 logger.debug('Job %s complete' % res.name)
 
             self.add_to_trajectory(res)
+            if self.eval_store is not None:
+                self.eval_store.append(res)
+            if self.surrogate is not None:
+                self.surrogate.add(res.pset.search_vector(), res.score)
+            if self.eval_cache is not None and not res.failed and not res.cached:
+                self.eval_cache.put(res)
             if res.score < self.config.config['min_objective']:
+                self.best_fit_obj = self.trajectory.best_score()
                 logger.info('Minimum objective value achieved')
                 print1('Minimum objective value achieved')
-                break
+                return True
             response = self.got_result(res)
             if response == 'STOP':
                 self.best_fit_obj = self.trajectory.best_score()
                 logger.info("Stop criterion satisfied with objective function value of %s" % self.best_fit_obj)
                 print1("Stop criterion satisfied with objective function value of %s" % self.best_fit_obj)
-                break
+                return True
             else:
-                new_futures = []
-                for ps in response:
-                    new_js = self.make_job(ps)
-                    for new_j in new_js:
-                        new_f = client.submit(run_job, new_j, (debug or self.fail_count < 10), self.failed_logs_dir)
-                        pending[new_f] = (ps, new_j.job_id)
-                        new_futures.append(new_f)
-                logger.debug('Submitting %d new Jobs' % len(new_futures))
-                pool.update(new_futures)
-
-        logger.info("Cancelling %d pending jobs" % len(pending))
-        client.cancel(list(pending.keys()))
+                for ps in self.screen_psets(response):
+                    cached = self.cached_result(ps)
+                    if cached is None:
+                        state.unsubmitted += self.make_job(ps)
+                    else:
+                        state.ready.append(cached)
+                if len(state.unsubmitted) >= state.batch_size:
+                    # Submit all full batches now; any remainder waits for more Jobs or until we need to wait
+                    n_full = len(state.unsubmitted) - len(state.unsubmitted) % state.batch_size
+                    logger.debug('Submitting %d new Jobs' % n_full)
+                    state.pool.update(self._submit_jobs(state.client, state.unsubmitted[:n_full], state.batch_size,
+                                                        (state.debug or self.fail_count < 10), state.pending))
+                    state.unsubmitted = state.unsubmitted[n_full:]
+
+    def finish_run(self):
+        """
+        Ends the run: cancels the remaining Jobs, and saves the results
+        """
+        state = self.run_state
+        self.run_state = None
+        logger.info("Cancelling %d pending jobs" % len(state.pending))
+        state.client.cancel(list(state.pending.keys()))
+        self.settings_futures = None
         self.output_results('final')
+        self.trajectory.close()
+        if self.eval_store is not None:
+            self.eval_store.flush()
+        if self.surrogate is not None:
+            self.surrogate.close()
+            logger.info('Surrogate model replaced %i of %i proposed parameter sets' %
+                        (self.surrogate_replaced, self.surrogate_screened))
+            print2('Surrogate model replaced %i of %i proposed parameter sets' %
+                   (self.surrogate_replaced, self.surrogate_screened))
+        if self.eval_cache is not None:
+            logger.info(self.eval_cache.stats())
+            print2(self.eval_cache.stats())
 
         # Copy the best simulations into the results folder
         best_name = self.trajectory.best_fit_name()
@@ -982,7 +1680,8 @@ class Algorithm(object):
                 if isinstance(m, SbmlModelNoTimeout):
                     m.save_files = False
 
-        if self.bootstrap_number is None or self.bootstrap_number == self.config.config['bootstrap']:
+        if self.backup_name == 'alg_backup' and (self.bootstrap_number is None or
+                                                 self.bootstrap_number == self.config.config['bootstrap']):
             try:
                 os.replace('%s/alg_backup.bp' % self.config.config['output_dir'],
                           '%s/alg_%s.bp' % (self.config.config['output_dir'],
@@ -1023,6 +1722,8 @@ class ParticleSwarm(Algorithm):
 
     """
 
+    supports_surrogate = True
+
     def __init__(self, config):
 
         # Former params that are now part of the config
@@ -1086,14 +1787,23 @@ class ParticleSwarm(Algorithm):
         self.num_evals = 0  # Counter for the total number of results received
 
         # Initialize storage for the swarm data
-        self.swarm = []  # List of lists of the form [PSet, velocity]. Velocity is stored as a dict with the same keys
-        # as PSet
+        self.swarm = []  # List of lists of the form [PSet, velocity]. Velocity is a row of self.velocities
         self.pset_map = dict()  # Maps each PSet to it s particle number, for easy lookup.
         self.bests = [[None, np.inf]] * self.num_particles  # The best result for each particle: list of the
         # form [PSet, objective]
         self.global_best = [None, np.inf]  # The best result for the whole swarm
         self.last_best = np.inf
 
+        # The same information as arrays in search space (log10 for log space parameters), with one row per particle
+        # and one column per parameter. Created in start_run().
+        self.positions = None
+        self.velocities = None
+        self.best_positions = None
+        self.global_best_position = None
+        self.speeds = None  # Maximum absolute velocity component of each particle
+        self.last_moves = dict()  # Maps particle number to (position, velocity, weight) before its last move
+        self.alternative_velocities = dict()  # Maps PSets from alternative_psets() to their velocities
+
     def reset(self, bootstrap=None):
         super(ParticleSwarm, self).reset(bootstrap)
         self.nv = 0
@@ -1103,6 +1813,13 @@ class ParticleSwarm(Algorithm):
         self.bests = [[None, np.inf]] * self.num_particles
         self.global_best = [None, np.inf]
         self.last_best = np.inf
+        self.positions = None
+        self.velocities = None
+        self.best_positions = None
+        self.global_best_position = None
+        self.speeds = None
+        self.last_moves = dict()
+        self.alternative_velocities = dict()
 
     def start_run(self):
         """
@@ -1117,14 +1834,17 @@ class ParticleSwarm(Algorithm):
         else:
             new_params_list = [self.random_pset() for i in range(self.num_particles)]
 
+        self.positions = np.array([p.search_vector() for p in new_params_list])
+        # As suggested by Engelbrecht 2012, set all initial velocities to 0
+        self.velocities = np.zeros(self.positions.shape)
+        self.best_positions = self.positions.copy()
+        self.speeds = np.zeros(len(new_params_list))
+
         for i in range(len(new_params_list)):
             p = new_params_list[i]
             p.name = 'iter0p%i' % i
 
-            # As suggested by Engelbrecht 2012, set all initial velocities to 0
-            new_velocity = dict({v.name: 0. for v in self.variables})
-
-            self.swarm.append([p, new_velocity])
+            self.swarm.append([p, self.velocities[i]])
             self.pset_map[p] = len(self.swarm)-1  # Index of the newly added PSet.
 
         return [particle[0] for particle in self.swarm]
@@ -1157,7 +1877,7 @@ class ParticleSwarm(Algorithm):
 
             # Check stop criterion
             if self.config.config['v_stop'] > 0:
-                max_speed = max([abs(v) for p in self.swarm for v in p[1].values()])
+                max_speed = np.max(self.speeds)
                 if max_speed < self.config.config['v_stop']:
                     logger.info('Stopping particle swarm because the max speed is %s' % max_speed)
                     return 'STOP'
@@ -1170,39 +1890,32 @@ class ParticleSwarm(Algorithm):
         # Update best scores if needed.
         if score <= self.bests[p][1]:
             self.bests[p] = [paramset, score]
+            self.best_positions[p] = paramset.search_vector()
             if score <= self.global_best[1]:
                 self.global_best = [paramset, score]
+                self.global_best_position = self.best_positions[p].copy()
 
         # Update own position and velocity
         # The order matters - updating velocity first seems to make the best use of our current info.
         w = self.w0 + (self.wf - self.w0) * self.nv / (self.nv + self.nmax)
-        self.swarm[p][1] = \
-            {v.name:
-                w * self.swarm[p][1][v.name] +
-                self.c1 * np.random.random() * self.bests[p][0].get_param(v.name).diff(self.swarm[p][0].get_param(v.name)) +
-                self.c2 * np.random.random() * self.global_best[0].get_param(v.name).diff(self.swarm[p][0].get_param(v.name))
-            for v in self.variables}
-
-        # Manually check to determine if reflection occurred (i.e. attempted assigning of variable outside its bounds)
-        # If so, update based on reflection protocol and set velocity to 0
-        new_vars = []
-        for v in self.swarm[p][0]:
-            new_vars.append(v.add(self.swarm[p][1][v.name]))
-            if v.log_space:
-                new_val = 10.**(np.log10(v.value) + self.swarm[p][1][v.name])
-            else:
-                new_val = v.value + self.swarm[p][1][v.name]
-            if new_val < v.lower_bound or v.upper_bound < new_val:
-                self.swarm[p][1][v.name] = 0.0
-
-        new_pset = PSet(new_vars)
-        self.swarm[p][0] = new_pset
+        position = self.positions[p].copy()
+        self.last_moves[p] = (position, self.velocities[p].copy(), w)
+        rand = np.random.random((1, len(position), 2))
+        velocity, new_position = self.move(p, position, self.velocities[p], w, rand)
+        velocity, new_position = velocity[0], new_position[0]
+        schema = self.swarm[p][0].schema
+        self.velocities[p] = velocity
+        self.speeds[p] = np.max(np.abs(velocity)) if len(velocity) > 0 else 0.
+
+        new_pset = PSet.from_search_vector(schema, new_position)
+        self.positions[p] = new_pset.search_vector()
+        self.swarm[p] = [new_pset, self.velocities[p]]
 
         # This will cause a crash if new_pset happens to be the same as an already running pset in pset_map.
         # This could come up in practice if all parameters have hit a box constraint.
         # As a simple workaround, perturb the parameters slightly
         while new_pset in self.pset_map:
-            new_pset = PSet([v.add_rand(-1e-6, 1e-6) for v in self.swarm[p][0]])
+            new_pset = self.swarm[p][0].add_search_vector(np.random.uniform(-1e-6, 1e-6, size=len(position)))
 
         self.pset_map[new_pset] = p
 
@@ -1217,12 +1930,61 @@ class ParticleSwarm(Algorithm):
 
         return [new_pset]
 
+    def move(self, p, position, velocity, w, rand):
+        """
+        Computes new velocities and positions of particle p, one for each set of random factors
+
+        :param p: Particle number
+        :param position: Position of the particle in search space
+        :param velocity: Velocity of the particle
+        :param w: Inertia weight
+        :param rand: Array of shape (n, number of parameters, 2) whose last axis holds the cognitive and social random
+        factors
+        :return: Tuple (velocities, positions) of arrays of shape (n, number of parameters). Positions may lie outside
+        the bounds, and must be reflected back inside.
+        """
+        velocities = w * velocity + \
+            self.c1 * rand[..., 0] * (self.best_positions[p] - position) + \
+            self.c2 * rand[..., 1] * (self.global_best_position - position)
+
+        # Check to determine if reflection occurred (i.e. attempted assigning of variable outside its bounds)
+        # If so, the new position is reflected back inside, and that component of the velocity is set to 0
+        schema = self.swarm[p][0].schema
+        new_positions = position + velocities
+        velocities[(new_positions < schema.search_lower_bounds) | (new_positions > schema.search_upper_bounds)] = 0.
+        return velocities, new_positions
+
+    def alternative_psets(self, pset, n):
+        """Redraws the random factors of the move that produced pset"""
+        p = self.pset_map[pset]
+        position, velocity, w = self.last_moves[p]
+        velocities, new_positions = self.move(p, position, velocity, w, np.random.random((n, len(position), 2)))
+        schema = self.swarm[p][0].schema
+        alternatives = [PSet.from_search_vector(schema, x) for x in new_positions]
+        self.alternative_velocities = dict(zip(alternatives, velocities))
+        return alternatives
+
+    def replace_pset(self, old, new):
+        p = self.pset_map.pop(old)
+        self.velocities[p] = self.alternative_velocities[new]
+        self.alternative_velocities = dict()
+        self.speeds[p] = np.max(np.abs(self.velocities[p])) if len(new) > 0 else 0.
+        self.positions[p] = new.search_vector()
+        self.swarm[p] = [new, self.velocities[p]]
+        while new in self.pset_map:
+            new = self.swarm[p][0].add_search_vector(np.random.uniform(-1e-6, 1e-6, size=len(new)))
+        self.pset_map[new] = p
+        new.name = old.name
+        return new
+
     def add_iterations(self, n):
         self.max_evals += n * self.config.config['population_size']
 
 
 class DifferentialEvolutionBase(Algorithm):
 
+    supports_surrogate = True
+
     def __init__(self, config):
         super(DifferentialEvolutionBase, self).__init__(config)
 
@@ -1244,6 +2006,18 @@ class DifferentialEvolutionBase(Algorithm):
         :param base_index: The index to use for the new individual, or None for a random index.
         :return:
         """
+        return self.new_generation(individuals, [base_index])[0]
+
+    def new_generation(self, individuals, base_indices):
+        """
+        Create several new individuals from the population individuals, according to the set strategy. The trial
+        vectors are computed together as a matrix in search space (log10 for log space parameters).
+
+        :param individuals: List of PSets making up the population
+        :param base_indices: For each new individual, the index of the individual to use as its base, or None for a
+        random index.
+        :return: list of PSets
+        """
 
         # Choose a starting parameter set (either a random one or the base_index specified)
         # and others to cross over (always random)
@@ -1252,35 +2026,53 @@ class DifferentialEvolutionBase(Algorithm):
             pickn = 3
         else:
             pickn = 5
+        count = len(base_indices)
+
+        # For each new individual, choose pickn random unique indices: the positions of the pickn smallest of a row of
+        # random keys, in order of their keys.
+        keys = np.random.random((count, len(individuals)))
+        picks = np.argpartition(keys, pickn - 1, axis=1)[:, :pickn]
+        picks = np.take_along_axis(picks, np.argsort(np.take_along_axis(keys, picks, axis=1), axis=1), axis=1)
+        given = np.array([b is not None for b in base_indices])
+        if given.any():
+            bases = np.array([-1 if b is None else b for b in base_indices])
+            # If we accidentally picked base_index, replace it with picks[0], preserving uniqueness in our list
+            # Then overwrite picks[0] with base_index. If we have base_index, picks[0] was an "extra pick" we only
+            # needed in case we sampled base_index and had to replace it.
+            picks = np.where(given[:, np.newaxis] & (picks == bases[:, np.newaxis]), picks[:, :1], picks)
+            picks[given, 0] = bases[given]
+
+        # Stack the search vectors of the individuals we need into an array of shape (count, pickn, num_params)
+        needed, inverse = np.unique(picks, return_inverse=True)
+        schema = individuals[needed[0]].schema
+        x = np.array([individuals[i].search_vector() for i in needed])[inverse.reshape(picks.shape)]
+
+        # Decide which parameters to mutate, and build the trial vectors
+        update = self.mutation_factor * (x[:, 1] - x[:, 2])
+        if pickn == 5:
+            update += self.mutation_factor * (x[:, 3] - x[:, 4])
+        mutate = np.random.random(update.shape) < self.mutation_rate
+        trial = schema.reflect(np.where(mutate, x[:, 0] + update, x[:, 0]))
+        # Parameters that were not mutated keep the exact value of the base individual
+        base_values = np.array([individuals[i].vector for i in picks[:, 0]])
+        values = np.where(mutate, schema.from_search_space(trial), base_values)
+        values = np.clip(values, schema.lower_bounds, schema.upper_bounds)
+        return [PSet.from_vector(schema, row) for row in values]
+
+    def base_index(self, fitnesses, j):
+        """
+        Chooses the base individual for a new individual at index j, according to the set strategy
 
-        # Choose pickn random unique indices, or if base_index was given, choose base_index followed by pickn-1 unique
-        # indices
-        picks = np.random.choice(len(individuals), pickn, replace=False)
-        if base_index is not None:
-            if base_index in picks:
-                # If we accidentally picked base_index, replace it with picks[0], preserving uniqueness in our list
-                iswitch = list(picks).index(base_index)
-                picks[iswitch] = picks[0]
-            # Now overwrite picks[0] with base_index. If we have base_index, picks[0] was an "extra pick" we only needed
-            # in case we sampled base_index and had to replace it.
-            picks[0] = base_index
-        base = individuals[picks[0]]
-        others = [individuals[p] for p in picks[1:]]
-
-        # Iterate through parameters; decide whether to mutate or leave the same.
-        new_pset_vars = []
-        for p in base:
-            if np.random.random() < self.mutation_rate:
-                if '1' in self.strategy:
-                    update_val = self.mutation_factor * others[0].get_param(p.name).diff(others[1].get_param(p.name))
-                else:
-                    update_val = self.mutation_factor * others[0].get_param(p.name).diff(others[1].get_param(p.name)) +\
-                                 self.mutation_factor * others[2].get_param(p.name).diff(others[3].get_param(p.name))
-                new_pset_vars.append(p.add(update_val))
-            else:
-                new_pset_vars.append(p)
-
-        return PSet(new_pset_vars)
+        :param fitnesses: List of fitnesses of the population
+        :param j: Index of the individual being replaced
+        :return: Index of the base individual, or None for a random one
+        """
+        if 'best' in self.strategy:
+            return np.argmin(fitnesses)
+        elif 'all' in self.strategy:
+            return j
+        else:
+            return None
 
     def start_run(self):
         return NotImplementedError("start_run() not implemented in DifferentialEvolutionBase class")
@@ -1508,18 +2300,13 @@ class DifferentialEvolution(DifferentialEvolutionBase):
                     del self.migration_indices[migration_num]
 
             # Set up the next generation
-            best = np.argmin(self.fitnesses[island])
-            for jj in range(self.num_per_island):
-                if 'best' in self.strategy:
-                    new_pset = self.new_individual(self.individuals[island], best)
-                elif 'all' in self.strategy:
-                    new_pset = self.new_individual(self.individuals[island], jj)
-                else:
-                    new_pset = self.new_individual(self.individuals[island])
+            base_indices = [self.base_index(self.fitnesses[island], jj) for jj in range(self.num_per_island)]
+            new_generation = self.new_generation(self.individuals[island], base_indices)
+            for jj, new_pset in enumerate(new_generation):
                 # If the new pset is a duplicate of one already in the island_map, it will cause problems.
                 # As a workaround, perturb it slightly.
                 while new_pset in self.island_map:
-                    new_pset = PSet([v.add(np.random.uniform(-1e-6, 1e-6)) for v in new_pset])
+                    new_pset = new_pset.add_search_vector(np.random.uniform(-1e-6, 1e-6, size=len(new_pset)))
                 self.proposed_individuals[island][jj] = new_pset
                 self.island_map[new_pset] = (island, jj)
                 if self.num_islands == 1:
@@ -1544,6 +2331,19 @@ class DifferentialEvolution(DifferentialEvolutionBase):
             # Add no new jobs, wait for this generation to complete.
             return []
 
+    def alternative_psets(self, pset, n):
+        island, j = self.island_map[pset]
+        return self.new_generation(self.individuals[island], [self.base_index(self.fitnesses[island], j)] * n)
+
+    def replace_pset(self, old, new):
+        island, j = self.island_map.pop(old)
+        while new in self.island_map:
+            new = new.add_search_vector(np.random.uniform(-1e-6, 1e-6, size=len(new)))
+        self.island_map[new] = (island, j)
+        self.proposed_individuals[island][j] = new
+        new.name = old.name
+        return new
+
 
 class AsynchronousDifferentialEvolution(DifferentialEvolutionBase):
     """
@@ -1637,17 +2437,19 @@ class AsynchronousDifferentialEvolution(DifferentialEvolutionBase):
             if np.max(self.fitnesses) / np.min(self.fitnesses) < 1. + self.stop_tolerance:
                 return 'STOP'
 
-        if 'best' in self.strategy:
-            best = np.argmin(self.fitnesses)
-            new_pset = self.new_individual(self.individuals, best)
-        elif 'all' in self.strategy:
-            new_pset = self.new_individual(self.individuals, j)
-        else:
-            new_pset = self.new_individual(self.individuals)
+        new_pset = self.new_individual(self.individuals, self.base_index(self.fitnesses, j))
         new_pset.name = 'gen%iind%i' % (gen+1, j)
 
         return [new_pset]
 
+    def alternative_psets(self, pset, n):
+        j = int(re.search('(?<=ind)\d+', pset.name).group(0))
+        return self.new_generation(self.individuals, [self.base_index(self.fitnesses, j)] * n)
+
+    def replace_pset(self, old, new):
+        new.name = old.name
+        return new
+
 
 class ScatterSearch(Algorithm):
     """
@@ -1657,6 +2459,8 @@ class ScatterSearch(Algorithm):
 
     """
 
+    supports_surrogate = True
+
     def __init__(self, config):  # variables, popsize, maxiters, saveevery):
 
         super(ScatterSearch, self).__init__(config)
@@ -1837,6 +2641,27 @@ class ScatterSearch(Algorithm):
         else:
             return []
 
+    def alternative_psets(self, pset, n):
+        """Draws n more combinations of the parent and helper that produced pset"""
+        pi, hi = [int(i) for i in re.search('p(\d+)h(\d+)$', pset.name).groups()]
+        parent = self.refs[pi][0]
+        x = parent.search_vector()
+        d = self.refs[hi][0].search_vector() - x
+        alpha = np.sign(hi - pi)
+        beta = (abs(hi - pi) - 1) / (self.popsize - 2)
+        lb = -d * (1 + alpha * beta)
+        ub = d * (1 - alpha * beta)
+        trial = x + lb + (ub - lb) * np.random.random((n, len(x)))
+        return [PSet.from_search_vector(parent.schema, row) for row in trial]
+
+    def replace_pset(self, old, new):
+        parent = self.pending.pop(old)
+        while new in self.pending:
+            new = new.add_search_vector(np.random.uniform(-1e-6, 1e-6, size=len(new)))
+        self.pending[new] = parent
+        new.name = old.name
+        return new
+
     def get_backup_every(self):
         """
         Overrides base method because Scatter Search runs n*(n-1) PSets per iteration.
@@ -1845,6 +2670,79 @@ class ScatterSearch(Algorithm):
             (self.config.config['population_size']-1) * self.config.config['smoothing']
 
 
+class ConvergenceMonitor(object):
+    """
+    Keeps the samples of each chain of a Bayesian algorithm, to compute convergence diagnostics for each parameter:
+    the split R-hat, and the effective sample size (ESS) pooled over chains, as in [Gelman2013].
+
+    Chains that have not been sampled (e.g. chains below the maximum beta in parallel tempering) are ignored. Chains
+    are compared over their first n samples, where n is the number of samples of the shortest sampled chain.
+    """
+
+    def __init__(self, num_chains, d):
+        """
+        :param num_chains: Number of chains
+        :param d: Number of parameters
+        """
+        self.d = d
+        self.counts = [0] * num_chains
+        self.samples = [np.zeros((16, d)) for i in range(num_chains)]
+
+    def add(self, chain, x):
+        """
+        Adds a sample of a chain
+
+        :param chain: Chain index
+        :param x: Vector of parameter values, in search space
+        """
+        if self.counts[chain] == len(self.samples[chain]):
+            grown = np.zeros((2 * len(self.samples[chain]), self.d))
+            grown[:self.counts[chain]] = self.samples[chain]
+            self.samples[chain] = grown
+        self.samples[chain][self.counts[chain]] = x
+        self.counts[chain] += 1
+
+    def diagnostics(self):
+        """
+        Computes the split R-hat and the ESS of each parameter
+
+        :return: Tuple (R-hat, ESS) of arrays with one entry per parameter, or None if there are fewer than 4 samples
+        per chain. Parameters that have not changed within any chain have an R-hat of nan.
+        """
+        chains = [i for i in range(len(self.counts)) if self.counts[i] > 0]
+        if len(chains) == 0:
+            return None
+        n = min([self.counts[i] for i in chains]) // 2
+        if n < 2:
+            return None
+        # Split each chain in half to also detect trends within chains: (2 * chains) x n x d
+        seqs = np.array([part for i in chains for part in (self.samples[i][:n], self.samples[i][n:2 * n])])
+        m = len(seqs)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.mean(seqs, axis=1)
+            within = np.mean(np.var(seqs, axis=1, ddof=1), axis=0)
+            between = n * np.var(means, axis=0, ddof=1)
+            var_plus = (n - 1.) / n * within + between / n
+            rhat = np.sqrt(var_plus / within)
+
+            # Autocovariance of each sequence, via FFT
+            dev = seqs - means[:, np.newaxis, :]
+            f = np.fft.rfft(dev, 2 * n, axis=1)
+            acov = np.fft.irfft(f * np.conjugate(f), axis=1)[:, :n, :] / n
+            rho = 1. - (within - np.mean(acov, axis=0)) / var_plus
+            rho[0] = 1.
+
+            # Sum autocorrelations in pairs up to the first negative pair, keeping the pair sums non-increasing
+            # (Geyer's initial monotone sequence)
+            pairs = rho[:2 * (n // 2):2] + rho[1:2 * (n // 2):2]
+            positive = np.cumprod(pairs > 0, axis=0)
+            pairs = np.minimum.accumulate(np.where(positive, pairs, 0.), axis=0)
+            tau = -1. + 2. * np.sum(pairs, axis=0)
+            ess = m * n / tau
+        return rhat, ess
+
+
 class BayesianAlgorithm(Algorithm):
     """Superclass for Bayesian MCMC algorithms"""
 
@@ -1872,6 +2770,14 @@ class BayesianAlgorithm(Algorithm):
         self.load_priors()
 
         self.samples_file = self.config.config['output_dir'] + '/Results/samples.txt'
+        self.sample_store = None  # Created in start_run()
+        self.sample_writer = None  # Created in start_run() if writing samples.txt
+
+        # Early stopping thresholds, or None
+        self.stop_rhat = config.config['stop_rhat']
+        self.stop_ess = config.config['stop_ess']
+        self.convergence = None  # ConvergenceMonitor, created in start_run()
+        self.converged = False
 
     def load_priors(self):
         """Builds the data structures for the priors, based on the variables specified in the config."""
@@ -1889,6 +2795,17 @@ class BayesianAlgorithm(Algorithm):
             elif var.type == 'loguniform_var':
                 self.prior[var.name] = ('log', 'b', np.log10(var.p1), np.log10(var.p2))
 
+        # The same table as arrays in the order of self.variables, for ln_priors()
+        self.prior_names = tuple(var.name for var in self.variables)
+        table = [self.prior[name] for name in self.prior_names]
+        self.prior_log = np.array([space == 'log' for space, dist, x1, x2 in table], dtype=bool)
+        self.prior_normal = np.array([dist == 'n' for space, dist, x1, x2 in table], dtype=bool)
+        self.prior_p1 = np.array([x1 for space, dist, x1, x2 in table], dtype=float)
+        self.prior_p2 = np.array([x2 for space, dist, x1, x2 in table], dtype=float)
+        box = ~self.prior_normal
+        self.prior_box_total = -np.sum(np.log(self.prior_p2[box] - self.prior_p1[box]))
+        self.staged_priors = dict()  # Maps names of proposed PSets to their ln priors, computed by stage_priors()
+
     def start_run(self, setup_samples=True):
         if self.config.config['initialization'] == 'lh':
             first_psets = self.random_latin_hypercube_psets(self.num_parallel)
@@ -1899,12 +2816,18 @@ class BayesianAlgorithm(Algorithm):
         self.current_pset = [None]*self.num_parallel
         for i in range(len(first_psets)):
             first_psets[i].name = 'iter0run%i' % i
+        self.staged_priors = dict()
+        self.stage_priors(first_psets)
 
         # Set up the output files
         # Cant do this in the constructor because that happens before the output folder is potentially overwritten.
         if setup_samples:
-            with open(self.samples_file, 'w') as f:
-                f.write('# Name\tLn_probability\t'+first_psets[0].keys_to_string()+'\n')
+            self.sample_store = SampleStore(self.config.config['output_dir'] + '/Results/samples.npy',
+                                            [v.name for v in self.variables])
+            if self.config.config['save_samples_txt']:
+                self.sample_writer = SampleWriter(self.samples_file, [v.name for v in self.variables])
+            self.convergence = ConvergenceMonitor(self.num_parallel, len(self.variables))
+            self.converged = False
             os.makedirs(self.config.config['output_dir'] + '/Results/Histograms/', exist_ok=True)
 
         return first_psets
@@ -1920,36 +2843,79 @@ class BayesianAlgorithm(Algorithm):
         :type pset: PSet
         :return: float value of ln times the prior distribution
         """
-        total = 0.
-        for v in self.prior:
-            (space, dist, x1, x2) = self.prior[v]
-            if space == 'log':
-                val = np.log10(pset[v])
-            else:
-                val = pset[v]
+        return float(self.ln_priors(self.prior_vector(pset)[np.newaxis, :])[0])
 
-            if dist == 'n':
-                # Normal with mean x1 and value x2
-                total += -1. / (2. * x2 ** 2.) * (x1 - val)**2.
-            else:
-                # Uniform from x1 to x2
-                if x1 <= val <= x2:
-                    total += -np.log(x2-x1)
-                else:
-                    logger.warning('Box-constrained parameter %s reached a value outside the box.')
-                    total += -np.inf
+    def ln_priors(self, values):
+        """
+        Returns the value of the prior distribution for each of several parameter sets
+
+        :param values: Matrix with the parameter values of one parameter set per row, in the order of self.variables
+        :type values: np.ndarray
+        :return: Array of ln times the prior distribution
+        """
+        x = np.array(values, dtype=float)
+        x[:, self.prior_log] = np.log10(x[:, self.prior_log])
+        normal = self.prior_normal
+        box = ~normal
+        # Normal with mean p1 and standard deviation p2, or uniform from p1 to p2
+        total = self.prior_box_total - np.sum((self.prior_p1[normal] - x[:, normal]) ** 2.
+                                              / (2. * self.prior_p2[normal] ** 2.), axis=1)
+        outside = np.any((x[:, box] < self.prior_p1[box]) | (x[:, box] > self.prior_p2[box]), axis=1)
+        if np.any(outside):
+            logger.warning('Box-constrained parameter reached a value outside the box.')
+            total[outside] = -np.inf
         return total
 
-    def sample_pset(self, pset, ln_prob):
+    def prior_vector(self, pset):
+        """Returns the parameter values of pset in the order of self.variables"""
+        if pset.schema.names == self.prior_names:
+            return pset.vector
+        return pset.vector[[pset.schema.index[name] for name in self.prior_names]]
+
+    def stage_priors(self, psets):
+        """
+        Computes the ln priors of a batch of proposed PSets with a single call to ln_priors(), to be looked up by
+        proposal_ln_prior() when their results arrive.
+
+        :param psets: List of PSets, with their names set
+        """
+        if len(psets) == 0:
+            return
+        ln_p = self.ln_priors(np.array([self.prior_vector(p) for p in psets]))
+        self.staged_priors.update(zip([p.name for p in psets], ln_p.tolist()))
+
+    def proposal_ln_prior(self, pset):
+        """Returns the ln prior of a PSet whose result has arrived, using the value from stage_priors() if any"""
+        if pset.name in self.staged_priors:
+            return self.staged_priors.pop(pset.name)
+        return self.ln_prior(pset)
+
+    def sample_pset(self, pset, ln_prob, chain=None):
         """
         Adds this pset to the set of sampled psets for the final distribution.
         :param pset:
         :type pset: PSet
         :param ln_prob - The probability of this PSet to record in the samples file.
         :type ln_prob: float
+        :param chain: The index of the chain the sample came from, used for the convergence diagnostics
+        :type chain: int
+        """
+        self.sample_store.append(pset, ln_prob)
+        if self.sample_writer is not None:
+            self.sample_writer.append(pset, ln_prob)
+        if chain is not None and self.convergence is not None:
+            self.convergence.add(chain, pset.search_vector())
+
+    def output_results(self, name='', no_move=False):
+        """
+        Writes the best fits as in Algorithm.output_results(), and writes out any buffered samples. This happens
+        periodically, before each backup, at the end of the run, and when quitting due to an error.
         """
-        with open(self.samples_file, 'a') as f:
-            f.write(pset.name+'\t'+str(ln_prob)+'\t'+pset.values_to_string()+'\n')
+        super(BayesianAlgorithm, self).output_results(name, no_move)
+        if self.sample_store is not None:
+            self.sample_store.flush()
+        if self.sample_writer is not None:
+            self.sample_writer.flush()
 
     def update_histograms(self, file_ext):
         """
@@ -1958,10 +2924,11 @@ class BayesianAlgorithm(Algorithm):
         :type file_ext: str
         :return:
         """
-        # Read the samples file into an array, ignoring the first row (header)
-        # and first 2 columns (pset names, probabilities)
-        dat_array = np.genfromtxt(self.samples_file, delimiter='\t', dtype=float,
-                                  usecols=range(2, len(self.variables)+2))
+        if self.sample_writer is not None:
+            self.sample_writer.flush()
+        if self.sample_store is None or self.sample_store.n_rows == 0:
+            return
+        self.sample_store.flush()
 
         # Open the file(s) to save the credible intervals
         cred_files = []
@@ -1973,28 +2940,64 @@ class BayesianAlgorithm(Algorithm):
         for i in range(len(self.variables)):
             v = self.variables[i]
             fname = self.config.config['output_dir']+'/Results/Histograms/%s%s.txt' % (v.name, file_ext)
+            data = self.sample_store.column(v.name)
             # For log-space variables, we want the histogram in log space
             if v.log_space:
-                histdata = np.log10(dat_array[:, i])
+                histdata = np.log10(data)
                 header = 'log10_lower_bound\tlog10_upper_bound\tcount'
             else:
-                histdata = dat_array[:, i]
+                histdata = data
                 header = 'lower_bound\tupper_bound\tcount'
             hist, bin_edges = np.histogram(histdata, bins=self.num_bins)
             result_array = np.stack((bin_edges[:-1], bin_edges[1:], hist), axis=-1)
             np.savetxt(fname, result_array, delimiter='\t', header=header)
 
-            sorted_data = sorted(dat_array[:, i])
-            for interval, file in zip(self.credible_intervals, cred_files):
-                n = len(sorted_data)
+            # Only the order statistics at the interval bounds are needed, so partition instead of sorting
+            n = len(data)
+            bounds = []
+            for interval in self.credible_intervals:
                 want = n * (interval/100)
-                min_index = int(np.round(n/2 - want/2))
-                max_index = int(np.round(n/2 + want/2 - 1))
-                file.write('%s\t%s\t%s\n' % (v.name, sorted_data[min_index], sorted_data[max_index]))
+                bounds.append((int(np.round(n/2 - want/2)), int(np.round(n/2 + want/2 - 1))))
+            partitioned = np.partition(data, sorted(set([b for pair in bounds for b in pair])))
+            for (min_index, max_index), file in zip(bounds, cred_files):
+                file.write('%s\t%s\t%s\n' % (v.name, partitioned[min_index], partitioned[max_index]))
 
         for file in cred_files:
             file.close()
 
+        self.converged = self.check_convergence(file_ext)
+
+    def check_convergence(self, file_ext):
+        """
+        Computes the split R-hat and effective sample size of each parameter, writes them to a file, and checks them
+        against the stop_rhat and stop_ess thresholds
+
+        :param file_ext: String to append to the save file name
+        :type file_ext: str
+        :return: True if at least one threshold is set, and all parameters meet the thresholds
+        """
+        if self.convergence is None:
+            return False
+        diagnostics = self.convergence.diagnostics()
+        if diagnostics is None:
+            return False
+        rhat, ess = diagnostics
+        with open(self.config.config['output_dir'] + '/Results/convergence%s.txt' % file_ext, 'w') as f:
+            f.write('# param\tsplit_rhat\tess\n')
+            for v, r, e in zip(self.variables, rhat, ess):
+                f.write('%s\t%s\t%s\n' % (v.name, r, e))
+        # nan (parameters that never changed) counts as not converged
+        max_rhat = np.max(np.where(np.isnan(rhat), np.inf, rhat))
+        min_ess = np.min(np.where(np.isnan(ess), 0., ess))
+        print1('Convergence: maximum split R-hat %.4f, minimum effective sample size %.1f' % (max_rhat, min_ess))
+        logger.info('Split R-hat: %s' % str(rhat))
+        logger.info('Effective sample size: %s' % str(ess))
+
+        if self.stop_rhat is None and self.stop_ess is None:
+            return False
+        return ((self.stop_rhat is None or max_rhat <= self.stop_rhat) and
+                (self.stop_ess is None or min_ess >= self.stop_ess))
+
     def cleanup(self):
         """Called when quitting due to error.
         Save the histograms in addition to the usual algorithm cleanup"""
@@ -2042,7 +3045,7 @@ class DreamAlgorithm(BayesianAlgorithm):
         index = int(m.group(0))
 
         # Calculate posterior of finished job
-        lnprior = self.ln_prior(pset)
+        lnprior = self.proposal_ln_prior(pset)
         lnlikelihood = -score
         lnposterior = lnprior + lnlikelihood
 
@@ -2060,10 +3063,14 @@ class DreamAlgorithm(BayesianAlgorithm):
 
         # Update histograms and trajectories if necessary
         if self.iteration[index] % self.sample_every == 0 and self.iteration[index] > self.burn_in:
-            self.sample_pset(self.current_pset[index], self.ln_current_P[index])
+            self.sample_pset(self.current_pset[index], self.ln_current_P[index], index)
         if (self.iteration[index] % (self.sample_every * self.output_hist_every) == 0
             and self.iteration[index] > self.burn_in):
             self.update_histograms('_%i' % self.iteration[index])
+            if self.converged:
+                print0('Stopping on iteration %i because the convergence criteria were met' % self.iteration[index])
+                logger.info('Stopping because the convergence criteria were met')
+                return 'STOP'
 
         # Wait for entire generation to finish
         if np.all(self.wait_for_sync):
@@ -2082,8 +3089,7 @@ class DreamAlgorithm(BayesianAlgorithm):
             print2('Current -Ln Posteriors: %s' % str(self.ln_current_P))
 
             next_gen = []
-            for i, p in enumerate(self.current_pset):
-                new_pset = self.calculate_new_pset(i)
+            for i, new_pset in enumerate(self.calculate_new_psets()):
                 if new_pset:
                     new_pset.name = 'iter%irun%i' % (self.iteration[i], i)
                     next_gen.append(new_pset)
@@ -2093,51 +3099,134 @@ class DreamAlgorithm(BayesianAlgorithm):
                     self.wait_for_sync[i] = True
                     self.iteration[i] += 1
 
+            self.stage_priors(next_gen)
             return next_gen
 
         return []
 
-    def calculate_new_pset(self, idx):
+    def calculate_new_psets(self):
         """
-        Uses differential evolution-like update to calculate new PSet
+        Uses differential evolution-like update to calculate a new PSet for every chain. The random numbers for all
+        chains are drawn as matrices.
 
-        :param idx: Index of PSet to update
-        :return:
+        :return: List of the new PSet for each chain, or None for chains whose new PSet is outside of the bounds
         """
+        n = self.num_parallel
+        schema = self.current_pset[0].schema
+        x = np.array([p.search_vector() for p in self.current_pset])
+
+        # Choose 2 distinct individuals for each chain (not the chain to be updated) for mutation
+        chains = np.arange(n)
+        sel0 = np.random.randint(n - 1, size=n)
+        sel0 += sel0 >= chains
+        sel1 = np.random.randint(n - 2, size=n)
+        sel1 += sel1 >= np.minimum(chains, sel0)
+        sel1 += sel1 >= np.maximum(chains, sel0)
+
+        # Sample the probability of modifying a parameter, and the parameter subspace of each chain
+        cr = np.random.choice(self.ncr, size=n)
+        ds = np.random.uniform(size=(n, self.n_dim)) <= cr[:, np.newaxis]
+        empty = ~np.any(ds, axis=1)
+        while np.any(empty):
+            ds[empty] = np.random.uniform(size=(np.sum(empty), self.n_dim)) <= cr[empty, np.newaxis]
+            empty = ~np.any(ds, axis=1)
 
-        # Choose individuals (not individual to be updated) for mutation
-        sel = np.random.choice(self.all_idcs[self.all_idcs != idx], 2, replace=False)
-        x0 = self.current_pset[idx]
-        x1 = self.current_pset[sel[0]]
-        x2 = self.current_pset[sel[1]]
+        # Sample whether to jump to the mode (when gamma = 1)
+        gamma = np.where(np.random.uniform(size=n) < self.g_prob, 1., self.step_size)
+        zeta = np.random.normal(0, self.config.config['zeta'], size=(n, self.n_dim))
+        lamb = np.random.uniform(-self.config.config['lambda'], self.config.config['lambda'], size=(n, self.n_dim))
 
-        # Sample the probability of modifying a parameter
-        cr = np.random.choice(self.ncr)
-        while True:
-            ds = np.random.uniform(size=self.n_dim) <= cr  # sample parameter subspace
-            if np.any(ds):
-                break
+        # Differential evolution calculation (while satisfying detailed balance)
+        diff = np.where(ds, x[sel0] - x[sel1], 0.)
+        values = schema.from_search_space(x + zeta + (1. + lamb) * gamma[:, np.newaxis] * diff)
+        # Do not reflect the parameters (need to reject if outside bounds)
+        valid = np.all((values >= schema.lower_bounds) & (values <= schema.upper_bounds), axis=1)
+        return [PSet.from_vector(schema, values[i]) if valid[i] else None for i in range(n)]
 
-        # Sample whether to jump to the mode (when gamma = 1)
-        gamma = 1 if np.random.uniform() < self.g_prob else self.step_size
 
-        new_vars = []
-        for i, d in enumerate(np.random.permutation(ds)):
-            k = self.variables[i]
-            diff = x1.get_param(k.name).diff(x2.get_param(k.name)) if d else 0.0
-            zeta = np.random.normal(0, self.config.config['zeta'])
-            lamb = np.random.uniform(-self.config.config['lambda'], self.config.config['lambda'])
+class AdaptiveProposal(object):
+    """
+    Proposal distribution for Metropolis moves that adapts to the chain as it runs.
 
-            # Differential evolution calculation (while satisfying detailed balance)
-            try:
-                # Do not reflect the parameter (need to reject if outside bounds)
-                new_var = x0.get_param(k.name).add(zeta + (1. + lamb) * gamma * diff, False)
-                new_vars.append(new_var)
-            except OutOfBoundsException:
-                logger.debug("Variable %s is outside of bounds")
-                return None
+    Keeps a running mean and covariance of the chain's states in search space (Welford's algorithm, O(d^2) per
+    update). Once start states have been seen, moves are drawn from a normal distribution with covariance
+    2.38^2 / d times the chain covariance, as in the adaptive Metropolis algorithm of [Haario2001]. Before that, moves
+    have length step_size in a random direction, as without adaptation.
 
-        return PSet(new_vars)
+    If target_acceptance is set, the size of all moves is also scaled up or down after each move by a diminishing
+    amount (Robbins-Monro), so that the fraction of accepted moves approaches target_acceptance.
+    """
+
+    def __init__(self, d, step_size, start, target_acceptance=None, adapt_covariance=True):
+        """
+        :param d: Number of parameters
+        :param step_size: Length of moves before the covariance is adapted
+        :param start: Number of states to observe before adapting the covariance
+        :param target_acceptance: Acceptance rate to target, or None for no scaling
+        :param adapt_covariance: If False, only the move size is adapted
+        """
+        self.d = d
+        self.step_size = step_size
+        self.start = max(start, d + 1)
+        self.target_acceptance = target_acceptance
+        self.adapt_covariance = adapt_covariance
+
+        self.n = 0
+        self.mean = np.zeros(d)
+        self.m2 = np.zeros((d, d))  # Sum of outer products of deviations from the mean
+        self.log_scale = 0.
+        self.moves = 0
+
+        self._factor = None  # Cholesky factor of the proposal covariance
+        self._factor_n = 0  # Value of n when _factor was computed
+
+    def add_state(self, x):
+        """
+        Updates the running mean and covariance with a state of the chain
+
+        :param x: The state, in search space
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += np.outer(delta, x - self.mean)
+
+    def add_move(self, accepted):
+        """
+        Updates the move size after a move is accepted or rejected, if targeting an acceptance rate
+
+        :param accepted: Whether the move was accepted
+        """
+        if self.target_acceptance is None:
+            return
+        self.moves += 1
+        self.log_scale += (float(accepted) - self.target_acceptance) / np.sqrt(self.moves)
+
+    def covariance(self):
+        """The covariance of the states seen so far"""
+        return self.m2 / max(self.n - 1, 1)
+
+    @property
+    def adapted(self):
+        """Whether moves are drawn from the adapted covariance"""
+        return self.adapt_covariance and self.n >= self.start
+
+    def propose(self):
+        """
+        Draws a move
+
+        :return: The move, a vector in search space
+        """
+        if not self.adapted:
+            delta = np.random.normal(size=self.d)
+            return delta * (self.step_size * np.exp(self.log_scale) / np.sqrt(np.sum(delta ** 2)))
+        # Refactoring costs O(d^3), so it is only done after d new states, keeping the cost per state at O(d^2)
+        if self._factor is None or self.n - self._factor_n >= self.d:
+            # The small multiple of the identity keeps the covariance positive definite
+            cov = 2.38 ** 2 / self.d * self.covariance() + (1e-3 * self.step_size) ** 2 * np.eye(self.d)
+            self._factor = np.linalg.cholesky(cov)
+            self._factor_n = self.n
+        return np.exp(self.log_scale) * self._factor.dot(np.random.normal(size=self.d))
 
 
 class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
@@ -2166,6 +3255,13 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
         self.pt = self.exchange_every != np.inf
         self.reps_per_beta = self.config.config['reps_per_beta']
         self.betas_per_group = self.num_parallel // self.reps_per_beta  # Number of unique betas considered (in PT)
+        # If True, chains at an exchange point exchange with neighbors that are also waiting, instead of all chains
+        # waiting for each other
+        self.async_exchange = self.pt and bool(config.config['async_exchange'])
+        self.adaptive_proposal = bool(config.config['adaptive_proposal'])
+        self.target_acceptance = config.config['target_acceptance']
+        # One AdaptiveProposal per chain, or per beta in PT. Created in start_run() if adapting.
+        self.proposals = None
 
         # The temperature of each replicate
         # For MCMC, probably n copies of the same number, unless the user set it up strangely
@@ -2196,6 +3292,10 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
 
         self.wait_for_sync = [False] * self.num_parallel
         self.samples_file = None
+        self.sample_store = None
+        self.sample_writer = None
+        self.convergence = None
+        self.converged = False
 
     def start_run(self):
         """
@@ -2218,6 +3318,13 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
             print2('Statistical samples will be recorded every %i iterations, after an initial %i-iteration burn-in period'
                    % (self.sample_every, self.burn_in))
 
+        if self.adaptive_proposal or self.target_acceptance is not None:
+            num_proposals = self.betas_per_group if self.pt else self.num_parallel
+            self.proposals = [AdaptiveProposal(len(self.variables), self.step_size,
+                                               self.config.config['adaptive_start'], self.target_acceptance,
+                                               self.adaptive_proposal)
+                              for i in range(num_proposals)]
+
         setup_samples = not self.sa
         return super(BasicBayesMCMCAlgorithm, self).start_run(setup_samples=setup_samples)
 
@@ -2239,7 +3346,7 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
         index = int(m.group(0))
 
         # Calculate the acceptance probability
-        lnprior = self.ln_prior(pset) # Need something clever for box constraints
+        lnprior = self.proposal_ln_prior(pset)
         lnlikelihood = -score
 
         # Because the P's are so small to start, we express posterior, p_accept, and current_P in ln space
@@ -2249,7 +3356,13 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
 
         # Decide whether to accept move.
         self.attempts += 1
-        if np.random.rand() < np.exp(ln_p_accept*self.betas[index]) or np.isnan(self.ln_current_P[index]):
+        first = np.isnan(self.ln_current_P[index])
+        accept = np.random.rand() < np.exp(ln_p_accept*self.betas[index]) or first
+        if self.proposals is not None and not first:
+            proposal = self.proposals[self.proposal_index(index)]
+            proposal.add_move(accept)
+            proposal.add_state((pset if accept else self.current_pset[index]).search_vector())
+        if accept:
             # Accept the move, so update our current PSet and P
             self.accepted += 1
             self.current_pset[index] = pset
@@ -2270,12 +3383,23 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
         # Using either the newly accepted PSet or the old PSet, propose the next PSet.
         proposed_pset = self.try_to_choose_new_pset(index)
 
+        if self.converged:
+            print0('Stopping on iteration %i because the convergence criteria were met' % min(self.iteration))
+            logger.info('Stopping because the convergence criteria were met')
+            print0('Overall move accept rate: %f' % (self.accepted/self.attempts))
+            self.update_histograms('_final')
+            return 'STOP'
+
         if proposed_pset is None:
-            if np.all(self.wait_for_sync):
+            if self.async_exchange:
+                proposed = self.async_replica_exchange(index)
+                if len(proposed) > 0:
+                    return proposed
+            elif np.all(self.wait_for_sync):
                 # Do the replica exchange, then propose n new psets so all chains resume
                 self.wait_for_sync = [False] * self.num_parallel
                 return self.replica_exchange()
-            elif min(self.iteration) >= self.max_iterations:
+            if min(self.iteration) >= self.max_iterations:
                 print0('Overall move accept rate: %f' % (self.accepted/self.attempts))
                 if not self.sa:
                     self.update_histograms('_final')
@@ -2325,7 +3449,7 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
             if not self.sa:
                 if self.iteration[index] > self.burn_in and self.iteration[index] % self.sample_every == 0 \
                         and self.should_sample(index):
-                    self.sample_pset(self.current_pset[index], self.ln_current_P[index])
+                    self.sample_pset(self.current_pset[index], self.ln_current_P[index], index)
                 if (self.iteration[index] > self.burn_in
                    and self.iteration[index] % (self.output_hist_every * self.sample_every) == 0
                    and self.iteration[index] == min(self.iteration)):
@@ -2356,7 +3480,7 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
                 # Need to wait for the rest of the chains to catch up to do replica exchange
                 self.wait_for_sync[index] = True
                 return None
-            proposed_pset = self.choose_new_pset(self.current_pset[index])
+            proposed_pset = self.choose_new_pset(self.current_pset[index], index)
         return proposed_pset
 
     def should_sample(self, index):
@@ -2366,34 +3490,32 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
         """
         return (index + 1) % self.betas_per_group == 0 if self.pt else True
 
-    def choose_new_pset(self, oldpset):
+    def proposal_index(self, index):
+        """
+        Returns the index in self.proposals of the AdaptiveProposal used by chain index. In PT, chains at the same
+        beta share one.
+        """
+        return index % self.betas_per_group if self.pt else index
+
+    def choose_new_pset(self, oldpset, index=None):
         """
         Helper function to perturb the old PSet, generating a new proposed PSet
         If the new PSet fails automatically because it violates box constraints, returns None.
 
         :param oldpset: The PSet to be changed
         :type oldpset: PSet
+        :param index: The chain the PSet belongs to. Used to choose the AdaptiveProposal, if adapting.
+        :type index: int
         :return: the new PSet
         """
 
-        delta_vector = {k: np.random.normal() for k in oldpset.keys()}
-        delta_vector_magnitude = np.sqrt(sum([x ** 2 for x in delta_vector.values()]))
-        delta_vector_normalized = {k: self.step_size * delta_vector[k] / delta_vector_magnitude for k in oldpset.keys()}
-        new_vars = []
-        for v in oldpset:
-            # For box constraints, need special treatment to keep correct statistics
-            # If we tried to leave the box, the move automatically fails, we should increment the iteration counter
-            # and retry.
-            # The same could happen if normal_var's try to go below 0
-            try:
-                new_var = v.add(delta_vector_normalized[v.name])
-            except OutOfBoundsException:
-                logger.debug('Rejected a move because %s=%.2E moved by %f, outside the box constraint [%.2E, %.2E]' %
-                             (v.name, oldpset[v.name], delta_vector_normalized[v.name], v.lower_bound, v.upper_bound))
-                return None
-            new_vars.append(new_var)
-
-        return PSet(new_vars)
+        if self.proposals is not None and index is not None:
+            delta_vector = self.proposals[self.proposal_index(index)].propose()
+        else:
+            delta_vector = np.random.normal(size=len(oldpset))
+            delta_vector *= self.step_size / np.sqrt(np.sum(delta_vector ** 2))
+        # Moves that leave the box constraints (or take a normal_var below 0) are reflected back inside.
+        return oldpset.add_search_vector(delta_vector)
 
     def replica_exchange(self):
         """
@@ -2412,23 +3534,7 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
                 ind_hi = self.betas_per_group * group + i
                 other_group = permutation[group]
                 ind_lo = self.betas_per_group * other_group + i + 1
-                # Consider exchanging index ind_hi (higher T) with ind_lo (lower T)
-                ln_p_exchange = min(0., -(self.betas[ind_lo]-self.betas[ind_hi]) * (self.ln_current_P[ind_lo]-self.ln_current_P[ind_hi]))
-                # Scratch work: Should there be a - sign in front? You want to always accept if moving the better answer
-                # to the lower temperature. ind_lo has lower T so higher beta, so the first term is positive. The second
-                # term is positive if ind_lo is better. But you want a positive final answer when ind_hi, currently at
-                # higher T, is better. So you need a - sign.
-                self.exchange_attempts += 1
-                if np.random.random() < np.exp(ln_p_exchange):
-                    # Do the exchange
-                    logger.debug('Exchanging individuals %i and %i' % (ind_hi, ind_lo))
-                    self.exchange_accepted += 1
-                    hold_pset = self.current_pset[ind_hi]
-                    hold_p = self.ln_current_P[ind_hi]
-                    self.current_pset[ind_hi] = self.current_pset[ind_lo]
-                    self.ln_current_P[ind_hi] = self.ln_current_P[ind_lo]
-                    self.current_pset[ind_lo] = hold_pset
-                    self.ln_current_P[ind_lo] = hold_p
+                self.attempt_exchange(ind_hi, ind_lo)
         # Propose new psets - it's more complicated because of going out of box, and other counters.
         proposed = []
         for j in range(self.num_parallel):
@@ -2443,12 +3549,97 @@ class BasicBayesMCMCAlgorithm(BayesianAlgorithm):
                 elif min(self.iteration) >= self.max_iterations:
                     return 'STOP'
             else:
-                # Iteration number got off by 1 because try_to_choose_new_pset() was called twice: once a while ago
-                # when it reached the exchange point and returned None, and a second time just now.
-                # Need to correct for that here.
-                self.iteration[j] -= 1
-                proposed_pset.name = 'iter%irun%i' % (self.iteration[j], j)
-                proposed.append(proposed_pset)
+                proposed.append(self._name_resumed_pset(j, proposed_pset))
+        self.stage_priors(proposed)
+        return proposed
+
+    def _name_resumed_pset(self, j, proposed_pset):
+        """Names the PSet proposed for chain j when it resumes after an exchange point"""
+        # Iteration number got off by 1 because try_to_choose_new_pset() was called twice: once a while ago
+        # when it reached the exchange point and returned None, and a second time just now.
+        # Need to correct for that here.
+        self.iteration[j] -= 1
+        proposed_pset.name = 'iter%irun%i' % (self.iteration[j], j)
+        return proposed_pset
+
+    def attempt_exchange(self, ind_hi, ind_lo):
+        """
+        Attempts to exchange the current PSets of two replicas at neighboring betas, with the parallel tempering
+        acceptance probability
+
+        :param ind_hi: Index of the replica at the higher temperature (lower beta)
+        :param ind_lo: Index of the replica at the lower temperature (higher beta)
+        """
+        # Consider exchanging index ind_hi (higher T) with ind_lo (lower T)
+        ln_p_exchange = min(0., -(self.betas[ind_lo]-self.betas[ind_hi]) * (self.ln_current_P[ind_lo]-self.ln_current_P[ind_hi]))
+        # Scratch work: Should there be a - sign in front? You want to always accept if moving the better answer
+        # to the lower temperature. ind_lo has lower T so higher beta, so the first term is positive. The second
+        # term is positive if ind_lo is better. But you want a positive final answer when ind_hi, currently at
+        # higher T, is better. So you need a - sign.
+        self.exchange_attempts += 1
+        if np.random.random() < np.exp(ln_p_exchange):
+            # Do the exchange
+            logger.debug('Exchanging individuals %i and %i' % (ind_hi, ind_lo))
+            self.exchange_accepted += 1
+            hold_pset = self.current_pset[ind_hi]
+            hold_p = self.ln_current_P[ind_hi]
+            self.current_pset[ind_hi] = self.current_pset[ind_lo]
+            self.ln_current_P[ind_hi] = self.ln_current_P[ind_lo]
+            self.current_pset[ind_lo] = hold_pset
+            self.ln_current_P[ind_lo] = hold_p
+
+    def exchange_neighbors(self, index):
+        """
+        Returns the replicas at the betas adjacent to that of replica index, in any group of replicas
+
+        :param index: Replica index
+        :return: list of replica indices
+        """
+        position = index % self.betas_per_group
+        return [group * self.betas_per_group + p for group in range(self.reps_per_beta)
+                for p in (position - 1, position + 1) if 0 <= p < self.betas_per_group]
+
+    def async_replica_exchange(self, index):
+        """
+        Performs replica exchange without a barrier across all chains, used if async_exchange is set.
+        Called when chain index stops, either at an exchange point (wait_for_sync[index] is True) or because it
+        finished. A chain at an exchange point exchanges with a randomly chosen chain at a neighboring beta that is
+        also waiting at an exchange point, and both resume. If there is none, it waits for one to arrive. A chain
+        stops waiting without an exchange once all of its neighbors have finished.
+
+        :param index: The chain that just stopped
+        :return: List of PSets to run for the chains that resume
+        """
+        proposed = []
+        stopped = [index]
+        while stopped:
+            i = stopped.pop()
+            resume = []
+            if self.wait_for_sync[i]:
+                partners = [j for j in self.exchange_neighbors(i) if self.wait_for_sync[j]]
+                if len(partners) > 0:
+                    j = partners[np.random.randint(len(partners))]
+                    logger.info('Performing replica exchange of replicas %i and %i on iterations %i and %i' %
+                                (i, j, self.iteration[i], self.iteration[j]))
+                    if i % self.betas_per_group < j % self.betas_per_group:
+                        self.attempt_exchange(i, j)
+                    else:
+                        self.attempt_exchange(j, i)
+                    resume = [i, j]
+            # This chain, or chains that were waiting on it if it finished, may have no neighbors left to wait for
+            for j in [i] + self.exchange_neighbors(i):
+                if (self.wait_for_sync[j] and j not in resume and
+                        all([self.iteration[k] >= self.max_iterations for k in self.exchange_neighbors(j)])):
+                    resume.append(j)
+            for j in resume:
+                self.wait_for_sync[j] = False
+                proposed_pset = self.try_to_choose_new_pset(j)
+                if proposed_pset is None:
+                    # Reached another exchange point or finished
+                    stopped.append(j)
+                else:
+                    proposed.append(self._name_resumed_pset(j, proposed_pset))
+        self.stage_priors(proposed)
         return proposed
 
     def cleanup(self):
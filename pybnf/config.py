@@ -162,9 +162,12 @@ class Configuration(object):
             'objfunc': 'chi_sq', 'output_dir': 'pybnf_output', 'delete_old_files': 1, 'num_to_output': 5000,
             'output_every': 20, 'initialization': 'lh', 'refine': 0, 'bng_command': bng_command, 'smoothing': 1,
             'backup_every': 1, 'time_course': (), 'param_scan': (), 'min_objective': -np.inf, 'bootstrap': 0,
+            'bootstrap_parallel': 1,
             'bootstrap_max_obj': None, 'ind_var_rounding': 0, 'local_objective_eval': 0, 'constraint_scale': 1.0,
             'sbml_integrator': 'cvode', 'parallel_count': None, 'save_best_data': 0, 'simulation_dir': None,
-            'parallelize_models': 1,
+            'parallelize_models': 1, 'scratch_dir': None, 'direct_run_network': 0,
+            'persistent_sbml_runner': 0, 'job_batch_size': 1, 'random_seed': None, 'trajectory_log': 0,
+            'save_evaluations': 0, 'eval_cache': 0, 'eval_cache_tolerance': 0., 'eval_cache_data': 0,
 
             'mutation_rate': 0.5, 'mutation_factor': 0.5, 'islands': 1, 'migrate_every': 20, 'num_to_migrate': 3,
             'stop_tolerance': 0.002, 'de_strategy': 'rand1',
@@ -174,8 +177,12 @@ class Configuration(object):
 
             'local_min_limit': 5,
 
+            'surrogate': 0, 'surrogate_candidates': 10, 'surrogate_budget': 0.25,
+
             'step_size': 0.2, 'burn_in': 10000, 'sample_every': 100, 'output_hist_every': 100, 'hist_bins': 10,
             'credible_intervals': [68., 95.], 'beta': [1.0], 'exchange_every': 20, 'beta_max': np.inf, 'cooling': 0.01,
+            'save_samples_txt': 1, 'async_exchange': 0, 'adaptive_proposal': 0, 'adaptive_start': 200,
+            'target_acceptance': None, 'stop_rhat': None, 'stop_ess': None,
 
             'simplex_step': 1.0, 'simplex_reflection': 1.0, 'simplex_expansion':1.0, 'simplex_contraction': 0.5,
             'simplex_shrink': 0.5, 'simplex_stop_tol': 0.,
@@ -210,7 +217,9 @@ class Configuration(object):
                         'ss': {'init_size', 'local_min_limit', 'reserve_size'},
                         'mh': {'step_size', 'burn_in', 'sample_every', 'output_hist_every', 'hist_bins',
                                 'credible_intervals', 'beta', 'beta_range', 'exchange_every', 'beta_max', 'cooling',
-                                'crossover_number', 'zeta', 'lambda', 'gamma_prob'},
+                                'crossover_number', 'zeta', 'lambda', 'gamma_prob', 'save_samples_txt',
+                                'async_exchange', 'adaptive_proposal', 'adaptive_start', 'target_acceptance',
+                                'stop_rhat', 'stop_ess'},
                         'sim': {'simplex_step', 'simplex_log_step', 'simplex_reflection', 'simplex_expansion',
                                 'simplex_contraction', 'simplex_shrink', 'simplex_max_iterations',
                                 'simplex_stop_tol'}
@@ -224,6 +233,9 @@ class Configuration(object):
                and not(alg == 'sim' and 'refine' in conf_dict and conf_dict['refine'] == 1)
                and not (thisalg == 'de' and alg == 'ade')):
                 ignored_params = ignored_params.union(alg_specific[alg])
+        if thisalg in ('mh', 'sim'):
+            # Surrogate screening is shared by the other algorithms, so it is not listed in alg_specific
+            ignored_params = ignored_params.union({'surrogate', 'surrogate_candidates', 'surrogate_budget'})
         for k in ignored_params.intersection(set(conf_dict.keys())):
             print1('Warning: Configuration key %s is not used in fit_type %s, so I am ignoring it'
                             % (k, conf_dict['fit_type']))
@@ -239,7 +251,7 @@ class Configuration(object):
         """
         used = {'model', 'output_dir', 'simulation_dir', 'fit_type', 'objfunc', 'normalization', 'postprocessing',
                 'verbosity', 'wall_time_sim', 'bng_command', 'sbml_integrator', 'time_course', 'param_scan', 'mutant',
-                'models', 'exp_data'}
+                'models', 'exp_data', 'persistent_sbml_runner'}
         would_crash = {'refine', 'bootstrap'}
 
         for k in conf_dict:
@@ -262,7 +274,7 @@ class Configuration(object):
         """
         # Check keys that only work for a subset of the 4 algorithms
         if conf_dict['fit_type'] != 'pt':
-            for k in ['exchange_every', 'reps_per_beta']:
+            for k in ['exchange_every', 'reps_per_beta', 'async_exchange']:
                 if k in conf_dict:
                     print1('Warning: Configuration key %s is not used in fit_type %s, so I am ignoring it'
                            % (k, conf_dict['fit_type']))
@@ -276,10 +288,18 @@ class Configuration(object):
                     print1('Warning: Configuration key %s is not used in fit_type %s, so I am ignoring it'
                            % (k, conf_dict['fit_type']))
         if conf_dict['fit_type'] == 'sa':
-            for k in ['burn_in', 'sample_every', 'output_hist_every', 'hist_bins', 'credible_intervals']:
+            for k in ['burn_in', 'sample_every', 'output_hist_every', 'hist_bins', 'credible_intervals',
+                      'save_samples_txt', 'stop_rhat', 'stop_ess']:
+                if k in conf_dict:
+                    print1('Warning: Configuration key %s is not used in fit_type %s, so I am ignoring it'
+                           % (k, conf_dict['fit_type']))
+        if conf_dict['fit_type'] == 'dream':
+            for k in ['adaptive_proposal', 'adaptive_start', 'target_acceptance']:
                 if k in conf_dict:
                     print1('Warning: Configuration key %s is not used in fit_type %s, so I am ignoring it'
                            % (k, conf_dict['fit_type']))
+        if conf_dict.get('target_acceptance') is not None and not 0. < conf_dict['target_acceptance'] < 1.:
+            raise PybnfError('target_acceptance must be between 0 and 1')
         if conf_dict['fit_type'] in ['mh', 'sa', 'pt']:
             for k in ['crossover_numer', 'zeta', 'lambda', 'gamma_prob']:
                 if k in conf_dict:
@@ -383,6 +403,7 @@ class Configuration(object):
                         model = SbmlModelNoTimeout(mf, self._absolute(mf), save_files=save_flag, integrator=self.config['sbml_integrator'])
                     else:
                         model = SbmlModel(mf, self._absolute(mf), save_files=save_flag, integrator=self.config['sbml_integrator'])
+                        model.persistent = bool(self.config['persistent_sbml_runner'])
                 else:
                     # Should not get here - should be caught in parsing
                     raise ValueError('Unrecognized model suffix in %s' % mf)
@@ -162,14 +162,34 @@ class Data(object):
         self.cols = {header[i].strip('[]'): i for i in range(len(header))}
 
     def _read_file_lines(self, lines, sep, file_name=''):
-        """Helper function that reads lines from BNGL gdat files"""
+        """
+        Helper function that reads lines from BNGL gdat files
+
+        The header is parsed once, and for whitespace-separated files the numeric body is converted in bulk. If the
+        bulk conversion fails, the body is re-read line by line, which reports the first malformed line.
+        """
+        ncols = self._read_header(lines[0], sep)
+        if sep == '\s+':
+            data = self._read_body_bulk(lines[1:], ncols)
+            if data is not None:
+                return data
+        return self._read_body_lines(lines[1:], sep, ncols, file_name)
+
+    def _read_header(self, line, sep):
+        """
+        Sets up the column names from the header line of a data file
 
-        header = re.split(sep, lines[0].strip().strip('#').strip())
+        :param line: The header line
+        :type line: str
+        :param sep: Regular expression that separates columns
+        :type sep: str
+        :return: int, the number of columns
+        """
+        header = re.split(sep, line.strip().strip('#').strip())
         # Ignore parentheses added to functions in BNG 2.3, and [] added to species names in COPASI
         header = [h.strip('()[]') for h in header]
         if header[0] == 'Time':
             header[0] = 'time'  # Allow either capitalization because Copasi uses capital, BNG uses lowercase
-        ncols = len(header)
         self.indvar = header[0]
 
         self.cols = dict()
@@ -180,9 +200,39 @@ class Data(object):
                 raise DuplicateColumnError('Data file contains duplicate column name "%s"' % c)
             self.cols[c] = l
             self.headers[l] = c
+        return len(header)
 
+    @staticmethod
+    def _read_body_bulk(lines, ncols):
+        """
+        Converts the whitespace-separated body of a data file into an array in a single NumPy call.
+
+        :param lines: Lines of the file after the header
+        :param ncols: Expected number of values on each line
+        :return: 2D numpy array, or None if any line is malformed
+        """
+        rows = [l.split() for l in lines]
+        # Skip blank lines and comment lines
+        rows = [r for r in rows if r and r[0][0] != '#']
+        if any(len(r) != ncols for r in rows):
+            return None
+        try:
+            return np.array(rows, dtype=float)
+        except ValueError:
+            return None
+
+    def _read_body_lines(self, lines, sep, ncols, file_name=''):
+        """
+        Reads the body of a data file one line at a time, raising a PybnfError that identifies the first malformed line
+
+        :param lines: Lines of the file after the header
+        :param sep: Regular expression that separates columns
+        :param ncols: Expected number of values on each line
+        :param file_name: Name of the file, used in error messages
+        :return: numpy array
+        """
         data = []
-        for i, l in enumerate(lines[1:]):
+        for i, l in enumerate(lines):
             if re.match('^\s*$', l) or re.match('\s*#', l):
                 continue
             try:
@@ -12,10 +12,14 @@ class ObjectiveCalculator:
     Contains the objective function, exp_data_dict, and constraint tuple
     """
 
-    def __init__(self, objective, exp_data_dict, constraints):
+    def __init__(self, objective, exp_data_dict, constraints, keep_outputs=False):
         self.objective = objective
         self.exp_data_dict = exp_data_dict
         self.constraints = constraints
+        # Whether Jobs should return the AlignedOutputs of each simulation along with its objective value
+        self.keep_outputs = keep_outputs
+        # Simulation row numbers matching each exp row, reused while the simulation grid stays the same
+        self.row_cache = RowIndexCache()
 
     def evaluate_objective(self, sim_data_dict, show_warnings=True):
         """
@@ -25,7 +29,96 @@ class ObjectiveCalculator:
         :type show_warnings: bool
         :return:
         """
-        return self.objective.evaluate_multiple(sim_data_dict, self.exp_data_dict, self.constraints, show_warnings)
+        return self.objective.evaluate_multiple(sim_data_dict, self.exp_data_dict, self.constraints, show_warnings,
+                                                row_cache=self.row_cache)
+
+    def evaluate_outputs(self, sim_data_dict, show_warnings=True):
+        """
+        Like evaluate_objective(), but also returns the AlignedOutputs of the simulated data
+        :return: Tuple (objective value or None, AlignedOutputs)
+        """
+        outputs = self.objective.aligned_outputs(sim_data_dict, self.exp_data_dict, self.constraints, show_warnings,
+                                                 row_cache=self.row_cache)
+        return self.objective.evaluate_outputs(outputs, self.exp_data_dict), outputs
+
+
+class AlignedOutputs(object):
+    """
+    The part of a simulation's output that the objective function uses: for each experimental data set, the simulated
+    values aligned with its rows and compared columns, and the total constraint penalty. This is enough to score the
+    simulation again when the weights of the experimental data change (e.g. for a bootstrap replicate), and is usually
+    much smaller than the simulated Data.
+    """
+
+    def __init__(self, values, penalty):
+        """
+        :param values: Dictionary mapping (model name, suffix) to a tuple (list of compared column names, 2D array of
+        simulated values with one row per experimental row and one column per compared column)
+        :type values: dict
+        :param penalty: Total penalty of the constraints
+        :type penalty: float
+        """
+        self.values = values
+        self.penalty = penalty
+
+    @property
+    def nbytes(self):
+        """Approximate memory used, in bytes"""
+        return 64 + sum(100 + sim_vals.nbytes for _, sim_vals in self.values.values())
+
+
+class RowIndexCache:
+    """
+    Cache of the mapping from experimental data rows to simulation data rows.
+
+    Within a fit, the simulated independent variable is usually the same from job to job, so the mapping only needs to
+    be searched for once. Entries are keyed by a fingerprint of the simulated and experimental independent variable
+    columns, so a simulation on a different grid (for example, an adaptive SSA output) is looked up again and added to
+    the cache.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        :param max_size: Maximum number of grids to remember. When full, the oldest entry is discarded.
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.index = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(col):
+        """
+        Compact identifier for the contents of a 1D array
+        """
+        col = np.ascontiguousarray(col)
+        return col.shape[0], hash(col.tobytes())
+
+    def sim_rows(self, objective, sim_col, exp_col, indvar, show_warnings=True):
+        """
+        Return the simulation row corresponding to each experimental row, computing it with objective.sim_rows() only
+        if this pair of grids has not been seen before.
+
+        :param objective: The SummationObjective doing the evaluation
+        :param sim_col: Array of the independent variable in the simulation data
+        :param exp_col: Array of the independent variable in the experimental data
+        :param indvar: Name of the independent variable
+        :param show_warnings: If True, print warnings about poorly matched rows
+        :return: Integer array of simulation row numbers, one per experimental row
+        """
+        key = (indvar, self.fingerprint(sim_col), self.fingerprint(exp_col))
+        rows = self.index.get(key)
+        if rows is not None:
+            self.hits += 1
+            return rows
+        self.misses += 1
+        rows = objective.sim_rows(sim_col, exp_col, indvar, show_warnings)
+        if len(self.index) >= self.max_size:
+            # Dicts preserve insertion order, so this is the oldest entry
+            del self.index[next(iter(self.index))]
+        self.index[key] = rows
+        return rows
 
 
 
@@ -36,7 +129,7 @@ class ObjectiveFunction(object):
     The base class includes all the support we need for constraints.
     """
 
-    def evaluate_multiple(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True):
+    def evaluate_multiple(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True, row_cache=None):
         """
         Compute the value of the objective function on several data sets, and return the total.
         Optionally may pass an iterable of ConstraintSets whose penalties will be added to the total
@@ -50,6 +143,8 @@ class ObjectiveFunction(object):
         :type constraints: Iterable of ConstraintSet
         :param show_warnings: If True, print warnings about unused data
         :type show_warnings: bool
+        :param row_cache: Optional cache of the exp-to-sim row mapping, reused across calls
+        :type row_cache: RowIndexCache
         :return:
         """
         with np.errstate(all='ignore'):  # Suppress numpy warnings printed to terminal
@@ -67,7 +162,7 @@ class ObjectiveFunction(object):
                         # Need to check for that here.
                         if suffix in exp_data_dict[model]:
                             val = self.evaluate(sim_data_dict[model][suffix], exp_data_dict[model][suffix],
-                                                show_warnings=show_warnings)
+                                                show_warnings=show_warnings, row_cache=row_cache)
                             if val is None:
                                 return None
                             total += val
@@ -76,7 +171,7 @@ class ObjectiveFunction(object):
 
                 return total
 
-    def evaluate(self, sim_data, exp_data, show_warnings=True):
+    def evaluate(self, sim_data, exp_data, show_warnings=True, row_cache=None):
         """
         :param sim_data: A Data object containing simulated data
         :type sim_data: Data
@@ -85,15 +180,50 @@ class ObjectiveFunction(object):
         :return: float, value of the objective function, with a lower value indicating a better fit.
         :param show_warnings: If True, print warnings about unused data
         :type show_warnings: bool
+        :param row_cache: Optional cache of the exp-to-sim row mapping
+        :type row_cache: RowIndexCache
         """
         raise NotImplementedError("Subclasses must override evaluate()")
 
+    def aligned_outputs(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True, row_cache=None):
+        """
+        Extract the AlignedOutputs of the simulated data, from which evaluate_outputs() computes the same value as
+        evaluate_multiple(). Arguments are as in evaluate_multiple().
+
+        :return: AlignedOutputs
+        """
+        raise NotImplementedError("Subclasses must override aligned_outputs()")
+
+    def evaluate_outputs(self, outputs, exp_data_dict):
+        """
+        Compute the value of the objective function from AlignedOutputs, using the current weights of the experimental
+        data
+
+        :param outputs: The AlignedOutputs of a simulation
+        :type outputs: AlignedOutputs
+        :param exp_data_dict: Dictionary of the form {modelname: {suffix1: Data1}} containing experimental Data objects
+        :type exp_data_dict: dict
+        :return: float, or None if the simulation gave NaN or Inf at a data point
+        """
+        total = outputs.penalty
+        for (model, suffix), (col_names, sim_vals) in outputs.values.items():
+            val = self.evaluate_aligned(sim_vals, exp_data_dict[model][suffix], col_names)
+            if val is None:
+                return None
+            total += val
+        return total
+
 
 class SummationObjective(ObjectiveFunction):
     """
     Represents a type of objective function in which we perform some kind of summation over all available experimental
     data points.
     Currently, this describes all objective functions in PyBNF.
+
+    The summation is evaluated on whole arrays: the simulation rows matching each experimental row are located in one
+    pass, the compared columns are gathered into arrays aligned with the experimental data, and the subclass computes
+    all of its point values at once in eval_array(). The original point-by-point summation is kept as
+    evaluate_pointwise(), which uses eval_point() and serves as the reference implementation.
     """
 
     def __init__(self, ind_var_rounding=0):
@@ -101,7 +231,7 @@ class SummationObjective(ObjectiveFunction):
         self.warned = set()
         self.rounding = ind_var_rounding
 
-    def evaluate(self, sim_data, exp_data, show_warnings=True):
+    def evaluate(self, sim_data, exp_data, show_warnings=True, row_cache=None):
         """
         :param sim_data: A Data object containing simulated data
         :type sim_data: Data
@@ -109,20 +239,84 @@ class SummationObjective(ObjectiveFunction):
         :type exp_data: Data
         :param show_warnings: If True, print warnings about unused data
         :type show_warnings: bool
+        :param row_cache: Optional cache of the exp-to-sim row mapping. If given, the row search is skipped when the
+        simulation grid matches a previous call.
+        :type row_cache: RowIndexCache
         :return: float, value of the objective function, with a lower value indicating a better fit.
         """
+        col_names, sim_vals = self._align(sim_data, exp_data, show_warnings, row_cache)
+        if sim_vals.shape[0] == 0:
+            return 0.
+        return self.evaluate_aligned(sim_vals, exp_data, col_names)
 
-        indvar = min(exp_data.cols, key=exp_data.cols.get)  # Get the name of column 0, the independent variable
+    def _align(self, sim_data, exp_data, show_warnings, row_cache):
+        """
+        Gather the simulated values to compare with exp_data
+        :return: 2-tuple (list of compared column names, 2D array of simulated values aligned with exp_data)
+        """
+        indvar, compare_cols = self._compare_columns(sim_data, exp_data, show_warnings)
+        col_names = sorted(compare_cols)
+        if exp_data.data.shape[0] == 0:
+            return col_names, np.zeros((0, len(col_names)))
+        if row_cache is None:
+            sim_rows = self.sim_rows(sim_data[indvar], exp_data.data[:, 0], indvar, show_warnings)
+        else:
+            sim_rows = row_cache.sim_rows(self, sim_data[indvar], exp_data.data[:, 0], indvar, show_warnings)
+        return col_names, self.aligned_sim_values(sim_data, sim_rows, col_names)
+
+    def aligned_outputs(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True, row_cache=None):
+        if not sim_data_dict:
+            return AlignedOutputs(dict(), np.inf)
+        values = dict()
+        for model in sim_data_dict:
+            for suffix in sim_data_dict[model]:
+                if suffix in exp_data_dict[model]:
+                    values[model, suffix] = self._align(sim_data_dict[model][suffix], exp_data_dict[model][suffix],
+                                                        show_warnings, row_cache)
+        with np.errstate(all='ignore'):
+            penalty = 0.
+            for cset in constraints:
+                penalty += cset.total_penalty(sim_data_dict)
+        return AlignedOutputs(values, penalty)
+
+    def evaluate_aligned(self, sim_vals, exp_data, col_names):
+        """
+        Evaluate the objective function from simulation values that have already been aligned with the experimental
+        data.
 
-        compare_cols = set(exp_data.cols).intersection(set(sim_data.cols))  # Set of columns to compare
-        # Warn if experiment columns are going unused
-        if show_warnings:
-            self._check_columns(exp_data.cols, compare_cols)
-        try:
-            compare_cols.remove(indvar)
-        except KeyError:
-            raise PybnfError('The independent variable "%s" in your exp file was not found in the simulation data.'
-                             % indvar)
+        :param sim_vals: 2D array with one row per row of exp_data and one column per entry of col_names, containing
+        the simulated value to compare with each experimental point
+        :type sim_vals: np.ndarray
+        :param exp_data: A Data object containing experimental data
+        :type exp_data: Data
+        :param col_names: Names of the compared columns, in the order of the columns of sim_vals
+        :type col_names: list
+        :return: float, value of the objective function, or None if the simulation gave NaN or Inf at a data point
+        """
+        exp_cols = np.array([exp_data.cols[c] for c in col_names], dtype=int)
+        exp_vals = exp_data.data[:, exp_cols]
+        # Experimental points recorded as NaN are missing data, and are skipped
+        used = ~np.isnan(exp_vals)
+        if not np.all(np.isfinite(sim_vals[used])):
+            return None
+        with np.errstate(all='ignore'):
+            point_vals = self.eval_array(sim_vals, exp_vals, exp_data, col_names)
+            return float(np.sum(point_vals[used] * exp_data.weights[:, exp_cols][used]))
+
+    def evaluate_pointwise(self, sim_data, exp_data, show_warnings=True):
+        """
+        Reference implementation of evaluate() that loops over the data one point at a time using eval_point()
+
+        :param sim_data: A Data object containing simulated data
+        :type sim_data: Data
+        :param exp_data: A Data object containing experimental data
+        :type exp_data: Data
+        :param show_warnings: If True, print warnings about unused data
+        :type show_warnings: bool
+        :return: float, value of the objective function, with a lower value indicating a better fit.
+        """
+
+        indvar, compare_cols = self._compare_columns(sim_data, exp_data, show_warnings)
 
         func_value = 0.0
         # Iterate through rows of experimental data
@@ -142,11 +336,7 @@ class SummationObjective(ObjectiveFunction):
                 # Warn if there was really nothing close
                 diff = abs(sim_data[indvar][sim_row] - exp_data.data[rownum, 0])
                 if diff > 1. and diff / exp_data.data[rownum, 0] > 0.1:
-                    warnstr = indvar + str(exp_data.data[rownum, 0])  # An identifier so we only print the warning once
-                    if show_warnings and warnstr not in self.warned:
-                        print1("Warning: For exp point %s=%s, used sim data at %s=%s" %
-                               (indvar, exp_data.data[rownum, 0], indvar, sim_data[indvar][sim_row]))
-                        self.warned.add(warnstr)
+                    self._warn_rounding(indvar, exp_data.data[rownum, 0], sim_data[indvar][sim_row], show_warnings)
             else:
                 raise PybnfError('Possible values for ind_var_rounding are 0 or 1.')
 
@@ -163,11 +353,109 @@ class SummationObjective(ObjectiveFunction):
 
         return func_value
 
+    def _compare_columns(self, sim_data, exp_data, show_warnings):
+        """
+        Determine the independent variable and the set of columns to compare between sim_data and exp_data
+        :return: 2-tuple (name of the independent variable, set of compared column names)
+        """
+        indvar = min(exp_data.cols, key=exp_data.cols.get)  # Get the name of column 0, the independent variable
+
+        compare_cols = set(exp_data.cols).intersection(set(sim_data.cols))  # Set of columns to compare
+        # Warn if experiment columns are going unused
+        if show_warnings:
+            self._check_columns(exp_data.cols, compare_cols)
+        try:
+            compare_cols.remove(indvar)
+        except KeyError:
+            raise PybnfError('The independent variable "%s" in your exp file was not found in the simulation data.'
+                             % indvar)
+        return indvar, compare_cols
+
+    def sim_rows(self, sim_col, exp_col, indvar, show_warnings=True):
+        """
+        Find the row of the simulation data corresponding to each row of the experimental data.
+
+        When the simulated independent variable is sorted (as it is for time courses and parameter scans), all rows
+        are located at once with a binary search. Otherwise, each row is located by a linear scan.
+
+        :param sim_col: Array of the independent variable in the simulation data
+        :param exp_col: Array of the independent variable in the experimental data
+        :param indvar: Name of the independent variable, used in messages
+        :param show_warnings: If True, print warnings about poorly matched rows
+        :return: Integer array of simulation row numbers, one per experimental row
+        """
+        if self.rounding not in (0, 1):
+            raise PybnfError('Possible values for ind_var_rounding are 0 or 1.')
+        n = len(sim_col)
+        is_sorted = n > 0 and np.all(sim_col[1:] >= sim_col[:-1])
+
+        if self.rounding == 0:
+            if is_sorted:
+                # The first entry that np.isclose() (rtol=1e-5, atol=0) would accept for each exp value
+                rows = np.searchsorted(sim_col, exp_col - 1e-5 * np.abs(exp_col), side='left')
+                rows = np.minimum(rows, n - 1)
+            else:
+                rows = np.array([np.argmax(np.isclose(sim_col, x, atol=0.)) for x in exp_col], dtype=int)
+            found = np.isclose(sim_col[rows], exp_col, atol=0.)
+            if not np.all(found):
+                missing = exp_col[np.argmin(found)]
+                raise PybnfError('Experimental data includes %s=%s, but that %s is not in the simulation output. '
+                                 % (indvar, missing, indvar))
+        else:
+            if is_sorted and n > 1:
+                # Closest entry is either just above or just below each exp value. On ties, argmin would take the
+                # lower index, so we do too.
+                hi = np.clip(np.searchsorted(sim_col, exp_col, side='left'), 1, n - 1)
+                lo = hi - 1
+                rows = np.where(abs(sim_col[hi] - exp_col) < abs(sim_col[lo] - exp_col), hi, lo)
+            else:
+                rows = np.array([np.argmin(abs(sim_col - x)) for x in exp_col], dtype=int)
+            # Warn if there was really nothing close
+            with np.errstate(all='ignore'):
+                diffs = abs(sim_col[rows] - exp_col)
+                far = (diffs > 1.) & (diffs / exp_col > 0.1)
+            for i in np.nonzero(far)[0]:
+                self._warn_rounding(indvar, exp_col[i], sim_col[rows[i]], show_warnings)
+        return rows
+
+    @staticmethod
+    def aligned_sim_values(sim_data, sim_rows, col_names):
+        """
+        Gather the simulated values to compare with the experimental data into a 2D array
+        :param sim_data: A Data object containing simulated data
+        :param sim_rows: Array of simulation row numbers, one per experimental row
+        :param col_names: Names of the compared columns
+        :return: 2D array of shape (len(sim_rows), len(col_names))
+        """
+        sim_cols = np.array([sim_data.cols[c] for c in col_names], dtype=int)
+        return sim_data.data[np.ix_(sim_rows, sim_cols)]
+
+    def _warn_rounding(self, indvar, exp_x, sim_x, show_warnings):
+        warnstr = indvar + str(exp_x)  # An identifier so we only print the warning once
+        if show_warnings and warnstr not in self.warned:
+            print1("Warning: For exp point %s=%s, used sim data at %s=%s" % (indvar, exp_x, indvar, sim_x))
+            self.warned.add(warnstr)
+
+    def eval_array(self, sim_vals, exp_vals, exp_data, col_names):
+        """
+        Calculate the objective function for every point in the data at once
+
+        This evaluation is what differentiates the different objective functions. It must agree with eval_point()
+
+        :param sim_vals: 2D array of simulated values, aligned with exp_vals
+        :param exp_vals: 2D array of experimental values, with one row per row of exp_data and one column per entry of
+        col_names. Missing data is NaN; the value computed at those points is discarded.
+        :param exp_data: The experimental Data object
+        :param col_names: Names of the compared columns, in the order of the columns of sim_vals and exp_vals
+        :return: 2D array of unweighted point values with the same shape as exp_vals
+        """
+        raise NotImplementedError('Subclasses of SummationObjective must override eval_array')
+
     def eval_point(self, sim_data, exp_data, sim_row, exp_row, col_name):
         """
         Calculate the objective function for a single point in the data
 
-        This evaluation is what differentiates the different objective functions.
+        This is the reference version of eval_array(), used by evaluate_pointwise()
 
         :param sim_data: The simulation Data object
         :param exp_data: The experimental Data object
@@ -193,19 +481,27 @@ class SummationObjective(ObjectiveFunction):
 
 class ChiSquareObjective(SummationObjective):
 
+    def eval_array(self, sim_vals, exp_vals, exp_data, col_names):
+        sd_cols = np.array([self._sd_column(exp_data, c) for c in col_names], dtype=int)
+        exp_sigma = exp_data.data[:, sd_cols]
+        return 1. / (2. * exp_sigma ** 2.) * (sim_vals - exp_vals) ** 2.
+
     def eval_point(self, sim_data, exp_data, sim_row, exp_row, col_name):
         sim_val = sim_data.data[sim_row, sim_data.cols[col_name]]
         exp_val = exp_data.data[exp_row, exp_data.cols[col_name]]
+        exp_sigma = exp_data.data[exp_row, self._sd_column(exp_data, col_name)]
+        return 1. / (2. * exp_sigma ** 2.) * (sim_val - exp_val) ** 2.
+
+    @staticmethod
+    def _sd_column(exp_data, col_name):
         try:
             # Todo: Check for this and throw the error before all the workers get created.
-            sd_col = exp_data.cols[col_name + '_SD']
+            return exp_data.cols[col_name + '_SD']
         except KeyError:
             raise PybnfError('Column %s_SD not found' % col_name,
                  "Column %s_SD was not found in the experimental data. When using the chi_sq objective function, your "
                  "data file must include a _SD column corresponding to each experimental variable, giving the standard "
                  "deviations of that variable. " % col_name)
-        exp_sigma = exp_data.data[exp_row, sd_col]
-        return 1. / (2. * exp_sigma ** 2.) * (sim_val - exp_val) ** 2.
 
     def  _check_columns(self, exp_cols, compare_cols):
         """
@@ -222,6 +518,9 @@ class ChiSquareObjective(SummationObjective):
 
 class SumOfSquaresObjective(SummationObjective):
 
+    def eval_array(self, sim_vals, exp_vals, exp_data, col_names):
+        return (sim_vals - exp_vals) ** 2.
+
     def eval_point(self, sim_data, exp_data, sim_row, exp_row, col_name):
 
         sim_val = sim_data.data[sim_row, sim_data.cols[col_name]]
@@ -230,6 +529,9 @@ class SumOfSquaresObjective(SummationObjective):
 
 class SumOfDiffsObjective(SummationObjective):
 
+    def eval_array(self, sim_vals, exp_vals, exp_data, col_names):
+        return abs(sim_vals - exp_vals)
+
     def eval_point(self, sim_data, exp_data, sim_row, exp_row, col_name):
 
         sim_val = sim_data.data[sim_row, sim_data.cols[col_name]]
@@ -240,6 +542,9 @@ class NormSumOfSquaresObjective(SummationObjective):
     """
     Sum of squares where each point is normalized by the y value at that point, ((y-y')/y)^2
     """
+    def eval_array(self, sim_vals, exp_vals, exp_data, col_names):
+        return ((sim_vals - exp_vals) / exp_vals) ** 2.
+
     def eval_point(self, sim_data, exp_data, sim_row, exp_row, col_name):
 
         sim_val = sim_data.data[sim_row, sim_data.cols[col_name]]
@@ -252,10 +557,13 @@ class AveNormSumOfSquaresObjective(SummationObjective):
     Sum of squares where each point is normalized by the average value of that variable,
     ((y-y')/ybar)^2
     """
-    def evaluate(self, sim_data, exp_data, show_warnings=True):
+    def evaluate_pointwise(self, sim_data, exp_data, show_warnings=True):
         # Precalculate the average of each exp column to use for all points in this call.
         self.aves = {name: np.average(exp_data[name]) for name in exp_data.cols}
-        return super().evaluate(sim_data, exp_data, show_warnings)
+        return super().evaluate_pointwise(sim_data, exp_data, show_warnings)
+
+    def eval_array(self, sim_vals, exp_vals, exp_data, col_names):
+        return ((sim_vals - exp_vals) / np.average(exp_vals, axis=0)) ** 2.
 
     def eval_point(self, sim_data, exp_data, sim_row, exp_row, col_name):
         sim_val = sim_data.data[sim_row, sim_data.cols[col_name]]
@@ -269,7 +577,7 @@ class ConstraintCounter(ObjectiveFunction):
     Used only in model checking
     """
 
-    def evaluate_multiple(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True):
+    def evaluate_multiple(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True, row_cache=None):
         """
         Count the number constraints that are not satisfied by the simulation data.
         Experimental (quantitative) data is ignored
@@ -279,5 +587,8 @@ class ConstraintCounter(ObjectiveFunction):
             total += cset.number_failed(sim_data_dict)
         return total
 
-    def evaluate(self, sim_data, exp_data, show_warnings=True):
-        raise NotImplementedError("ConstraintCounter does not implement evaluate()")
\ No newline at end of file
+    def evaluate(self, sim_data, exp_data, show_warnings=True, row_cache=None):
+        raise NotImplementedError("ConstraintCounter does not implement evaluate()")
+
+    def aligned_outputs(self, sim_data_dict, exp_data_dict, constraints=(), show_warnings=True, row_cache=None):
+        return AlignedOutputs(dict(), self.evaluate_multiple(sim_data_dict, exp_data_dict, constraints))
\ No newline at end of file
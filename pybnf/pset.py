@@ -7,14 +7,21 @@ import logging
 import numpy as np
 import re
 import copy
-from subprocess import run, STDOUT, PIPE, DEVNULL
+from subprocess import run, Popen, STDOUT, PIPE, DEVNULL, TimeoutExpired, CalledProcessError
 from .data import Data
 import heapq
+from collections import OrderedDict
+from itertools import islice
 import traceback
 import roadrunner as rr
 import pickle
 from os.path import abspath, dirname, join, isfile
 import os
+import time
+import threading
+import select
+import struct
+import atexit
 from sys import executable
 
 ROOT_DIRECTORY = join(dirname(abspath(__file__)), '..')
@@ -22,6 +29,14 @@ rr.Logger.disableLogging()
 
 logger = logging.getLogger(__name__)
 
+# Idle compiled RoadRunner instances in this process, keyed by (absolute model path, integrator)
+_runner_cache = dict()
+_runner_cache_lock = threading.Lock()
+
+# Idle persistent sbml_runner.py processes started by this process, used by SbmlModel
+_sbml_processes = []
+_sbml_processes_lock = threading.Lock()
+
 
 class Model(object):
     """
@@ -341,14 +356,7 @@ class BNGLModel(Model):
         file = '%s/%s' % (folder, filename)
         self.save(file)
 
-        # Run BioNetGen
-        cmd = [self.bng_command, '%s.bngl' % file, '--outdir', folder]
-        log_file = '%s.log' % file
-        if os.name == 'nt':  # Windows
-            # Explicitly call perl because the #! line in BNG2.pl is not supported.
-            cmd = ['perl'] + cmd
-        with open(log_file, 'w') as lf:
-            run(cmd, check=True, stderr=STDOUT, stdout=lf, timeout=timeout)
+        self._simulate(folder, filename, timeout)
 
         # Load the data file(s)
         ds = self._load_simdata(folder, filename)
@@ -364,6 +372,23 @@ class BNGLModel(Model):
                 logger.debug('Finished mutant %s' % mut.suffix)
         return ds
 
+    def _simulate(self, folder, filename, timeout):
+        """
+        Run BioNetGen on the saved model file
+
+        :param folder: Folder containing the saved model, where outputs are written
+        :param filename: Name of the saved model, without extension
+        :param timeout: Time limit in seconds
+        """
+        file = '%s/%s' % (folder, filename)
+        cmd = [self.bng_command, '%s.bngl' % file, '--outdir', folder]
+        log_file = '%s.log' % file
+        if os.name == 'nt':  # Windows
+            # Explicitly call perl because the #! line in BNG2.pl is not supported.
+            cmd = ['perl'] + cmd
+        with open(log_file, 'w') as lf:
+            run(cmd, check=True, stderr=STDOUT, stdout=lf, timeout=timeout)
+
     def _get_mutant_model(self, mut):
         """
         Creates a copy of the model, with the parameter set changed as specified by MutationSet mut
@@ -412,6 +437,8 @@ class BNGLModel(Model):
         # Config actions are assumed to be independent, so need to reset concentrations before each one.
         self.actions.append('resetConcentrations()')
         self.actions.append(line)
+        if action.method != 'ode':
+            self.stochastic = True
         self.generates_network = True
         if self.generate_network_line is None:
             self.generate_network_line = 'generate_network({overwrite=>1})'
@@ -431,6 +458,10 @@ class BNGLModel(Model):
 
 
 class NetModel(BNGLModel):
+    # simulate() arguments that can be passed to run_network directly, with the BNG defaults
+    direct_defaults = {'t_start': 0., 'atol': 1e-8, 'rtol': 1e-8, 'sparse': 0, 'steady_state': 0, 'print_CDAT': 1,
+                       'print_functions': 0, 'n_steps': 1, 'seed': None}
+
     def __init__(self, name, acts, suffs, mutants, ls=None, nf=None):
         self.name = name
         self.actions = acts
@@ -439,15 +470,68 @@ class NetModel(BNGLModel):
         self.mutants = mutants
         self.param_set = None
         self.bng_command = ''
+        # If True, simulate by calling run_network on the .net file, instead of running BNG2.pl, whenever the actions
+        # allow it.
+        self.direct = False
+        # self.actions as parsed by parse_direct_actions(), or [] if they require BNG2.pl. Parsed by set_direct() on
+        # the model that is copied for each job, so that the copies share the result; otherwise parsed lazily.
+        self._direct_actions = None
 
         if not (ls or nf):
             raise ModelError("Must specify a file name or a list of strings corresponding to the .net file's lines")
         elif ls:
-            self.netfile_lines = ls
+            self.netfile_text = ''.join(ls)
         else:
             self.file_name = nf
             with open(self.file_name) as f:
-                self.netfile_lines = f.readlines()
+                self.netfile_text = f.read()
+        # Compiled once here, and shared by all copies of this model
+        self._template = self._compile_template(self.netfile_text)
+        # Text substituted into the template so far, by parameter name, so copies of copies keep earlier values
+        self._substituted = dict()
+
+    @property
+    def netfile_lines(self):
+        return self.netfile_text.splitlines(keepends=True)
+
+    @staticmethod
+    def _compile_template(text):
+        """
+        Split the text of a .net file around the value of each numerical parameter, so a copy with new parameter
+        values can be built with a single join.
+
+        :param text: Contents of the .net file
+        :type text: str
+        :return: 2-tuple (fragments, slots). fragments is a list of the text between parameter values, and slots is a
+        list of (parameter name, original text) tuples, where the original text is the rest of the line starting at
+        the value. fragments has one more entry than slots.
+        """
+        fragments = []
+        slots = []
+        current = []
+        in_params_block = False
+        lines = text.splitlines(keepends=True)
+        for i, l in enumerate(lines):
+            if not in_params_block:
+                current.append(l)
+                if re.match('begin\s+parameters', l.strip()):
+                    in_params_block = True
+                continue
+            if re.match('end\s+parameters', l.strip()):
+                # Nothing else to substitute in the rest of the file
+                current += lines[i:]
+                break
+            m = re.match('(\s+)(\d+)\s+([A-Za-z_]\w*)(\s+)([-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)(?=\s+)', l)
+            if m:
+                prefix = '%s%s %s%s' % (m.group(1), m.group(2), m.group(3), m.group(4))
+                current.append(prefix)
+                fragments.append(''.join(current))
+                current = []
+                slots.append((m.group(3), l[m.start(5):]))
+            else:
+                current.append(l)
+        fragments.append(''.join(current))
+        return fragments, slots
 
     def copy_with_param_set(self, pset):
         """
@@ -457,30 +541,153 @@ class NetModel(BNGLModel):
         :type pset: PSet
         :return: NetModel
         """
-        lines_copy = copy.deepcopy(self.netfile_lines)
-        in_params_block = False
-        for i, l in enumerate(lines_copy):
-            if re.match('begin\s+parameters', l.strip()):
-                in_params_block = True
-            elif re.match('end\s+parameters', l.strip()):
-                in_params_block = False
-            elif in_params_block:
-                m = re.match('(\s+)(\d+)\s+([A-Za-z_]\w*)(\s+)([-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)(?=\s+)', l)
-                if m:
-                    if m.group(3) in pset.keys():
-                        lines_copy[i] = '%s%s %s%s%s\n' % (m.group(1), m.group(2), m.group(3), m.group(4), str(pset[m.group(3)]))
-
-        newmodel = NetModel(self.name, self.actions, self.suffixes, self.mutants, ls=lines_copy)
-        newmodel.bng_command = self.bng_command
+        fragments, slots = self._template
+        keys = set(pset.keys())
+        substituted = dict(self._substituted)
+        for name, original in slots:
+            if name in keys:
+                substituted[name] = '%s\n' % pset[name]
+        parts = [fragments[0]]
+        for (name, original), fragment in zip(slots, fragments[1:]):
+            parts.append(substituted.get(name, original))
+            parts.append(fragment)
+
+        newmodel = copy.copy(self)
+        newmodel.netfile_text = ''.join(parts)
         newmodel.param_set = pset
+        newmodel._substituted = substituted
         return newmodel
 
     def save(self, file_prefix):
         with open(file_prefix + '.net', 'w') as wf:
-            wf.write(''.join(self.netfile_lines))
+            wf.write(self.netfile_text)
         with open(file_prefix + '.bngl', 'w') as wf:
-            wf.write('readFile({file=>"%s"})\n' % (file_prefix + '.net'))
-            wf.write('begin actions\n\n%s\n\nend actions\n' % '\n'.join(self.actions))
+            wf.write('readFile({file=>"%s"})\nbegin actions\n\n%s\n\nend actions\n' %
+                     (file_prefix + '.net', '\n'.join(self.actions)))
+
+    def set_direct(self, direct):
+        """
+        Enable or disable simulation with run_network. When enabling, the actions are parsed here once, and copies made
+        by copy_with_param_set() share the parsed list.
+
+        :param direct: Whether to simulate with run_network when the actions allow it
+        :type direct: bool
+        """
+        self.direct = direct
+        self._direct_actions = (self.parse_direct_actions(self.actions) or []) if direct else None
+
+    def _simulate(self, folder, filename, timeout):
+        """
+        Run the simulations in the actions block on the saved .net file. If direct simulation is enabled and every
+        action can be expressed as a run_network command, call run_network for each one, skipping the startup of
+        BNG2.pl. Otherwise, run BNG2.pl as usual.
+        """
+        if not self.direct:
+            return super()._simulate(folder, filename, timeout)
+        if self._direct_actions is None:
+            self._direct_actions = self.parse_direct_actions(self.actions) or []
+        run_network = join(dirname(self.bng_command), 'bin', 'run_network.exe' if os.name == 'nt' else 'run_network')
+        if not self._direct_actions or not isfile(run_network):
+            return super()._simulate(folder, filename, timeout)
+
+        file = '%s/%s' % (folder, filename)
+        deadline = None if timeout is None else time.time() + timeout
+        with open('%s.log' % file, 'w') as lf:
+            for act in self._direct_actions:
+                cmd = self._run_network_command(run_network, file, act)
+                lf.write('full command: %s\n' % ' '.join(cmd))
+                lf.flush()
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise TimeoutExpired(cmd, timeout)
+                run(cmd, check=True, stderr=STDOUT, stdout=lf, timeout=remaining)
+
+    @staticmethod
+    def _run_network_command(run_network, file, act):
+        """
+        Build the run_network command line equivalent to a simulate() action, as BNG2.pl would
+
+        :param run_network: Path to the run_network executable
+        :param file: Path to the saved model, without extension
+        :param act: dict of simulate() arguments, as returned by parse_direct_actions()
+        :return: list of str
+        """
+        prefix = '%s_%s' % (file, act['suffix']) if act['suffix'] else file
+        cmd = [run_network, '-o', prefix, '-p', act['method']]
+        if act['method'] == 'ssa':
+            seed = act['seed'] if act['seed'] is not None else np.random.randint(2 ** 31)
+            cmd += ['-h', '%i' % seed]
+        else:
+            cmd += ['-a', repr(act['atol']), '-r', repr(act['rtol'])]
+            if act['sparse']:
+                cmd.append('-b')
+            if act['steady_state']:
+                cmd.append('-c')
+        cmd += ['--cdat', '%i' % act['print_CDAT'], '--fdat', '%i' % act['print_functions']]
+        if act['t_start'] != 0.:
+            cmd += ['-i', repr(act['t_start'])]
+        netfile = file + '.net'
+        cmd += ['-g', netfile, netfile, repr((act['t_end'] - act['t_start']) / act['n_steps']),
+                '%i' % act['n_steps']]
+        return cmd
+
+    @classmethod
+    def parse_direct_actions(cls, actions):
+        """
+        Translate a list of BNGL action lines into simulations that run_network can perform directly.
+
+        Only independent ODE and SSA time courses with literal arguments are supported: each simulate() after the
+        first must be preceded by resetConcentrations(), and no other actions may be present.
+
+        :param actions: List of lines from the actions block
+        :return: list of dicts of simulate() arguments, or None if the actions require BNG2.pl
+        """
+        direct = []
+        reset = True
+        for line in actions:
+            commenti = line.find('#')
+            line = (line if commenti == -1 else line[:commenti]).strip().rstrip(';').strip()
+            if line == '':
+                continue
+            if re.match('resetConcentrations\(\s*\)$', line):
+                reset = True
+                continue
+            m = re.match('simulate(_ode|_ssa)?\(\s*\{(.*)\}\s*\)$', line)
+            if not m or not reset:
+                return None
+            act = dict(cls.direct_defaults)
+            if m.group(1):
+                act['method'] = m.group(1)[1:]
+            argstr = m.group(2)
+            args = re.findall('(\w+)\s*=>\s*("[^"]*"|\'[^\']*\'|[^,]+)', argstr)
+            if re.sub('(\w+)\s*=>\s*("[^"]*"|\'[^\']*\'|[^,]+)', '', argstr).strip(', \t') != '':
+                return None
+            for k, v in args:
+                v = v.strip()
+                if k in ('method', 'suffix'):
+                    act[k] = v.strip('"\'')
+                    continue
+                if k == 'n_output_steps':
+                    k = 'n_steps'
+                if k not in cls.direct_defaults and k != 't_end':
+                    return None
+                try:
+                    act[k] = float(v.strip('"\''))
+                except ValueError:
+                    # An expression that only BNG can evaluate
+                    return None
+            if act.get('method') == 'ode':
+                act['method'] = 'cvode'
+            if act.get('method') not in ('cvode', 'ssa') or 't_end' not in act:
+                return None
+            for k in ('n_steps', 'print_CDAT', 'print_functions', 'sparse', 'steady_state'):
+                act[k] = int(act[k])
+            act.setdefault('suffix', None)
+            direct.append(act)
+            reset = False
+        return direct
 
 
 class SbmlModelNoTimeout(Model):
@@ -521,14 +728,42 @@ class SbmlModelNoTimeout(Model):
 
         self.species_names = set(runner.model.getFloatingSpeciesIds()).union(set(runner.model.getBoundarySpeciesIds()))
         self.param_names = self.species_names.union(set(runner.model.getGlobalParameterIds()))
+        self._release_runner(runner)
         logger.debug('Loaded model %s with Roadrunner' % self.name)
 
     def copy_with_param_set(self, pset):
-
-        newmodel = copy.deepcopy(self)
+        """
+        Returns a copy of the model with a new parameter set. Only the mutants are deep-copied, because applying a
+        Mutation records the value it replaced; everything else is shared with the original.
+        """
+        newmodel = copy.copy(self)
+        newmodel.actions = list(self.actions)
+        newmodel.suffixes = list(self.suffixes)
+        newmodel.mutants = copy.deepcopy(self.mutants)
         newmodel.param_set = pset
         return newmodel
 
+    def _acquire_runner(self):
+        """
+        Takes a compiled RoadRunner instance for this model from the per-process cache, reset to the state in which it
+        was loaded. A new instance is loaded only if none is idle.
+        """
+        key = (self.abs_file_path, self.integrator)
+        with _runner_cache_lock:
+            idle = _runner_cache.get(key)
+            runner = idle.pop() if idle else None
+        if runner is None:
+            logger.debug('Compiling a new RoadRunner instance for model %s' % self.name)
+            return rr.RoadRunner(self.abs_file_path)
+        runner.resetToOrigin()
+        return runner
+
+    def _release_runner(self, runner):
+        """Returns a RoadRunner instance taken with _acquire_runner() to the cache for use by later jobs"""
+        key = (self.abs_file_path, self.integrator)
+        with _runner_cache_lock:
+            _runner_cache.setdefault(key, []).append(runner)
+
     def model_text(self, mut=None):
         """
         Generates the XML text of the model, optionally applying the MutationSet mut
@@ -600,9 +835,14 @@ class SbmlModelNoTimeout(Model):
                 setattr(runner, mi.name, mi.undo())
 
     def execute(self, folder, filename, timeout):
-        # Load the original xml file with Roadrunner
-        runner = rr.RoadRunner(self.abs_file_path)
+        # Take a compiled instance of the original xml file, reset to its original state
+        runner = self._acquire_runner()
+        try:
+            return self._execute_runner(runner, folder, filename)
+        finally:
+            self._release_runner(runner)
 
+    def _execute_runner(self, runner, folder, filename):
         # Do parameter modifications
         self._modify_params(runner)
 
@@ -691,20 +931,126 @@ class SbmlModel(SbmlModelNoTimeout):
             raise PybnfError('The "wall_time_sim" option for SBML models does not work if PyBNF was installed through '
                              'PyPI (pip install pybnf). If you need this option, please install from the source code '
                              'on GitHub.')
+        self.persistent = False
 
     def execute(self, folder, filename, timeout):
         self.curr_folder = folder
         self.curr_file = filename
+        if self.persistent and os.name != 'nt':
+            return self._execute_persistent(timeout)
         arg = pickle.dumps(self)
         with open('%s/%s.log' % (folder, filename), 'w') as errout:
             proc_output = run([executable, ROOT_DIRECTORY + '/sbml_runner.py'], timeout=timeout, stdout=PIPE, check=True, input=arg, stderr=errout)
         result = pickle.loads(proc_output.stdout)
         return result
 
+    def _execute_persistent(self, timeout):
+        """
+        Runs the simulation in an idle persistent sbml_runner.py process, starting one if none is idle. A process that
+        times out or dies is discarded; otherwise it is returned to the pool for later jobs.
+        """
+        proc = None
+        with _sbml_processes_lock:
+            while _sbml_processes and proc is None:
+                proc = _sbml_processes.pop()
+                if not proc.alive():
+                    # Died while idle, for example killed for running out of memory
+                    logger.debug('Discarding exited persistent SBML runner process %i' % proc.proc.pid)
+                    proc = None
+        if proc is None:
+            proc = SbmlRunnerProcess()
+        try:
+            return proc.simulate(self, timeout)
+        finally:
+            if proc.alive():
+                with _sbml_processes_lock:
+                    _sbml_processes.append(proc)
+
     def super_execute(self):
         return super().execute(self.curr_folder, self.curr_file, None)
 
 
+class SbmlRunnerProcess(object):
+    """
+    A long-lived child process running sbml_runner.py in persistent mode, to which SbmlModel instances are sent one at
+    a time to be simulated. The child keeps its compiled RoadRunner instances between jobs, so enforcing a wall time
+    does not require starting a new interpreter and recompiling the model for every simulation.
+
+    Messages in both directions are pickles prefixed with their length.
+    """
+
+    header = struct.Struct('!Q')
+
+    def __init__(self):
+        self.proc = Popen([executable, ROOT_DIRECTORY + '/sbml_runner.py', '--persistent'], stdin=PIPE, stdout=PIPE,
+                          stderr=DEVNULL, bufsize=0)
+        logger.debug('Started persistent SBML runner process %i' % self.proc.pid)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+            self.proc.wait()
+
+    def simulate(self, model, timeout):
+        """
+        Simulates the model in the child process, and returns its result dictionary.
+
+        :param model: The SbmlModel to run, with its curr_folder and curr_file set
+        :param timeout: Maximum run time in seconds, or None for no limit
+        :raises TimeoutExpired: if the simulation exceeds timeout. The child is killed.
+        :raises CalledProcessError: if the simulation failed, or the child died
+        """
+        msg = pickle.dumps(model)
+        deadline = time.time() + timeout if timeout is not None else None
+        try:
+            self._write(self.header.pack(len(msg)) + msg)
+            size = self.header.unpack(self._read(self.header.size, deadline, timeout))[0]
+            ok, result = pickle.loads(self._read(size, deadline, timeout))
+        except (OSError, EOFError):
+            self.kill()
+            raise CalledProcessError(self.proc.returncode, self.proc.args)
+        except TimeoutExpired:
+            logger.debug('Killing persistent SBML runner process %i after %s seconds' % (self.proc.pid, timeout))
+            self.kill()
+            raise
+        if not ok:
+            # The traceback was written to the job's log file by the child
+            raise CalledProcessError(1, self.proc.args)
+        return result
+
+    def _write(self, data):
+        view = memoryview(data)
+        while len(view) > 0:
+            view = view[self.proc.stdin.write(view):]
+
+    def _read(self, n, deadline, timeout):
+        """Reads exactly n bytes from the child's stdout, raising TimeoutExpired if the deadline passes first"""
+        fd = self.proc.stdout.fileno()
+        chunks = []
+        while n > 0:
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0 or not select.select([fd], [], [], wait)[0]:
+                    raise TimeoutExpired(self.proc.args, timeout)
+            chunk = os.read(fd, n)
+            if not chunk:
+                raise EOFError('SBML runner process exited')
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+
+@atexit.register
+def _stop_sbml_processes():
+    with _sbml_processes_lock:
+        for proc in _sbml_processes:
+            proc.kill()
+        del _sbml_processes[:]
+
+
 class FailedSimulationError(Exception):
     """
     Raised when a simulation fails that was not a result of a subprocess.run() call (currently only use with
@@ -1113,10 +1459,116 @@ class FreeParameter(object):
         return self.__str__()
 
 
+class ParameterSchema(object):
+    """
+    The immutable description of the free parameters making up a PSet: their names, types, distribution arguments,
+    bounds, and whether each one varies in log space. PSets containing the same parameters share a single schema, and
+    each PSet stores only a vector of values in schema order.
+    """
+
+    _registry = dict()
+
+    def __init__(self, key):
+        """
+        Use ParameterSchema.get() instead, so that identical schemas are shared.
+
+        :param key: Tuple of (name, type, p1, p2, bounded) for each parameter, in order
+        :type key: tuple
+        """
+        self.key = key
+        # FreeParameters with no value, copied to build the FreeParameters of a PSet when they are requested
+        self.templates = tuple(FreeParameter(name, type, p1, p2, bounded=bounded) for name, type, p1, p2, bounded in key)
+        self.names = tuple(fp.name for fp in self.templates)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.lower_bounds = np.array([fp.lower_bound for fp in self.templates], dtype=float)
+        self.upper_bounds = np.array([fp.upper_bound for fp in self.templates], dtype=float)
+        self.log_space = np.array([fp.log_space for fp in self.templates], dtype=bool)
+        with np.errstate(divide='ignore'):
+            self.search_lower_bounds = np.where(self.log_space, np.log10(self.lower_bounds), self.lower_bounds)
+            self.search_upper_bounds = np.where(self.log_space, np.log10(self.upper_bounds), self.upper_bounds)
+        # Alphabetical order, used for output and for comparing PSets whose parameters are listed in different orders
+        self.sorted_order = np.array(sorted(range(len(self.names)), key=lambda i: self.names[i]), dtype=int)
+        self.sorted_key = tuple(key[i] for i in self.sorted_order)
+        self.sorted_names = '\t'.join(self.names[i] for i in self.sorted_order)
+
+    @classmethod
+    def get(cls, key):
+        """
+        Returns the shared schema for the given key, creating it if needed
+
+        :param key: Tuple of (name, type, p1, p2, bounded) for each parameter, in order
+        :return: ParameterSchema
+        """
+        schema = cls._registry.get(key)
+        if schema is None:
+            schema = cls._registry.setdefault(key, cls(key))
+        return schema
+
+    @classmethod
+    def from_free_parameters(cls, fps):
+        return cls.get(tuple((fp.name, fp.type, fp.p1, fp.p2, fp.bounded) for fp in fps))
+
+    def __reduce__(self):
+        return ParameterSchema.get, (self.key,)
+
+    def __len__(self):
+        return len(self.names)
+
+    def to_search_space(self, values):
+        """
+        Transforms a vector of parameter values to the space in which each parameter varies (log10 for log space
+        parameters). Also accepts a matrix with one parameter set per row.
+        """
+        x = np.array(values, dtype=float)
+        x[..., self.log_space] = np.log10(x[..., self.log_space])
+        return x
+
+    def from_search_space(self, x):
+        """Inverse of to_search_space()"""
+        values = np.array(x, dtype=float)
+        values[..., self.log_space] = 10. ** values[..., self.log_space]
+        return values
+
+    def reflect(self, x):
+        """
+        Reflects a vector in search space off of the parameter bounds until it lies within them, as done by
+        FreeParameter.set_value() for one parameter.
+
+        :param x: Vector of values in search space, or a matrix with one vector per row
+        :return: The reflected vector
+        """
+        x = np.array(x, dtype=float)
+        lb = np.broadcast_to(self.search_lower_bounds, x.shape)
+        ub = np.broadcast_to(self.search_upper_bounds, x.shape)
+        out = (x < lb) | (x > ub)
+        if not out.any():
+            return x
+        y, lb, ub = x[out], lb[out], ub[out]
+        width = ub - lb
+        # A single reflection suffices for parameters that are only bounded below
+        result = np.where(y < lb, 2. * lb - y, 2. * ub - y)
+        # For parameters bounded on both sides, repeated reflection is equivalent to folding with period 2*width
+        two_sided = np.isfinite(width)
+        if two_sided.any():
+            w = width[two_sided]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                m = np.mod(y[two_sided] - lb[two_sided], 2. * w)
+            m = np.where(m > w, 2. * w - m, m)
+            result[two_sided] = np.where(w > 0., lb[two_sided] + m, lb[two_sided])
+        x[out] = result
+        return x
+
+    def in_bounds(self, values):
+        """Returns whether all values in the vector lie within their parameter's bounds"""
+        return bool(np.all((values >= self.lower_bounds) & (values <= self.upper_bounds)))
+
+
 class PSet(object):
     """
     Class representing a parameter set
 
+    The values are stored as a read-only float64 vector ordered according to a shared ParameterSchema. FreeParameter
+    instances are only built when requested.
     """
 
     def __init__(self, fps):
@@ -1125,29 +1577,101 @@ class PSet(object):
 
         :param fps: A list of FreeParameter instances whose values are not None
         """
-
-        self._param_dict = {}
-        self.fps = fps
-
+        fps = list(fps)
+        names = set()
         for fp in fps:
             if fp.value is None:
                 raise PybnfError("Parameter %s has no value" % fp.name)
-            elif fp.name in self._param_dict.keys():
+            elif fp.name in names:
                 raise PybnfError("Parameters must have unique names")
-            self._param_dict[fp.name] = fp
+            names.add(fp.name)
+
+        self.schema = ParameterSchema.from_free_parameters(fps)
+        self._values = np.array([fp.value for fp in fps], dtype=float)
+        self._values.flags.writeable = False
+        self._fps = fps
+        self._hash = None
+        self._search = None
 
         self.name = None  # Can be set by Algorithms to give it a meaningful label in output file.
 
-    def __iter__(self):
-        self.idx = 0
-        return self
+    @classmethod
+    def from_vector(cls, schema, values):
+        """
+        Creates a PSet directly from a vector of values, without building FreeParameter instances
 
-    def __next__(self):
-        if self.idx == self.__len__():
-            raise StopIteration
-        res = self.fps[self.idx]
-        self.idx += 1
-        return res
+        :param schema: The schema describing the parameters
+        :type schema: ParameterSchema
+        :param values: Vector of parameter values, in schema order. Must lie within the parameter bounds.
+        :return: PSet
+        """
+        ps = cls.__new__(cls)
+        ps.schema = schema
+        ps._values = np.array(values, dtype=float)
+        ps._values.flags.writeable = False
+        ps._fps = None
+        ps._hash = None
+        ps._search = None
+        ps.name = None
+        return ps
+
+    @classmethod
+    def from_search_vector(cls, schema, x, reflect=True):
+        """
+        Creates a PSet from a vector in search space (log10 for log space parameters)
+
+        :param schema: The schema describing the parameters
+        :type schema: ParameterSchema
+        :param x: Vector of values in search space, in schema order
+        :param reflect: If True, reflect values outside the bounds as in FreeParameter.set_value(). If False, raise an
+        OutOfBoundsException for such values.
+        :return: PSet
+        """
+        if reflect:
+            x = schema.reflect(x)
+        values = schema.from_search_space(x)
+        if not reflect and not schema.in_bounds(values):
+            raise OutOfBoundsException('Parameter set is outside of bounds')
+        # Guard against rounding in the log transform landing just outside a bound
+        return cls.from_vector(schema, np.clip(values, schema.lower_bounds, schema.upper_bounds))
+
+    @property
+    def vector(self):
+        """The read-only vector of parameter values, in schema order"""
+        return self._values
+
+    def search_vector(self):
+        """Returns a read-only vector of the parameter values in search space (log10 for log space parameters)"""
+        if self._search is None:
+            self._search = self.schema.to_search_space(self._values)
+            self._search.flags.writeable = False
+        return self._search
+
+    def add_search_vector(self, delta, reflect=True):
+        """
+        Returns a new PSet with delta added to the parameter values in search space; the vector analog of
+        FreeParameter.add()
+
+        :param delta: Vector to add, in schema order
+        :param reflect: Whether to reflect values that leave the bounds, or raise an OutOfBoundsException
+        :return: PSet
+        """
+        return PSet.from_search_vector(self.schema, self.search_vector() + delta, reflect)
+
+    @property
+    def fps(self):
+        """List of FreeParameter instances in this PSet"""
+        if self._fps is None:
+            fps = []
+            for template, value in zip(self.schema.templates, self._values.tolist()):
+                fp = copy.copy(template)
+                fp.value = value
+                fps.append(fp)
+            self._fps = fps
+        return self._fps
+
+    def __iter__(self):
+        return iter(self.fps)
 
     def __getitem__(self, item):
         """
@@ -1159,7 +1683,10 @@ class PSet(object):
         :param item: The str name of the parameter to look up
         :return: float
         """
-        return self._param_dict[item].value
+        if self._fps is not None:
+            # Keep the values exactly as given to the constructor (which may be ints)
+            return self._fps[self.schema.index[item]].value
+        return self._values.item(self.schema.index[item])
 
     def get_param(self, name):
         """
@@ -1168,10 +1695,10 @@ class PSet(object):
         :param name:
         :return:
         """
-        return self._param_dict[name]
+        return self.fps[self.schema.index[name]]
 
     def __len__(self):
-        return len(self._param_dict)
+        return len(self.schema)
 
     def get_id(self):
         return self.__hash__()
@@ -1183,14 +1710,18 @@ class PSet(object):
 
         :return: int
         """
-        return hash(frozenset(self._param_dict.values()))
+        if self._hash is None:
+            # Adding 0. turns -0. into 0., which compare equal
+            values = self._values[self.schema.sorted_order] + 0.
+            self._hash = hash((self.schema.sorted_key, values.tobytes()))
+        return self._hash
 
     def __str__(self):
         """
         When a PSet is converted to a str, returns "PSet:" followed by the parameter dict.
         :return: str
         """
-        return "PSet:" + str(self._param_dict)
+        return "PSet:" + str({fp.name: fp for fp in self.fps})
 
     def __repr__(self):
         """
@@ -1201,20 +1732,40 @@ class PSet(object):
 
     def __eq__(self, other):
         """
-        Checks equality to another PSet by comparing the _param_dicts
+        Checks equality to another PSet by comparing the parameter definitions and value vectors
 
         :param other:
         :return:
         """
+        if not isinstance(other, PSet):
+            return False
+        if self.schema is other.schema:
+            return np.array_equal(self._values, other._values)
+        return self.schema.sorted_key == other.schema.sorted_key and \
+            np.array_equal(self._values[self.schema.sorted_order], other._values[other.schema.sorted_order])
 
-        return self._param_dict == other._param_dict
+    def __getstate__(self):
+        return {'schema': self.schema, '_values': self._values, 'name': self.name}
+
+    def __setstate__(self, state):
+        if '_param_dict' in state:
+            # PSet pickled before the vector representation
+            self.__init__(state['fps'])
+        else:
+            self.schema = state['schema']
+            self._values = state['_values']
+            self._values.flags.writeable = False
+            self._fps = None
+            self._hash = None
+            self._search = None
+        self.name = state['name']
 
     def keys(self):
         """
         Returns a list of the parameter keys
         :return: list
         """
-        return self._param_dict.keys()
+        return self.schema.index.keys()
 
     def keys_to_string(self):
         """
@@ -1222,9 +1773,7 @@ class PSet(object):
 
         :return: str
         """
-        keys = [str(k) for k in self._param_dict.keys()]
-        keys.sort()
-        return '\t'.join(keys)
+        return self.schema.sorted_names
 
     def values_to_string(self):
         """
@@ -1232,10 +1781,9 @@ class PSet(object):
         according to the parameter name
         :return: str
         """
-        keys = [str(k) for k in self._param_dict.keys()]
-        keys.sort()
-        values = [str(self[k]) for k in keys]  # Values are in alpha order by key name
-        return '\t'.join(values)
+        if self._fps is not None:
+            return '\t'.join([str(self._fps[i].value) for i in self.schema.sorted_order])
+        return '\t'.join([str(v) for v in self._values[self.schema.sorted_order].tolist()])
 
 
 class Trajectory(object):
@@ -1243,13 +1791,44 @@ class Trajectory(object):
     Tracks the various PSet instances and the corresponding objective function values
     """
 
-    def __init__(self, max_output):
+    # Binary log layout: the magic string and the tab-separated parameter names (preceded by their length), then one
+    # record per evaluation: name length, score, name, and the parameter values as float64 in the order of the names.
+    _log_magic = b'PyBNFtraj1'
+    _log_length = struct.Struct('<I')
+    _log_record = struct.Struct('<Hd')
+
+    def __init__(self, max_output, log_file=None):
+        """
+        :param max_output: The number of best parameter sets to keep
+        :type max_output: int
+        :param log_file: If given, every parameter set added is also appended to this binary log file, regardless of
+        whether it is among the best. See Trajectory.read_log() and Trajectory.from_log()
+        :type log_file: str
+        """
         # self._trajectory is a heap-based priority queue
-        # Contains tuples (-score, name, PSet) - allows us to efficiently toss the worst PSet when we get a new one
+        # Contains tuples (-score, name, PSet, line) - allows us to efficiently toss the worst PSet when we get a new
+        # one. line is the entry formatted for output.
         # Note we use -score so popping the worst entry is fast
         # As long as you follow the rule of no duplicate names, this is safe and won't compare PSets.
         self._trajectory = []
         self.max_output = max_output
+        self.log_file = log_file
+        self._log = None
+        # The parameter names in the order of the values in each record of the log, and for each schema whose order
+        # differs, the indices that reorder its vectors to match
+        self._log_names = None
+        self._log_orders = dict()
+        self._header = None
+        self._best = None
+        # The entries of the last output in sorted order (best first), and the entries kept since then. Merging the
+        # two when writing avoids re-sorting the whole heap each time.
+        self._sorted = []
+        self._new = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_log'] = None
+        return state
 
     def _valid_pset(self, pset):
         """
@@ -1276,21 +1855,138 @@ class Trajectory(object):
             # Treat nan values as Inf in order to sort correctly
             obj = np.inf
 
+        if self.log_file:
+            self._append_log(pset, obj, name)
+
+        entry = (-obj, name, pset)
         if len(self._trajectory) < self.max_output:
-            heapq.heappush(self._trajectory, (-obj, name, pset))
-        else:
+            entry += (self._traj_entry_format(entry),)
+            heapq.heappush(self._trajectory, entry)
+            self._new.append(entry)
+        elif entry > self._trajectory[0]:
             # Add the current pset, and throw away the worst one
-            heapq.heappushpop(self._trajectory, (-obj, name, pset))
+            entry += (self._traj_entry_format(entry),)
+            heapq.heapreplace(self._trajectory, entry)
+            self._new.append(entry)
+        if self._best is None or entry > self._best:
+            self._best = entry
 
         if append_file:
             with open(append_file, 'a') as af:
                 if first:
                     af.write(self._traj_write_header())
-                af.write(self._traj_entry_format((-obj, name, pset)))
+                af.write(self._traj_entry_format(entry))
+
+    def _append_log(self, pset, obj, name):
+        """Appends one record to the binary log, starting the file with a header if it is new"""
+        if self._log is None:
+            self._log = open(self.log_file, 'ab')
+            if self._log.tell() == 0:
+                self._log_names = pset.schema.names
+                names = '\t'.join(self._log_names).encode()
+                self._log.write(self._log_magic + self._log_length.pack(len(names)) + names)
+            elif self._log_names is None:
+                with open(self.log_file, 'rb') as f:
+                    self._log_names = tuple(self._read_log_header(f, self.log_file))
+        name_bytes = str(name).encode()
+        self._log.write(self._log_record.pack(len(name_bytes), obj) + name_bytes + self._log_vector(pset).tobytes())
+
+    def _log_vector(self, pset):
+        """Returns the values of the PSet in the order of the names in the header of the binary log"""
+        schema = pset.schema
+        if schema.names == self._log_names:
+            return pset.vector
+        order = self._log_orders.get(schema.key)
+        if order is None:
+            order = np.array([schema.index[n] for n in self._log_names], dtype=int)
+            self._log_orders[schema.key] = order
+        return pset.vector[order]
+
+    def flush(self):
+        """Flushes any buffered records of the binary log to disk"""
+        if self._log is not None:
+            self._log.flush()
+
+    def close(self):
+        """Closes the binary log. It is reopened for appending if more parameter sets are added."""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    @classmethod
+    def read_log(cls, filename):
+        """
+        Reads a binary log written by a Trajectory
+
+        :param filename: The log file
+        :type filename: str
+        :return: tuple (names, records), where names is the list of parameter names, and records is a generator of
+        tuples (name, score, values), where values is a numpy array ordered as names
+        """
+        f = open(filename, 'rb')
+        try:
+            names = cls._read_log_header(f, filename)
+        except PybnfError:
+            f.close()
+            raise
+        nbytes = 8 * len(names)
+
+        def records():
+            with f:
+                while True:
+                    head = f.read(cls._log_record.size)
+                    if len(head) < cls._log_record.size:
+                        break
+                    name_len, score = cls._log_record.unpack(head)
+                    body = f.read(name_len + nbytes)
+                    if len(body) < name_len + nbytes:
+                        logger.warning('Ignoring incomplete final record in %s' % filename)
+                        break
+                    yield body[:name_len].decode(), score, np.frombuffer(body[name_len:], dtype=np.float64)
+
+        return names, records()
+
+    @classmethod
+    def _read_log_header(cls, f, filename):
+        """Reads the header of a binary log from the open file f, and returns the list of parameter names"""
+        if f.read(len(cls._log_magic)) != cls._log_magic:
+            raise PybnfError('%s is not a PyBNF trajectory log' % filename)
+        return f.read(cls._log_length.unpack(f.read(cls._log_length.size))[0]).decode().split('\t')
+
+    @staticmethod
+    def from_log(filename, variables, max_output):
+        """
+        Builds a Trajectory of the best parameter sets in a binary log, for example to write a sorted_params file
+        without involving the running fit.
+
+        :param filename: The log file
+        :type filename: str
+        :param variables: The FreeParameters of the fit (Algorithm.variables)
+        :type variables: list
+        :param max_output: The number of best parameter sets to keep
+        :type max_output: int
+        :return: Trajectory
+        """
+        schema = ParameterSchema.from_free_parameters(variables)
+        names, records = Trajectory.read_log(filename)
+        if sorted(names) != sorted(schema.names):
+            raise PybnfError('The parameters in %s do not match the parameters of this fit' % filename)
+        order = [names.index(n) for n in schema.names]
+        t = Trajectory(max_output)
+        seen = set()
+        for name, score, values in records:
+            # A resumed fit may log some parameter sets a second time
+            if name in seen:
+                continue
+            seen.add(name)
+            t.add(PSet.from_vector(schema, values[order]), score, name)
+        return t
 
     def _traj_write_header(self):
-        header = self._trajectory[0][2].keys_to_string()
-        return '#\tSimulation\tObj\t%s\n' % header
+        if self._header is None:
+            header = self._trajectory[0][2].keys_to_string()
+            self._header = '#\tSimulation\tObj\t%s\n' % header
+        return self._header
 
     def _traj_entry_format(self, entry):
         """
@@ -1298,16 +1994,23 @@ class Trajectory(object):
         """
         return '\t%s\t%s\t%s\n' % (entry[1], -entry[0], entry[2].values_to_string())
 
+    def sorted_entries(self):
+        """
+        Returns the entries of the Trajectory from best to worst, merging those added since the last call into the
+        previously sorted list.
+
+        :return: list of tuples (-obj, name, PSet, line)
+        """
+        if self._new:
+            self._new.sort(reverse=True)
+            # Entries dropped from the heap are exactly those past max_output in the merged order
+            self._sorted = list(islice(heapq.merge(self._sorted, self._new, reverse=True), self.max_output))
+            self._new = []
+        return self._sorted
+
     def _write(self):
         """Writes the Trajectory in a tab-delimited format"""
-        s = self._traj_write_header()
-        num_output = 0
-        for k in sorted(self._trajectory, reverse=True):
-            s += self._traj_entry_format(k)
-            num_output += 1
-            if num_output == self.max_output:
-                break
-        return s
+        return ''.join([self._traj_write_header()] + [k[3] for k in self.sorted_entries()])
 
     @staticmethod
     def load_trajectory(filename, variables, max_output):
@@ -1338,10 +2041,11 @@ class Trajectory(object):
 
         :param filename: File to store Trajectory
         """
+        self.flush()
         try:
             with open(filename, 'w') as f:
-                f.write(self._write())
-                f.close()
+                f.write(self._traj_write_header())
+                f.writelines([k[3] for k in self.sorted_entries()])
         except IOError as e:
             logger.exception('Failed to save parameter sets to file')
             print1('Failed to save parameter sets to file.\nSee log for more information')
@@ -1355,7 +2059,7 @@ class Trajectory(object):
 
         :return: PSet
         """
-        return max(self._trajectory)[2]
+        return self._best[2]
 
     def best_fit_name(self):
         """
@@ -1364,14 +2068,521 @@ class Trajectory(object):
 
         :return: str
         """
-        return max(self._trajectory)[1]
+        return self._best[1]
 
     def best_score(self):
         """
         Returns the best objective value in this trajectory
         :return: float
         """
-        return -max(self._trajectory)[0]
+        return -self._best[0]
+
+
+def _write_npy_header(f, dtype, shape):
+    """
+    Writes a .npy version 1.0 header at the start of the open file f. The header of a new file has room for the shape
+    to grow, so it can be rewritten in place with the same size as rows are appended.
+
+    :return: The offset of the array data in the file
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                                      shape)
+    f.seek(0)
+    existing = f.read(10)
+    if len(existing) == 10 and existing[:6] == b'\x93NUMPY':
+        header_len = struct.unpack('<H', existing[8:10])[0]
+    else:
+        # Round the total header size up to a multiple of 64, leaving 40 characters for the shape to grow
+        header_len = -(-(len(header) + 11 + 40) // 64) * 64 - 10
+    f.seek(0)
+    f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', header_len) + header.ljust(header_len - 1).encode('latin1') +
+            b'\n')
+    return header_len + 10
+
+
+def _read_npy_header(filename):
+    """
+    Reads the header of a .npy file
+
+    :return: tuple (shape, dtype, offset of the array data)
+    """
+    with open(filename, 'rb') as f:
+        np.lib.format.read_magic(f)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        return shape, dtype, f.tell()
+
+
+class EvaluationStore(object):
+    """
+    Stores every evaluated parameter set as columns in a directory. Each column is a .npy file that grows as rows are
+    appended, so any column can be read with numpy.load(..., mmap_mode='r') without reading the rest of the store.
+
+    Columns:
+     - score: objective value (inf for failed simulations)
+     - iteration: iteration number parsed from the job name, or -1 if it has none
+     - wall_time: seconds spent running the simulations, or nan if unknown
+     - fail_type: -1 for a successful simulation, otherwise FailedSimulation.fail_type
+     - params: one row of parameter values per evaluation, with columns in the order of param_names
+     - name_end: end offset of each job name in names.bin
+    """
+
+    columns = (('score', '<f8'), ('iteration', '<i8'), ('wall_time', '<f8'), ('fail_type', '<i1'),
+               ('name_end', '<i8'))
+    _iteration_re = re.compile('(?:iter|gen)([0-9]+)')
+
+    def __init__(self, path, param_names, chunk_size=1000):
+        """
+        Creates an empty store in directory path, replacing any store already there when the first rows are written.
+
+        :param path: Directory of the store
+        :type path: str
+        :param param_names: Names of the parameters, in the order of the params columns
+        :type param_names: list of str
+        :param chunk_size: Number of rows to buffer in memory before writing them to disk
+        :type chunk_size: int
+        """
+        self.path = path
+        self.param_names = list(param_names)
+        self.chunk_size = chunk_size
+        self.n_rows = 0  # Number of rows written to disk
+        self._buffer = []
+        self._name_bytes = 0
+        self._orders = dict()  # Maps ParameterSchema to the order of its values in the params column
+        self._opened = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_buffer'] = []
+        state['_orders'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Rows written after the backup was taken will be evaluated again, so they are discarded when the store is
+        # reopened.
+        self._opened = False
+
+    def _open(self, n_rows):
+        """Creates empty column files if n_rows is 0, otherwise truncates the existing ones to n_rows"""
+        os.makedirs(self.path, exist_ok=True)
+        meta = '%s/params.txt' % self.path
+        if n_rows == 0 or not os.path.isfile(meta):
+            with open(meta, 'w') as f:
+                f.write('\n'.join(self.param_names) + '\n')
+            for name, dtype in self.columns:
+                with open(self._file(name), 'w+b') as f:
+                    _write_npy_header(f, dtype, (0,))
+            with open(self._file('params'), 'w+b') as f:
+                _write_npy_header(f, '<f8', (0, len(self.param_names)))
+            open('%s/names.bin' % self.path, 'wb').close()
+            self.n_rows = 0
+            self._name_bytes = 0
+            self._opened = True
+            return
+        with open(meta) as f:
+            if f.read().split() != self.param_names:
+                raise PybnfError('Evaluation store %s contains different parameters than this fit' % self.path)
+        # A column may be shorter if we were interrupted during a flush
+        on_disk = min(_read_npy_header(self._file(name))[0][0] for name, _ in self.columns + (('params', None),))
+        self.n_rows = min(n_rows, on_disk)
+        self._name_bytes = int(self.read(self.path, self.n_rows - 1, self.n_rows, ['name_end'])['name_end'][0]) \
+            if self.n_rows > 0 else 0
+        for name, dtype in self.columns + (('params', '<f8'),):
+            shape = (self.n_rows,) if name != 'params' else (self.n_rows, len(self.param_names))
+            with open(self._file(name), 'r+b') as f:
+                offset = _write_npy_header(f, dtype, shape)
+                f.truncate(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        with open('%s/names.bin' % self.path, 'r+b') as f:
+            f.truncate(self._name_bytes)
+        self._opened = True
+
+    def _file(self, column):
+        return self._file_for(self.path, column)
+
+    def append(self, res):
+        """
+        Adds a scored Result to the store
+
+        :param res: The Result or FailedSimulation
+        :type res: Result
+        """
+        pset = res.pset
+        order = self._orders.get(pset.schema)
+        if order is None:
+            order = np.array([pset.schema.index[n] for n in self.param_names])
+            self._orders[pset.schema] = order
+        match = self._iteration_re.search(res.name)
+        name = str(res.name).encode()
+        if not self._opened:
+            self._open(self.n_rows)
+        self._name_bytes += len(name)
+        wall_time = getattr(res, 'wall_time', None)
+        self._buffer.append((res.score if res.score is not None else np.inf,
+                             int(match.group(1)) if match else -1,
+                             wall_time if wall_time is not None else np.nan,
+                             res.fail_type if res.failed else -1,
+                             self._name_bytes, name, pset.vector[order]))
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows to disk"""
+        if not self._opened:
+            self._open(self.n_rows)
+        if not self._buffer:
+            return
+        rows = list(zip(*self._buffer))
+        n_rows = self.n_rows + len(self._buffer)
+        with open('%s/names.bin' % self.path, 'ab') as f:
+            f.write(b''.join(rows[5]))
+        arrays = [(name, dtype, (n_rows,), np.array(rows[i], dtype=dtype)) for i, (name, dtype) in
+                  enumerate(self.columns)]
+        arrays.append(('params', '<f8', (n_rows, len(self.param_names)), np.array(rows[6], dtype='<f8')))
+        for name, dtype, shape, a in arrays:
+            with open(self._file(name), 'r+b') as f:
+                f.seek(0, os.SEEK_END)
+                f.write(a.tobytes())
+                _write_npy_header(f, dtype, shape)
+        self.n_rows = n_rows
+        self._buffer = []
+
+    @classmethod
+    def read(cls, path, start=0, stop=None, columns=None, mmap=True):
+        """
+        Reads rows start to stop of an EvaluationStore
+
+        :param path: Directory of the store
+        :type path: str
+        :param columns: Names of the columns to read, including 'params' and 'names'. By default, all columns.
+        :type columns: list of str
+        :param mmap: If True, return memory-mapped arrays instead of reading the columns into memory
+        :type mmap: bool
+        :return: dict mapping column name to numpy array, and 'param_names' to the list of parameter names
+        """
+        if columns is None:
+            columns = [name for name, _ in cls.columns] + ['params', 'names']
+        with open('%s/params.txt' % path) as f:
+            result = {'param_names': f.read().split()}
+        for name in columns:
+            if name == 'names':
+                ends = np.load('%s/name_end.npy' % path, mmap_mode='r')[:stop]
+                first = int(ends[start - 1]) if start > 0 else 0
+                with open('%s/names.bin' % path, 'rb') as f:
+                    f.seek(first)
+                    data = f.read(int(ends[-1]) - first if len(ends) > 0 else 0)
+                bounds = [0] + [int(e) - first for e in ends[start:]]
+                result['names'] = [data[bounds[i]:bounds[i+1]].decode() for i in range(len(bounds) - 1)]
+            else:
+                a = np.load(cls._file_for(path, name), mmap_mode='r' if mmap else None)
+                result[name] = a[start:stop]
+        return result
+
+    @staticmethod
+    def _file_for(path, column):
+        return '%s/%s.npy' % (path, column)
+
+
+class EvaluationCache(object):
+    """
+    Remembers the scores of evaluated parameter sets, so that a parameter set proposed again can be scored without
+    running its simulations. Entries are discarded in least recently used order once the cache is full.
+
+    By default, keys are exact parameter values. With a tolerance, each value in search space (log10 for log space
+    parameters) is rounded to a multiple of the tolerance, so parameter sets that differ by less than the tolerance
+    usually share an entry.
+
+    Optionally, entries also keep the AlignedOutputs of their simulations - only the simulated values that the
+    objective function compares to the experimental data - so that they can be scored again after the weights of the
+    data change (bootstrap replicates, refinement of a bootstrapped fit). The total size of the kept outputs is limited
+    separately; past the limit, the outputs of the least recently used entries are dropped first.
+    """
+
+    def __init__(self, max_size, tolerance=0., max_data_bytes=0):
+        """
+        :param max_size: Maximum number of entries
+        :type max_size: int
+        :param tolerance: Grid spacing in search space for near-duplicate keys, or 0 to match exact values only
+        :type tolerance: float
+        :param max_data_bytes: Maximum total size in bytes of kept simulation outputs, or 0 to keep none
+        :type max_data_bytes: int
+        """
+        self.max_size = max_size
+        self.tolerance = tolerance
+        self.max_data_bytes = max_data_bytes
+        self.keep_data = max_data_bytes > 0
+        self._entries = OrderedDict()  # Maps key to list [name, score, outputs]. score is None if it is out of date.
+        self._data_keys = OrderedDict()  # Keys of the entries holding outputs, in least recently used order
+        self.data_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rescored = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # Simulation outputs are not saved in algorithm backups, to keep them small. Out of date entries can then no
+        # longer be scored again, so they are dropped.
+        state = self.__dict__.copy()
+        state['_entries'] = OrderedDict((k, [e[0], e[1], None]) for k, e in self._entries.items() if e[1] is not None)
+        state['_data_keys'] = OrderedDict()
+        state['data_bytes'] = 0
+        return state
+
+    def __deepcopy__(self, memo):
+        # Copies for bootstrap replicates run at the same time keep the outputs, unlike backups. Keys and AlignedOutputs
+        # are never modified, so only the entry lists and the bookkeeping are copied.
+        other = EvaluationCache.__new__(EvaluationCache)
+        other.__dict__.update(self.__dict__)
+        other._entries = OrderedDict((k, list(e)) for k, e in self._entries.items())
+        other._data_keys = OrderedDict(self._data_keys)
+        return other
+
+    def key(self, pset):
+        """Returns the key of pset"""
+        if self.tolerance > 0.:
+            return np.floor(pset.search_vector() / self.tolerance + 0.5).astype(np.int64).tobytes()
+        return pset
+
+    def get(self, pset):
+        """
+        Looks up pset, counting a hit or a miss
+
+        :param pset: The proposed PSet
+        :return: list [name, score, outputs] of the matching entry, where score is None if the entry must be scored
+        again from outputs with update(), or None if there is no entry
+        """
+        k = self.key(pset)
+        entry = self._entries.get(k)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(k)
+        if k in self._data_keys:
+            self._data_keys.move_to_end(k)
+        self.hits += 1
+        return entry
+
+    def put(self, res):
+        """
+        Adds the scored Result res, discarding the least recently used entry if the cache is full. Its outputs are kept
+        if keep_data is set and res.outputs is not None.
+        """
+        k = self.key(res.pset)
+        if k in self._entries:
+            self._drop(k)
+        outputs = res.outputs if self.keep_data else None
+        self._entries[k] = [res.name, res.score, outputs]
+        if outputs is not None:
+            self._data_keys[k] = outputs.nbytes
+            self.data_bytes += outputs.nbytes
+        if len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+        while self.data_bytes > self.max_data_bytes and self._data_keys:
+            oldest, nbytes = self._data_keys.popitem(last=False)
+            self.data_bytes -= nbytes
+            entry = self._entries[oldest]
+            if entry[1] is None:
+                del self._entries[oldest]
+            else:
+                entry[2] = None
+
+    def _drop(self, k):
+        """Removes the entry with key k"""
+        del self._entries[k]
+        if k in self._data_keys:
+            self.data_bytes -= self._data_keys.pop(k)
+
+    def update(self, pset, score):
+        """Sets the score of the entry for pset after scoring it again"""
+        self._entries[self.key(pset)][1] = score
+        self.rescored += 1
+
+    def invalidate(self):
+        """
+        Marks all scores as out of date, e.g. because the bootstrap weights changed. Entries without simulation outputs
+        are dropped.
+        """
+        self._entries = OrderedDict((k, [e[0], None, e[2]]) for k, e in self._entries.items() if e[2] is not None)
+
+    def stats(self):
+        """Returns a one-line summary of the hit rate"""
+        lookups = self.hits + self.misses
+        summary = 'Evaluation cache: %i hits in %i lookups (%.1f%%), %i rescored, %i entries' % \
+            (self.hits, lookups, 100. * self.hits / lookups if lookups else 0., self.rescored, len(self._entries))
+        if self.keep_data:
+            summary += ', %i with outputs (%.2f MB)' % (len(self._data_keys), self.data_bytes / 1e6)
+        return summary
+
+
+class SampleStore(object):
+    """
+    Stores the samples of a Bayesian algorithm in a .npy file of records with fields Name, Ln_probability, and one
+    field per parameter. The file is preallocated, grows by doubling, and is accessed through a memory map, so adding a
+    sample does not rewrite anything, and the columns can be read back without parsing text.
+    """
+
+    def __init__(self, filename, param_names, capacity=1024):
+        """
+        Creates an empty store, replacing any file already at filename
+
+        :param filename: Path of the .npy file
+        :type filename: str
+        :param param_names: Names of the parameters, in the order of the fields
+        :type param_names: list of str
+        :param capacity: Number of rows to preallocate
+        :type capacity: int
+        """
+        self.filename = filename
+        self.param_names = list(param_names)
+        self.dtype = np.dtype([('Name', 'S32'), ('Ln_probability', '<f8')] + [(n, '<f8') for n in self.param_names])
+        self.n_rows = 0
+        self._array = None
+        self._orders = dict()  # Maps ParameterSchema to the order of its values in the parameter fields
+        with open(filename, 'w+b') as f:
+            offset = _write_npy_header(f, self.dtype, (0,))
+            f.truncate(offset + capacity * self.dtype.itemsize)
+        self._map()
+
+    def __getstate__(self):
+        # Record the row count in the file, so it matches the count we pickle
+        self.flush()
+        state = self.__dict__.copy()
+        state['_array'] = None
+        state['_orders'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Samples recorded after the backup was taken will be sampled again, so they are overwritten.
+        with open(self.filename, 'r+b') as f:
+            _write_npy_header(f, self.dtype, (self.n_rows,))
+        self._map()
+
+    def _map(self):
+        """Memory-maps all rows the file has room for"""
+        offset = _read_npy_header(self.filename)[2]
+        capacity = (os.path.getsize(self.filename) - offset) // self.dtype.itemsize
+        self._array = np.memmap(self.filename, dtype=self.dtype, mode='r+', offset=offset, shape=(capacity,))
+
+    def append(self, pset, ln_prob):
+        """
+        Adds a sample
+
+        :param pset: The sampled PSet
+        :type pset: PSet
+        :param ln_prob: The probability of this PSet
+        :type ln_prob: float
+        """
+        if self.n_rows == len(self._array):
+            self._array.flush()
+            self._array = None
+            with open(self.filename, 'r+b') as f:
+                offset = _read_npy_header(self.filename)[2]
+                f.truncate(offset + 2 * max(self.n_rows, 1) * self.dtype.itemsize)
+            self._map()
+        order = self._orders.get(pset.schema)
+        if order is None:
+            order = np.array([pset.schema.index[n] for n in self.param_names])
+            self._orders[pset.schema] = order
+        self._array[self.n_rows] = (str(pset.name).encode(), ln_prob) + tuple(pset.vector[order].tolist())
+        self.n_rows += 1
+
+    def column(self, name):
+        """
+        Returns the recorded values of one field
+
+        :param name: A parameter name, 'Name', or 'Ln_probability'
+        :type name: str
+        :return: numpy array view of length n_rows
+        """
+        return self._array[name][:self.n_rows]
+
+    def flush(self):
+        """Writes the current row count to the file header, so numpy.load() sees all samples"""
+        if self._array is not None:
+            self._array.flush()
+            with open(self.filename, 'r+b') as f:
+                _write_npy_header(f, self.dtype, (self.n_rows,))
+
+    def write_text(self, filename):
+        """
+        Exports the samples in the tab-delimited format of samples.txt
+
+        :param filename: File to write
+        :type filename: str
+        """
+        order = sorted(range(len(self.param_names)), key=lambda i: self.param_names[i])
+        with open(filename, 'w') as f:
+            f.write('# Name\tLn_probability\t%s\n' % '\t'.join([self.param_names[i] for i in order]))
+            for row in self._array[:self.n_rows].tolist():
+                f.write('%s\t%s\t%s\n' % (row[0].decode(), row[1], '\t'.join([str(row[i+2]) for i in order])))
+
+
+class SampleWriter(object):
+    """
+    Writes samples to a tab-delimited text file (samples.txt). Lines are buffered in memory and appended to the file
+    in batches, when buffer_rows lines are waiting or buffer_seconds have passed since the last write.
+    """
+
+    def __init__(self, filename, param_names, buffer_rows=1000, buffer_seconds=10.):
+        """
+        Creates the file with its header line, replacing any file already at filename
+
+        :param filename: Path of the text file
+        :type filename: str
+        :param param_names: Names of the parameters
+        :type param_names: list of str
+        :param buffer_rows: Maximum number of lines to hold before writing
+        :type buffer_rows: int
+        :param buffer_seconds: Maximum time in seconds to hold a line before writing
+        :type buffer_seconds: float
+        """
+        self.filename = filename
+        self.buffer_rows = buffer_rows
+        self.buffer_seconds = buffer_seconds
+        self._buffer = []
+        self._last_write = time.time()
+        with open(filename, 'w') as f:
+            f.write('# Name\tLn_probability\t%s\n' % '\t'.join(sorted(param_names)))
+            self.size = f.tell()  # Bytes in the file that are accounted for by this writer
+
+    def __getstate__(self):
+        # Write out the buffer, so the size we pickle covers every sample recorded so far
+        self.flush()
+        state = self.__dict__.copy()
+        state['_buffer'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._last_write = time.time()
+        # Samples written after the backup was taken will be sampled again, so discard them.
+        if os.path.isfile(self.filename):
+            with open(self.filename, 'r+') as f:
+                f.truncate(self.size)
+
+    def append(self, pset, ln_prob):
+        """
+        Adds a sample
+
+        :param pset: The sampled PSet
+        :type pset: PSet
+        :param ln_prob: The probability of this PSet
+        :type ln_prob: float
+        """
+        self._buffer.append('%s\t%s\t%s\n' % (pset.name, ln_prob, pset.values_to_string()))
+        if len(self._buffer) >= self.buffer_rows or time.time() - self._last_write >= self.buffer_seconds:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered lines to the file"""
+        if self._buffer:
+            with open(self.filename, 'a') as f:
+                f.write(''.join(self._buffer))
+                self.size = f.tell()
+            self._buffer = []
+        self._last_write = time.time()
 
 
 class OutOfBoundsException(Exception):
@@ -11,6 +11,7 @@ import pybnf.printing as printing
 
 from subprocess import run
 from numpy import inf
+import numpy as np
 
 import logging
 import argparse
@@ -19,6 +20,8 @@ import shutil
 import time
 import traceback
 import pickle
+from collections import deque
+from glob import glob
 
 
 __version__ = "1.1.1"
@@ -92,9 +95,15 @@ def main():
                              "run, or --overwrite to overwrite the previous run with a new one.")
 
         continue_file = None
+        # Backups of bootstrap replicates run with bootstrap_parallel > 1. To resume them, the original fit is loaded
+        # from alg_finished.bp, and the replicates from their own backups.
+        boot_backups = sorted(glob(config.config['output_dir'] + '/alg_backup_boot*.bp'))
+        resumable = os.path.exists(config.config['output_dir'] + '/alg_finished.bp') and boot_backups
         if cmdline_args.resume is not None:
             if os.path.exists(config.config['output_dir'] + '/alg_backup.bp'):
                 continue_file = config.config['output_dir'] + '/alg_backup.bp'
+            elif resumable:
+                continue_file = config.config['output_dir'] + '/alg_finished.bp'
             elif os.path.exists(config.config['output_dir'] + '/alg_finished.bp'):
                 if cmdline_args.resume <= 0:
                     raise PybnfError('The fitting run saved in %s already finished. If you want to continue the '
@@ -103,13 +112,17 @@ def main():
                 continue_file = config.config['output_dir'] + '/alg_finished.bp'
             else:
                 raise PybnfError('No algorithm found to resume in %s' % (config.config['output_dir']))
-        elif os.path.exists(config.config['output_dir'] + '/alg_backup.bp') and not cmdline_args.overwrite:
+        elif (os.path.exists(config.config['output_dir'] + '/alg_backup.bp') or resumable) and \
+                not cmdline_args.overwrite:
             ans = 'x'
             while ans.lower() not in ['y', 'yes', 'n', 'no', '']:
                 ans = input('Your output_dir contains an in-progress run.\nContinue that run? [y/n] (y) ')
             if ans.lower() in ('y', 'yes', ''):
                 logger.info('Resuming a previous run')
-                continue_file = config.config['output_dir'] + '/alg_backup.bp'
+                if os.path.exists(config.config['output_dir'] + '/alg_backup.bp'):
+                    continue_file = config.config['output_dir'] + '/alg_backup.bp'
+                else:
+                    continue_file = config.config['output_dir'] + '/alg_finished.bp'
                 cmdline_args.resume = 0
 
         if continue_file:
@@ -124,7 +137,18 @@ def main():
             if not os.path.exists(alg.sim_dir):
                 os.makedirs(alg.sim_dir)
 
-            if alg.bootstrap_number is not None:
+            resumed_replicates = None
+            if continue_file.endswith('alg_finished.bp') and resumable:
+                resumed_replicates = []
+                for backup_file in boot_backups:
+                    logger.info('Reloading bootstrap replicate from %s' % backup_file)
+                    with open(backup_file, 'rb') as bf:
+                        replicate, replicate_pending = pickle.load(bf)
+                    if not os.path.exists(replicate.sim_dir):
+                        os.makedirs(replicate.sim_dir)
+                    resumed_replicates.append((replicate, replicate_pending))
+
+            if alg.bootstrap_number is not None or resumed_replicates is not None:
                 print0('Resuming a bootstrapping run')
                 logger.info('Resuming a bootstrapping run')
                 if cmdline_args.resume > 0 and cmdline_args.resume is not None:
@@ -141,6 +165,7 @@ def main():
             # Create output folders, checking for overwrites.
             subdirs = ('Simulations', 'Results', 'Initialize', 'FailedSimLogs')
             subfiles = ('alg_backup.bp', 'alg_finished.bp', 'alg_refine_finished.bp')
+            subfiles += tuple(os.path.basename(f) for f in boot_backups)
             will_overwrite = [subdir for subdir in subdirs + subfiles
                               if os.path.exists(config.config['output_dir'] + '/' + subdir)]
             if config.config['simulation_dir']:
@@ -190,6 +215,9 @@ def main():
                 os.mkdir(config.config['output_dir'] + '/Simulations')
             shutil.copy(cmdline_args.conf_file, config.config['output_dir'] + '/Results')
             pending = None
+            resumed_replicates = None
+            if config.config['random_seed'] is not None:
+                np.random.seed(config.config['random_seed'])
     
             if config.config['fit_type'] == 'pso':
                 alg = algs.ParticleSwarm(config)
@@ -223,14 +251,15 @@ def main():
             # Set up cluster
             cluster = Cluster(config, log_prefix, debug, cmdline_args.log_level)
             # Run the algorithm!
-            logger.debug('Algorithm initialization')
-            alg.run(cluster.client, resume=pending, debug=debug)
+            if resumed_replicates is None:
+                logger.debug('Algorithm initialization')
+                alg.run(cluster.client, resume=pending, debug=debug)
         else:
             # Run model checking
             logger.debug('Model checking initialization')
             alg.run_check(debug=debug)
 
-        if config.config['refine'] == 1:
+        if config.config['refine'] == 1 and resumed_replicates is None:
             logger.debug('Refinement requested for best fit parameter set')
             if config.config['fit_type'] == 'sim':
                 logger.debug('Cannot refine further if Simplex algorithm was used for original fit')
@@ -242,9 +271,10 @@ def main():
                 config.config['simplex_start_point'] = alg.trajectory.best_fit()
                 simplex = algs.SimplexAlgorithm(config, refine=True)
                 simplex.trajectory = alg.trajectory  # Reuse existing trajectory; don't start a new one.
+                simplex.eval_cache = alg.eval_cache
                 simplex.run(cluster.client, debug=debug)
 
-        if alg.bootstrap_number is None:
+        if alg.bootstrap_number is None and resumed_replicates is None:
             print0('Fitting complete')
 
         # Bootstrapping (optional)
@@ -259,81 +289,10 @@ def main():
                 print1('No bootstrap_max_obj specified. All bootstrap replicates will be accepted regardless of '
                        'objective value.')
 
-            num_to_bootstrap = config.config['bootstrap']
-            completed_bootstrap_runs = 0
-            if alg.bootstrap_number is None:
-                bootstrapped_psets = Trajectory(num_to_bootstrap)
-            else:  # Check if finished a resumed bootstrap fitting run
-                completed_bootstrap_runs += alg.bootstrap_number
-                if completed_bootstrap_runs == 0:
-                    bootstrapped_psets = Trajectory(num_to_bootstrap)
-                else:
-                    if completed_bootstrap_runs > 0:
-                        bootstrapped_psets = Trajectory.load_trajectory(config.config['output_dir'] +
-                                                                        '/Results/bootstrapped_parameter_sets.txt',
-                                                                        config.variables,
-                                                                        config.config['num_to_output'])
-
-                if alg.best_fit_obj <= bootstrap_max_obj:
-                    logger.info('Bootstrap run %s complete' % completed_bootstrap_runs)
-                    bootstrapped_psets.add(alg.trajectory.best_fit(), alg.best_fit_obj,
-                                           'bootstrap_run_%s' % completed_bootstrap_runs,
-                                           config.config['output_dir'] + '/Results/bootstrapped_parameter_sets.txt',
-                                           completed_bootstrap_runs == 0)
-                    logger.info('Succesfully completed resumed bootstrapping run %s' % completed_bootstrap_runs)
-                    completed_bootstrap_runs += 1
-                else:
-                    shutil.rmtree(alg.res_dir)
-                    if os.path.exists(alg.sim_dir):
-                        shutil.rmtree(alg.sim_dir)
-                    print0("Bootstrap run did not achieve maximum allowable objective function value.  Retrying")
-                    logger.info('Resumed bootstrapping run %s did not achieve maximum allowable objective function '
-                                'value.  Retrying' % completed_bootstrap_runs)
-
-            # Run bootstrapping
-            consec_failed_bootstrap_runs = 0
-            while completed_bootstrap_runs < num_to_bootstrap:
-                alg.reset(bootstrap=completed_bootstrap_runs)
-
-                for model in alg.exp_data:
-                    for name, data in alg.exp_data[model].items():
-                        data.gen_bootstrap_weights()
-                        data.weights_to_file('%s/%s_weights_%s.txt' % (alg.res_dir, name, completed_bootstrap_runs))
-
-                logger.info('Beginning bootstrap run %s' % completed_bootstrap_runs)
-                print0("Beginning bootstrap run %s" % completed_bootstrap_runs)
-                alg.run(cluster.client, debug=debug)
-
-                if config.config['refine'] == 1:
-                    logger.debug('Refinement requested for best fit parameter set')
-                    if config.config['fit_type'] == 'sim':
-                        logger.debug('Cannot refine further if Simplex algorithm was used for original fit')
-                        print1("You specified refine=1, but refine uses the Simplex algorithm, which you already just ran."
-                              "\nSkipping refine.")
-                    else:
-                        logger.debug('Refining further using the Simplex algorithm')
-                        print1("Refining the best fit by the Simplex algorithm")
-                        config.config['simplex_start_point'] = alg.trajectory.best_fit()
-                        simplex = algs.SimplexAlgorithm(config, refine=True)
-                        simplex.trajectory = alg.trajectory  # Reuse existing trajectory; don't start a new one.
-                        simplex.run(cluster.client, debug=debug)
-
-                best_fit_pset = alg.trajectory.best_fit()
-
-                if alg.best_fit_obj <= bootstrap_max_obj:
-                    logger.info('Bootstrap run %s complete' % completed_bootstrap_runs)
-                    bootstrapped_psets.add(best_fit_pset, alg.best_fit_obj, 'bootstrap_run_%s' % completed_bootstrap_runs,
-                                           config.config['output_dir'] + '/Results/bootstrapped_parameter_sets.txt',
-                                           completed_bootstrap_runs == 0)
-                    completed_bootstrap_runs += 1
-                    consec_failed_bootstrap_runs = 0
-                else:
-                    consec_failed_bootstrap_runs += 1
-                    print0("Bootstrap run did not achieve maximum allowable objective function value.  Retrying")
-                    logger.warning("Bootstrap run did not achieve maximum allowable objective function value.")
-                    if consec_failed_bootstrap_runs > 20:  # Arbitrary...  should we make this configurable or smaller?
-                        raise PybnfError("20 consecutive bootstrap runs failed to achieve maximum allowable objective "
-                                         "function values.  Check 'bootstrap_max_obj' configuration key")
+            if config.config['bootstrap_parallel'] > 1:
+                run_bootstrap_concurrently(alg, resumed_replicates or [], cluster.client, bootstrap_max_obj, debug)
+            else:
+                run_bootstrap_sequentially(alg, cluster.client, bootstrap_max_obj, debug)
 
             # bootstrapped_psets.write_to_file(config.config['output_dir'] + "/Results/bootstrapped_parameter_sets.txt")
             print0('Bootstrapping complete')
@@ -401,3 +360,164 @@ def main():
             print2('Total fitting time: %d:%02d:%02d' % (hrs, mins, secs))
             logger.info('Total fitting time: %d:%02d:%02d' % (hrs, mins, secs))
             exit(0 if success else 1)
+
+
+def run_bootstrap_sequentially(alg, client, bootstrap_max_obj, debug=False):
+    """
+    Runs the bootstrap replicates that are not complete yet one after another, resetting alg for each one. If alg is a
+    resumed bootstrap replicate, it is recorded first.
+
+    :param alg: The Algorithm of the original fit, or of the resumed bootstrap replicate
+    :type alg: Algorithm
+    :param client: The dask Client
+    :param bootstrap_max_obj: Maximum objective value for a replicate to be accepted
+    :type bootstrap_max_obj: float
+    :param debug: Whether to save logs of all failed simulations
+    """
+    logger = logging.getLogger(__name__)
+    config = alg.config
+    num_to_bootstrap = config.config['bootstrap']
+    completed_bootstrap_runs = 0
+    if alg.bootstrap_number is None:
+        bootstrapped_psets = Trajectory(num_to_bootstrap)
+    else:  # Check if finished a resumed bootstrap fitting run
+        completed_bootstrap_runs += alg.bootstrap_number
+        if completed_bootstrap_runs == 0:
+            bootstrapped_psets = Trajectory(num_to_bootstrap)
+        else:
+            if completed_bootstrap_runs > 0:
+                bootstrapped_psets = Trajectory.load_trajectory(config.config['output_dir'] +
+                                                                '/Results/bootstrapped_parameter_sets.txt',
+                                                                config.variables,
+                                                                config.config['num_to_output'])
+
+        if alg.best_fit_obj <= bootstrap_max_obj:
+            logger.info('Bootstrap run %s complete' % completed_bootstrap_runs)
+            bootstrapped_psets.add(alg.trajectory.best_fit(), alg.best_fit_obj,
+                                   'bootstrap_run_%s' % completed_bootstrap_runs,
+                                   config.config['output_dir'] + '/Results/bootstrapped_parameter_sets.txt',
+                                   completed_bootstrap_runs == 0)
+            logger.info('Succesfully completed resumed bootstrapping run %s' % completed_bootstrap_runs)
+            completed_bootstrap_runs += 1
+        else:
+            shutil.rmtree(alg.res_dir)
+            if os.path.exists(alg.sim_dir):
+                shutil.rmtree(alg.sim_dir)
+            print0("Bootstrap run did not achieve maximum allowable objective function value.  Retrying")
+            logger.info('Resumed bootstrapping run %s did not achieve maximum allowable objective function '
+                        'value.  Retrying' % completed_bootstrap_runs)
+
+    # Run bootstrapping
+    consec_failed_bootstrap_runs = 0
+    while completed_bootstrap_runs < num_to_bootstrap:
+        alg.reset(bootstrap=completed_bootstrap_runs)
+
+        for model in alg.exp_data:
+            for name, data in alg.exp_data[model].items():
+                data.gen_bootstrap_weights()
+                data.weights_to_file('%s/%s_weights_%s.txt' % (alg.res_dir, name, completed_bootstrap_runs))
+
+        logger.info('Beginning bootstrap run %s' % completed_bootstrap_runs)
+        print0("Beginning bootstrap run %s" % completed_bootstrap_runs)
+        alg.run(client, debug=debug)
+
+        if config.config['refine'] == 1:
+            logger.debug('Refinement requested for best fit parameter set')
+            if config.config['fit_type'] == 'sim':
+                logger.debug('Cannot refine further if Simplex algorithm was used for original fit')
+                print1("You specified refine=1, but refine uses the Simplex algorithm, which you already just ran."
+                      "\nSkipping refine.")
+            else:
+                logger.debug('Refining further using the Simplex algorithm')
+                print1("Refining the best fit by the Simplex algorithm")
+                config.config['simplex_start_point'] = alg.trajectory.best_fit()
+                simplex = algs.SimplexAlgorithm(config, refine=True)
+                simplex.trajectory = alg.trajectory  # Reuse existing trajectory; don't start a new one.
+                simplex.eval_cache = alg.eval_cache
+                simplex.run(client, debug=debug)
+
+        best_fit_pset = alg.trajectory.best_fit()
+
+        if alg.best_fit_obj <= bootstrap_max_obj:
+            logger.info('Bootstrap run %s complete' % completed_bootstrap_runs)
+            bootstrapped_psets.add(best_fit_pset, alg.best_fit_obj, 'bootstrap_run_%s' % completed_bootstrap_runs,
+                                   config.config['output_dir'] + '/Results/bootstrapped_parameter_sets.txt',
+                                   completed_bootstrap_runs == 0)
+            completed_bootstrap_runs += 1
+            consec_failed_bootstrap_runs = 0
+        else:
+            consec_failed_bootstrap_runs += 1
+            print0("Bootstrap run did not achieve maximum allowable objective function value.  Retrying")
+            logger.warning("Bootstrap run did not achieve maximum allowable objective function value.")
+            if consec_failed_bootstrap_runs > 20:  # Arbitrary...  should we make this configurable or smaller?
+                raise PybnfError("20 consecutive bootstrap runs failed to achieve maximum allowable objective "
+                                 "function values.  Check 'bootstrap_max_obj' configuration key")
+
+
+def run_bootstrap_concurrently(alg, resumed, client, bootstrap_max_obj, debug=False):
+    """
+    Runs the bootstrap replicates that are not complete yet, up to bootstrap_parallel at a time, sharing one client.
+    Each replicate is an independent copy of alg with its own bootstrap weights, output directories, and backup file
+    alg_backup_boot<replicate>.bp, which is removed once the replicate is recorded in bootstrapped_parameter_sets.txt.
+
+    :param alg: The Algorithm of the original fit
+    :type alg: Algorithm
+    :param resumed: Tuples (Algorithm, pending PSets) of the replicates loaded from their backups
+    :type resumed: list
+    :param client: The dask Client
+    :param bootstrap_max_obj: Maximum objective value for a replicate to be accepted
+    :type bootstrap_max_obj: float
+    :param debug: Whether to save logs of all failed simulations
+    """
+    logger = logging.getLogger(__name__)
+    config = alg.config
+    boot_file = config.config['output_dir'] + '/Results/bootstrapped_parameter_sets.txt'
+    bootstrapped_psets = Trajectory(config.config['bootstrap'])
+    completed = set()
+    if os.path.exists(boot_file):
+        with open(boot_file) as f:
+            completed = set(int(line.split()[0].split('_')[-1]) for line in f.readlines()[1:] if line.strip())
+    running = set(replicate.bootstrap_number for replicate, _ in resumed)
+    to_start = deque(i for i in range(config.config['bootstrap']) if i not in completed and i not in running)
+    consec_failed = [0]
+
+    def new_replicate():
+        if not to_start:
+            return None
+        i = to_start.popleft()
+        logger.info('Beginning bootstrap run %s' % i)
+        print0('Beginning bootstrap run %s' % i)
+        return alg.bootstrap_replicate(i), None
+
+    def next_run(replicate):
+        i = replicate.bootstrap_number
+        if config.config['refine'] == 1 and config.config['fit_type'] != 'sim' and not replicate.refine:
+            logger.debug('Refining bootstrap run %s using the Simplex algorithm' % i)
+            print1('Refining the best fit of bootstrap run %s by the Simplex algorithm' % i)
+            return replicate.refinement(), None
+
+        if replicate.trajectory.best_score() <= bootstrap_max_obj:
+            logger.info('Bootstrap run %s complete' % i)
+            print0('Bootstrap run %s complete' % i)
+            bootstrapped_psets.add(replicate.trajectory.best_fit(), replicate.trajectory.best_score(),
+                                   'bootstrap_run_%s' % i, boot_file, not os.path.exists(boot_file))
+            consec_failed[0] = 0
+        else:
+            consec_failed[0] += 1
+            print0('Bootstrap run %s did not achieve maximum allowable objective function value.  Retrying' % i)
+            logger.warning('Bootstrap run %s did not achieve maximum allowable objective function value.' % i)
+            if consec_failed[0] > 20:
+                raise PybnfError("20 consecutive bootstrap runs failed to achieve maximum allowable objective "
+                                 "function values.  Check 'bootstrap_max_obj' configuration key")
+            to_start.appendleft(i)
+        try:
+            os.remove('%s/%s.bp' % (config.config['output_dir'], replicate.backup_name))
+        except OSError:
+            logger.debug('No backup to remove for bootstrap run %s' % i)
+        return new_replicate()
+
+    runs = list(resumed)
+    while len(runs) < config.config['bootstrap_parallel'] and to_start:
+        runs.append(new_replicate())
+    logger.info('Running %i bootstrap replicates at a time' % config.config['bootstrap_parallel'])
+    algs.run_concurrently(client, runs, next_run, debug)
@@ -1,7 +1,48 @@
 import sys
+import os
 import pickle
+import struct
+import traceback
+
+
+def serve():
+    """
+    Persistent mode: simulate length-prefixed pickled models read from stdin until stdin is closed, replying to each
+    with a length-prefixed pickle of (success, result). Compiled models stay cached in this process between jobs.
+    """
+    header = struct.Struct('!Q')
+    stdin = sys.stdin.buffer
+    # Keep a private copy of stdout for replies, so that nothing printed during a simulation can reach the parent
+    out = os.fdopen(os.dup(1), 'wb')
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    while True:
+        head = stdin.read(header.size)
+        if len(head) < header.size:
+            break
+        model = pickle.loads(stdin.read(header.unpack(head)[0]))
+        with open('%s/%s.log' % (model.curr_folder, model.curr_file), 'w') as errout:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(errout.fileno(), 1)
+            os.dup2(errout.fileno(), 2)
+            try:
+                reply = (True, model.super_execute())
+            except Exception:
+                traceback.print_exc()
+                reply = (False, None)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+        msg = pickle.dumps(reply)
+        out.write(header.pack(len(msg)) + msg)
+        out.flush()
+
 
 if __name__ == '__main__':
-    model = pickle.loads(sys.stdin.buffer.read())
-    result = model.super_execute()
-    sys.stdout.buffer.write(pickle.dumps(result))
\ No newline at end of file
+    if '--persistent' in sys.argv:
+        serve()
+    else:
+        model = pickle.loads(sys.stdin.buffer.read())
+        result = model.super_execute()
+        sys.stdout.buffer.write(pickle.dumps(result))
@@ -1,7 +1,9 @@
 from .context import data, algorithms, pset, objective, config
 import os
 import shutil
+import pickle
 import numpy as np
+import numpy.testing as npt
 
 
 class TestBayes:
@@ -79,6 +81,28 @@ class TestBayes:
         assert ba.prior['v2__FREE'] == ('log', 'b', 0., 1.)
         assert ba.prior['v3__FREE'] == ('reg', 'b', 0, 10)
 
+    def test_ln_priors(self):
+        ba = algorithms.BasicBayesMCMCAlgorithm(self.config)
+        ps = [ba.random_pset() for i in range(5)]
+        for i, p in enumerate(ps):
+            p.name = 'iter0run%i' % i
+        ln_p = ba.ln_priors(np.array([p.vector for p in ps]))
+        for p, lp in zip(ps, ln_p):
+            # lognormal(0, 0.5) + loguniform(1, 10) + uniform(0, 10)
+            expected = -np.log10(p['v1__FREE']) ** 2 / 0.5 - np.log(1.) - np.log(10.)
+            npt.assert_almost_equal(lp, expected)
+            npt.assert_almost_equal(ba.ln_prior(p), expected)
+        # Outside of the box
+        assert ba.ln_priors(np.array([[1., 20., 5.], [1., 5., 5.]]))[0] == -np.inf
+
+        # Parameters listed in a different order than the variables
+        reordered = pset.PSet([ps[0].get_param(name) for name in ('v3__FREE', 'v1__FREE', 'v2__FREE')])
+        npt.assert_almost_equal(ba.ln_prior(reordered), ln_p[0])
+
+        ba.stage_priors(ps)
+        assert ba.proposal_ln_prior(ps[1]) == ln_p[1]
+        assert ps[1].name not in ba.staged_priors
+
     def test_updates_box(self):
         # In this test, the variables have box constraints, so the prior contribution should be constant.
         # We test the decisions to replace / not replace, which should be fairly deterministic
@@ -155,6 +179,57 @@ class TestBayes:
                     assert parts[0] in [v.name for v in ba.variables]
                     assert float(parts[1]) < float(parts[2])
 
+    def test_sample_store(self):
+        ba = algorithms.BasicBayesMCMCAlgorithm(self.config_normal)
+        curr_params = ba.start_run()
+        for i in range(10):
+            next_params = []
+            for p in curr_params:
+                res = algorithms.Result(p, self.data1s, p.name)
+                res.score = 42.
+                next_params += ba.got_result(res)
+            curr_params = next_params
+
+        # The binary store holds the same samples as samples.txt
+        ba.sample_store.flush()
+        stored = np.load('noseoutput2/Results/samples.npy', mmap_mode='r')
+        assert stored.shape == (80,)
+        text = np.genfromtxt('noseoutput2/Results/samples.txt', usecols=(1, 2, 3, 4))
+        npt.assert_allclose(stored['Ln_probability'], text[:, 0])
+        npt.assert_allclose(stored['v2__FREE'], text[:, 2])
+
+        # Credible intervals match those from the fully sorted samples
+        with open('noseoutput2/Results/credible95_10.txt') as f:
+            lines = f.readlines()[1:]
+        for line in lines:
+            name, low, high = line.split('\t')
+            data = np.sort(stored[name])
+            assert float(low) == data[2] and float(high) == data[77]
+
+    def test_sample_writer(self):
+        writer = pset.SampleWriter('noseoutput1/Results/test_samples.txt', ['v2__FREE', 'v1__FREE', 'v3__FREE'],
+                                   buffer_rows=3)
+        p = self.pset
+        for i in range(2):
+            p.name = 'iter%irun0' % i
+            writer.append(p, -1.)
+        with open('noseoutput1/Results/test_samples.txt') as f:
+            assert f.readlines() == ['# Name\tLn_probability\tv1__FREE\tv2__FREE\tv3__FREE\n']
+        backup = pickle.dumps(writer)  # Writes the 2 buffered lines
+        for i in range(2, 5):
+            writer.append(p, -1.)  # Writes when the third line is added
+        with open('noseoutput1/Results/test_samples.txt') as f:
+            assert len(f.readlines()) == 6
+
+        # Resuming from the backup drops the lines written after it
+        resumed = pickle.loads(backup)
+        resumed.append(p, -2.)
+        resumed.flush()
+        with open('noseoutput1/Results/test_samples.txt') as f:
+            lines = f.readlines()
+        assert len(lines) == 4
+        assert lines[3] == '%s\t-2.0\t%s\n' % (p.name, p.values_to_string())
+
     def test_replica_exchange_run(self):
         ba = algorithms.BasicBayesMCMCAlgorithm(self.config_replica)
         start_params = ba.start_run()
@@ -177,6 +252,111 @@ class TestBayes:
                         assert len(nextlist) == 4
                         assert not np.any(ba.wait_for_sync)
 
+    def test_async_exchange_run(self):
+        conf = config.Configuration(dict(self.config_replica.config, async_exchange=1))
+        ba = algorithms.BasicBayesMCMCAlgorithm(conf)
+        start_params = ba.start_run()
+        for chain in (0, 2, 1):
+            ps = start_params[chain]
+            for i in range(5):
+                res = algorithms.Result(ps, self.data1s, ps.name)
+                res.score = 42.
+                nextlist = ba.got_result(res)
+                if i < 4:
+                    ps = nextlist[0]
+        # Chains 0 and 2 had no waiting neighbor, so they wait until chain 1 arrives. Chain 1 exchanges with one
+        # of them, and only those two resume.
+        assert len(nextlist) == 2
+        assert sum(ba.wait_for_sync) == 1
+        assert not ba.wait_for_sync[1]
+        assert not ba.wait_for_sync[3]
+        assert ba.exchange_attempts == 1
+        assert 1 in [int(p.name.split('run')[1]) for p in nextlist]
+        assert all([p.name.startswith('iter5') for p in nextlist])
+
+    def test_adaptive_proposal(self):
+        np.random.seed(0)
+        cov = np.array([[4., 1.9], [1.9, 1.]])
+        states = np.random.multivariate_normal([1., -1.], cov, size=2000)
+        proposal = algorithms.AdaptiveProposal(2, 0.2, 100)
+        for x in states[:50]:
+            proposal.add_state(x)
+        assert not proposal.adapted
+        npt.assert_almost_equal(np.linalg.norm(proposal.propose()), 0.2)
+        for x in states[50:]:
+            proposal.add_state(x)
+        assert proposal.adapted
+        npt.assert_allclose(proposal.mean, np.mean(states, axis=0))
+        npt.assert_allclose(proposal.covariance(), np.cov(states.T))
+        moves = np.array([proposal.propose() for i in range(5000)])
+        npt.assert_allclose(np.cov(moves.T), 2.38 ** 2 / 2 * cov, rtol=0.15, atol=0.15)
+
+        targeted = algorithms.AdaptiveProposal(2, 0.2, 100, target_acceptance=0.25)
+        for i in range(20):
+            targeted.add_move(True)
+        assert targeted.log_scale > 0.
+        npt.assert_almost_equal(np.linalg.norm(targeted.propose()), 0.2 * np.exp(targeted.log_scale))
+
+    def test_adaptive_run(self):
+        conf = config.Configuration(dict(self.config_replica_multi.config, adaptive_proposal=1, adaptive_start=4))
+        ba = algorithms.BasicBayesMCMCAlgorithm(conf)
+        start_params = ba.start_run()
+        # One proposal per beta, shared by the replicas at that beta
+        assert len(ba.proposals) == 4
+        ps = start_params[5]
+        for i in range(4):
+            res = algorithms.Result(ps, self.data1s, ps.name)
+            res.score = 42.
+            ps = ba.got_result(res)[0]
+        assert ba.proposals[1].n == 3
+        assert ba.proposals[0].n == 0
+
+    def test_convergence_monitor(self):
+        np.random.seed(0)
+        monitor = algorithms.ConvergenceMonitor(4, 2)
+        assert monitor.diagnostics() is None
+        # Parameter 0 is independent draws, parameter 1 is an AR(1) process with autocorrelation 0.9
+        ar = np.zeros((4, 2000))
+        ar[:, 0] = np.random.normal(size=4)
+        for t in range(1, 2000):
+            ar[:, t] = 0.9 * ar[:, t-1] + np.sqrt(1 - 0.81) * np.random.normal(size=4)
+        for t in range(2000):
+            for chain in range(4):
+                monitor.add(chain, [np.random.normal(), ar[chain, t]])
+        rhat, ess = monitor.diagnostics()
+        assert np.all(np.abs(rhat - 1.) < 0.01)
+        assert 6000 < ess[0] < 10000
+        # Expected 8000 * (1 - 0.9) / (1 + 0.9) = 421
+        assert 250 < ess[1] < 650
+
+        # A chain stuck elsewhere, and chains that were not sampled, as in parallel tempering
+        shifted = algorithms.ConvergenceMonitor(6, 2)
+        for t in range(500):
+            for chain in range(3):
+                shifted.add(chain, [np.random.normal() + (5. if chain == 2 else 0.), np.random.normal()])
+        rhat, ess = shifted.diagnostics()
+        assert rhat[0] > 1.5
+        assert rhat[1] < 1.05
+
+    def test_stop_on_convergence(self):
+        conf = config.Configuration(dict(self.config_box.config, max_iterations=100000, step_size=1., stop_rhat=1.1, stop_ess=50,
+                                         output_hist_every=10, burn_in=10, output_every=10**9))
+        ba = algorithms.BasicBayesMCMCAlgorithm(conf)
+        pending = ba.start_run()
+        response = []
+        while pending:
+            p = pending.pop(0)
+            res = algorithms.Result(p, self.data1s, p.name)
+            res.score = sum([(v - 3.) ** 2 for v in p.vector])
+            response = ba.got_result(res)
+            if response == 'STOP':
+                break
+            pending += response
+        assert response == 'STOP'
+        assert ba.converged
+        assert max(ba.iteration) < 100000
+        assert os.path.isfile('noseoutput1/Results/convergence_final.txt')
+
     def test_replica_exchange_function(self):
         count = 0
         for iters in range(20):
@@ -0,0 +1,142 @@
+from .context import algorithms, config, objective
+
+from collections import deque
+from os import makedirs, path
+import numpy as np
+import shutil
+
+
+class FakeFuture:
+    def __init__(self, result):
+        self.result = result
+
+
+class FakeClient:
+    """Runs submitted functions immediately, in place of a dask Client"""
+
+    def __init__(self):
+        self.cancelled = []
+
+    def scatter(self, data, broadcast=False, hash=True):
+        return list(data)
+
+    def submit(self, func, *args, **kwargs):
+        return FakeFuture(func(*args))
+
+    def cancel(self, futures):
+        self.cancelled += futures
+
+
+class FakePool:
+    """Returns futures in the order they were added, in place of custom_as_completed"""
+
+    def __init__(self, futures, with_results=True, raise_errors=True):
+        self.queue = deque(futures)
+
+    def update(self, futures):
+        self.queue.extend(futures)
+
+    def __next__(self):
+        f = self.queue.popleft()
+        return f, f.result
+
+
+submitted = []  # Simulation directories of the Jobs passed to score_job(), in order
+
+
+def score_job(j, debug=False, failed_logs_dir='', settings=None, calculator=None):
+    submitted.append(path.basename(j.output_dir))
+    res = algorithms.Result(j.params, None, j.job_id)
+    res.score = float(np.sum((j.params.vector - 3.) ** 2))
+    # Outputs that give the same score with any weights
+    res.outputs = objective.AlignedOutputs(dict(), res.score)
+    return res
+
+
+class TestBootstrap:
+    def __init__(self):
+        pass
+
+    @classmethod
+    def setup_class(cls):
+        cls.settings = {
+            'population_size': 6, 'max_iterations': 3, 'mutation_rate': 1.0, 'fit_type': 'de', 'bootstrap': 3,
+            ('uniform_var', 'v1__FREE'): [0, 10], ('uniform_var', 'v2__FREE'): [0, 10], ('uniform_var', 'v3__FREE'): [0, 10],
+            'models': {'bngl_files/parabola.bngl'}, 'exp_data': {'bngl_files/par1.exp'}, 'initialization': 'lh',
+            'bngl_files/parabola.bngl': ['bngl_files/par1.exp'], 'eval_cache': 100, 'eval_cache_data': 1,
+            'delete_old_files': 1, 'save_best_data': 0, 'output_dir': 'test_bootstrap'}
+        makedirs('test_bootstrap/Results')
+        cls.as_completed = algorithms.custom_as_completed
+        cls.run_job = algorithms.run_job
+        algorithms.custom_as_completed = FakePool
+        algorithms.run_job = score_job
+
+    @classmethod
+    def teardown_class(cls):
+        algorithms.custom_as_completed = cls.as_completed
+        algorithms.run_job = cls.run_job
+        shutil.rmtree('test_bootstrap')
+
+    def test_replicate(self):
+        np.random.seed(0)
+        de = algorithms.DifferentialEvolution(config.Configuration(dict(self.settings)))
+        de.run(FakeClient())
+        exp = de.exp_data['parabola']['par1']
+        weights = exp.weights.copy()
+        rep = de.bootstrap_replicate(1)
+
+        assert rep.bootstrap_number == 1
+        assert rep.res_dir == 'test_bootstrap/Results-boot1'
+        assert path.exists('test_bootstrap/Results-boot1/par1_weights_1.txt')
+        assert rep.backup_name == 'alg_backup_boot1'
+        assert rep.config is de.config
+        assert rep.model_list is de.model_list
+        rep_exp = rep.exp_data['parabola']['par1']
+        assert rep_exp is not exp
+        assert not np.array_equal(rep_exp.weights, weights)
+        assert np.array_equal(exp.weights, weights)
+        # The copy of the evaluation cache keeps the outputs, but marks the scores as out of date, because they were
+        # computed with the original weights
+        assert len(de.eval_cache) > 0
+        assert len(rep.eval_cache) == len(de.eval_cache)
+        assert all(e[1] is None for e in rep.eval_cache._entries.values())
+        assert all(e[1] is not None for e in de.eval_cache._entries.values())
+        assert rep.eval_cache.data_bytes == de.eval_cache.data_bytes
+        ps, (name, score, outputs) = next(iter(de.eval_cache._entries.items()))
+        assert rep.eval_cache._entries[ps][2] is outputs
+        # A hit is scored again from the outputs, without changing the original cache
+        res = rep.cached_result(ps)
+        assert res.score == score and res.name == name
+        assert rep.eval_cache.rescored == 1
+        assert rep.eval_cache._entries[ps][1] == score
+        assert de.eval_cache.rescored == 0
+
+        # Running the replicate does not change the state of the original fit
+        individuals = list(de.individuals[0])
+        rep.run(FakeClient())
+        assert de.individuals[0] == individuals
+        assert path.exists('test_bootstrap/alg_backup_boot1.bp')
+
+    def test_run_concurrently(self):
+        np.random.seed(1)
+        de = algorithms.DifferentialEvolution(config.Configuration(dict(self.settings, eval_cache=0)))
+        de.run(FakeClient())
+        client = FakeClient()
+        to_start = [2]
+        finished = []
+
+        def next_run(replicate):
+            assert replicate.run_state is None
+            finished.append(replicate.bootstrap_number)
+            return (de.bootstrap_replicate(to_start.pop()), None) if to_start else None
+
+        replicates = [de.bootstrap_replicate(0), de.bootstrap_replicate(1)]
+        del submitted[:]
+        algorithms.run_concurrently(client, [(r, None) for r in replicates], next_run)
+        assert finished == [0, 1, 2]
+        for r in replicates:
+            assert r.best_fit_obj == r.trajectory.best_score()
+        # The Jobs of the first two replicates were interleaved, and the third started after the first finished
+        assert submitted.index('Simulations-boot1') < len(submitted) - \
+            submitted[::-1].index('Simulations-boot0') - 1
+        assert submitted.index('Simulations-boot2') > submitted.index('Simulations-boot1')
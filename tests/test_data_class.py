@@ -245,3 +245,21 @@ class TestData:
         d0.data = d0._read_file_lines(self.data0, '\s+')
         d0.normalize('peak')
         npt.assert_allclose(d0.data, np.array([[0., 1., 1., 1., np.nan, 1.], [1., 1., 1., 1., np.nan, 1.]]))
+
+    def test_bulk_reader_agrees(self):
+        # The bulk reader must give the same result as reading line by line, including comments, blank lines, NaN
+        # and Inf
+        for lines in (self.data0, self.data1, self.data1c, self.data1d, self.data2):
+            d = data.Data()
+            ncols = d._read_header(lines[0], '\s+')
+            npt.assert_array_equal(d._read_body_bulk(lines[1:], ncols), d._read_body_lines(lines[1:], '\s+', ncols))
+
+    def test_bulk_reader_fallback(self):
+        d = data.Data()
+        assert d._read_body_bulk(self.data3[1:], d._read_header(self.data3[0], '\s+')) is None
+        try:
+            d._read_file_lines(self.data3, '\s+', 'data3.exp')
+        except printing.PybnfError as e:
+            assert e.log_message == 'Parsing data3.exp on line 3: Found 3 values, expected 4'
+        else:
+            assert False
@@ -1,5 +1,7 @@
 from .context import data, algorithms, pset, objective, config
 
+import itertools
+import numpy as np
 import shutil
 
 
@@ -111,3 +113,33 @@ class TestDiffEvolution:
 
         assert de.migration_ready == [1, 1]
         assert de.migration_done == [0, 1]
+
+    def test_new_generation(self):
+        de = algorithms.DifferentialEvolution(self.config)
+        de.start_run()
+        schema = de.proposed_individuals[0][0].schema
+        individuals = [pset.PSet.from_vector(schema, [v, 2.*v, 3.]) for v in (1., 2., 3.)]
+        # With 3 individuals, rand1 must use all 3 of them in some order
+        expected = []
+        for a, b, c in itertools.permutations(range(3)):
+            expected.append(individuals[a].vector + de.mutation_factor * (individuals[b].vector -
+                                                                           individuals[c].vector))
+        np.random.seed(0)
+        new = de.new_generation(individuals, [None] * 20)
+        assert len(new) == 20
+        for p in new:
+            assert any(np.allclose(p.vector, e) for e in expected)
+
+        # With a base index, the base must be that individual
+        new = de.new_generation(individuals, [0, 1, 2])
+        for j, p in enumerate(new):
+            others = [i for i in range(3) if i != j]
+            assert any(np.allclose(p.vector, individuals[j].vector + de.mutation_factor *
+                                   (individuals[b].vector - individuals[c].vector))
+                       for b, c in itertools.permutations(others))
+
+        # Reproducible from the seed
+        np.random.seed(1)
+        first = de.new_generation(individuals, [None] * 5)
+        np.random.seed(1)
+        assert first == de.new_generation(individuals, [None] * 5)
@@ -1,5 +1,6 @@
 from .context import algorithms, objective, data, config
 
+import numpy as np
 import os
 import re
 import shutil
@@ -63,3 +64,33 @@ class TestDream:
 
         for pset in next_gen:
             assert re.match('iter1run\d+', pset.name) is not None
+
+    def test_new_psets(self):
+        dream = algorithms.DreamAlgorithm(self.config)
+        dream.current_pset = dream.start_run()
+        new_psets = dream.calculate_new_psets()
+        assert len(new_psets) == 20
+        valid = [p for p in new_psets if p is not None]
+        assert len(valid) > 0
+        for p in valid:
+            assert p.keys() == dream.current_pset[0].keys()
+            assert 0. <= p['v1__FREE'] <= 0.5
+            assert 1. <= p['v2__FREE'] <= 10.
+
+        # With lambda and zeta set to 0, and a step size of 1, each move is the difference of 2 other chains
+        dream.config.config['lambda'] = 0.
+        dream.config.config['zeta'] = 0.
+        dream.g_prob = 1.
+        dream.ncr = [1.]
+        schema = dream.current_pset[0].schema
+        base = dream.current_pset[0].vector.copy()
+        base[schema.index['v3__FREE']] = 0.
+        direction = np.arange(3) == schema.index['v3__FREE']
+        dream.current_pset = [algorithms.PSet.from_vector(schema, base + 0.4 * i * direction) for i in range(20)]
+        for i, p in enumerate(dream.calculate_new_psets()):
+            if p is not None:
+                steps = p['v3__FREE'] / 0.4
+                assert abs(steps - round(steps)) < 1e-9
+                # The 2 other chains are distinct, so the move is not 0
+                assert round(steps) != i
+                assert p['v1__FREE'] == dream.current_pset[0]['v1__FREE']
@@ -0,0 +1,169 @@
+from .context import pset, algorithms, objective, config
+import numpy as np
+import pickle
+from os import path
+from shutil import rmtree
+
+
+class TestEvaluationStore:
+    def __init__(self):
+        pass
+
+    @classmethod
+    def setup_class(cls):
+        cls.variables = [pset.FreeParameter('b', 'uniform_var', 0, 10), pset.FreeParameter('a', 'loguniform_var', 1, 100)]
+        cls.psets = [pset.PSet([cls.variables[0].set_value(i), cls.variables[1].set_value(i + 1.)]) for i in range(5)]
+        cls.results = []
+        for i, ps in enumerate(cls.psets):
+            res = algorithms.Result(ps, None, 'gen%iind%i' % (i // 2, i))
+            res.score = float(i)
+            res.wall_time = 0.5 * i
+            cls.results.append(res)
+        failed = algorithms.FailedSimulation(cls.psets[0], 'simplex_init0', 0)
+        failed.score = np.inf
+        cls.results.append(failed)
+
+    @classmethod
+    def teardown_class(cls):
+        if path.isdir('test_eval_store'):
+            rmtree('test_eval_store')
+
+    def test_append_read(self):
+        store = pset.EvaluationStore('test_eval_store', ['a', 'b'], chunk_size=4)
+        for res in self.results:
+            store.append(res)
+        assert store.n_rows == 4  # One chunk written
+        store.flush()
+        assert store.n_rows == 6
+
+        cols = pset.EvaluationStore.read('test_eval_store')
+        assert cols['param_names'] == ['a', 'b']
+        assert list(cols['score']) == [0., 1., 2., 3., 4., np.inf]
+        assert list(cols['iteration']) == [0, 0, 1, 1, 2, -1]
+        assert list(cols['fail_type']) == [-1, -1, -1, -1, -1, 0]
+        assert np.isnan(cols['wall_time'][5])
+        assert cols['params'].shape == (6, 2)
+        assert list(cols['params'][3]) == [4., 3.]
+        assert cols['names'][5] == 'simplex_init0'
+
+        part = pset.EvaluationStore.read('test_eval_store', 2, 4, ['score', 'names'], mmap=False)
+        assert list(part['score']) == [2., 3.]
+        assert part['names'] == ['gen1ind2', 'gen1ind3']
+        assert 'params' not in part
+        assert np.load('test_eval_store/score.npy', mmap_mode='r').shape == (6,)
+
+    def test_resume(self):
+        store = pset.EvaluationStore('test_eval_store', ['a', 'b'])
+        for res in self.results[:3]:
+            store.append(res)
+        store.flush()
+        backup = pickle.dumps(store)
+        for res in self.results[3:]:
+            store.append(res)
+        store.flush()
+
+        # Rows added after the backup are dropped on resume
+        resumed = pickle.loads(backup)
+        resumed.append(self.results[5])
+        resumed.flush()
+        cols = pset.EvaluationStore.read('test_eval_store')
+        assert list(cols['score']) == [0., 1., 2., np.inf]
+        assert cols['names'] == ['gen0ind0', 'gen0ind1', 'gen1ind2', 'simplex_init0']
+
+
+class TestEvaluationCache:
+    def __init__(self):
+        pass
+
+    @classmethod
+    def setup_class(cls):
+        cls.variables = [pset.FreeParameter('b', 'uniform_var', 0, 10), pset.FreeParameter('a', 'loguniform_var', 1, 100)]
+
+    def result(self, b, a, score, name):
+        res = algorithms.Result(pset.PSet([self.variables[0].set_value(b), self.variables[1].set_value(a)]), None, name)
+        res.score = score
+        res.outputs = objective.AlignedOutputs({('model', 'data'): (['obs'], np.full((10, 1), score))}, 0.)
+        return res
+
+    def test_lru(self):
+        cache = pset.EvaluationCache(2)
+        r0, r1, r2 = self.result(1., 2., 5., 'gen0ind0'), self.result(2., 2., 6., 'gen0ind1'), \
+            self.result(3., 2., 7., 'gen0ind2')
+        cache.put(r0)
+        cache.put(r1)
+        assert cache.get(self.result(1., 2., 0., 'gen1ind0').pset) == ['gen0ind0', 5., None]
+        cache.put(r2)  # Discards r1, the least recently used
+        assert len(cache) == 2
+        assert cache.get(r1.pset) is None
+        assert cache.get(r2.pset)[1] == 7.
+        assert cache.get(self.result(1. + 1e-9, 2., 0., 'x').pset) is None
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert cache.stats() == 'Evaluation cache: 2 hits in 4 lookups (50.0%), 0 rescored, 2 entries'
+
+    def test_tolerance(self):
+        cache = pset.EvaluationCache(10, tolerance=1e-3)
+        cache.put(self.result(1., 10., 5., 'gen0ind0'))
+        # a varies in log space, so the tolerance applies to log10(a)
+        assert cache.get(self.result(1.0002, 10. ** 1.0002, 0., 'x').pset)[0] == 'gen0ind0'
+        assert cache.get(self.result(1., 10. ** 1.002, 0., 'x').pset) is None
+
+    def test_invalidate(self):
+        cache = pset.EvaluationCache(10, max_data_bytes=10 ** 6)
+        r0 = self.result(1., 2., 5., 'gen0ind0')
+        cache.put(r0)
+        r1 = self.result(2., 2., 6., 'gen0ind1')
+        r1.outputs = None
+        cache.put(r1)
+        cache.invalidate()
+        assert len(cache) == 1
+        name, score, outputs = cache.get(r0.pset)
+        assert score is None
+        assert outputs is r0.outputs
+        cache.update(r0.pset, 4.)
+        assert cache.get(r0.pset)[1] == 4.
+        assert cache.rescored == 1
+
+        # Backups drop simulation outputs, and with them the entries that cannot be scored again
+        cache.invalidate()
+        cache.put(self.result(3., 2., 7., 'gen1ind0'))
+        loaded = pickle.loads(pickle.dumps(cache))
+        assert len(loaded) == 1
+        assert loaded.data_bytes == 0
+        assert loaded.get(self.result(3., 2., 0., 'x').pset) == ['gen1ind0', 7., None]
+
+    def test_data_limit(self):
+        nbytes = self.result(0., 2., 0., 'x').outputs.nbytes
+        cache = pset.EvaluationCache(10, max_data_bytes=3 * nbytes)
+        results = [self.result(float(i), 2., float(i), 'gen0ind%i' % i) for i in range(4)]
+        for r in results[:3]:
+            cache.put(r)
+        cache.get(results[0].pset)
+        cache.put(results[3])  # Drops the outputs of results[1], the least recently used
+        assert cache.data_bytes == 3 * nbytes
+        assert cache.get(results[1].pset) == ['gen0ind1', 1., None]
+        assert cache.get(results[0].pset)[2] is results[0].outputs
+
+        # Out of date entries are removed entirely when their outputs are dropped
+        cache.invalidate()
+        assert len(cache) == 3
+        cache.put(self.result(9., 2., 9., 'gen1ind0'))
+        assert len(cache) == 3
+        assert cache.get(results[2].pset) is None
+        assert cache.data_bytes == 3 * nbytes
+        assert cache.stats().endswith(', 3 with outputs (%.2f MB)' % (3 * nbytes / 1e6))
+
+    def test_stochastic_models(self):
+        settings = {'population_size': 4, 'max_iterations': 2, 'fit_type': 'de', 'eval_cache': 100,
+                    ('uniform_var', 'v1__FREE'): [0, 10], ('uniform_var', 'v2__FREE'): [0, 10],
+                    ('uniform_var', 'v3__FREE'): [0, 10], 'models': {'bngl_files/parabola.bngl'},
+                    'exp_data': {'bngl_files/par1.exp'}, 'bngl_files/parabola.bngl': ['bngl_files/par1.exp'],
+                    'output_dir': 'test_eval_cache'}
+        try:
+            de = algorithms.DifferentialEvolution(config.Configuration(dict(settings)))
+            assert de.eval_cache is not None
+            # A repeated PSet should be simulated again rather than reuse one stochastic sample
+            ssa = dict(settings, time_course=[{'time': '10', 'method': 'ssa', 'suffix': 'ssa1'}])
+            de = algorithms.DifferentialEvolution(config.Configuration(ssa))
+            assert de.eval_cache is None
+        finally:
+            rmtree('test_eval_cache')
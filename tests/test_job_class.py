@@ -5,6 +5,7 @@ from .context import config
 from os import mkdir
 from os import environ
 from os import getcwd
+from os import listdir
 from os.path import isfile
 from os.path import isdir
 from shutil import rmtree
@@ -43,6 +44,12 @@ class TestJob(object):
         rmtree('sim_1')
         rmtree('sim_to')
         rmtree('sim_to_rerun1')
+        rmtree('scratch_test')
+        rmtree('sim_scr_keep')
+        rmtree('sim_scr_err')
+        rmtree('sim_batch1')
+        rmtree('sim_batch2')
+        rmtree('sim_shared')
 
     def test_job_components(self):
         mkdir('sim_x')
@@ -81,10 +88,107 @@ class TestJob(object):
         assert isfile('sim_net/TrickyWP_p1_5_test.gdat')
         assert isfile('sim_net/TrickyWP_p1_5_test.log')
 
+    def test_direct_net_job(self):
+        acts = ['simulate({method=>"ode",t_start=>0,t_end=>10,n_steps=>5,suffix=>"s1",print_functions=>1})',
+                'resetConcentrations()',
+                'simulate({method=>"ode",t_start=>0,t_end=>2,n_steps=>4,suffix=>"s2",print_functions=>1})']
+        suffs = [('simulate', 's1'), ('simulate', 's2')]
+        ps = pset.PSet([pset.FreeParameter('koff', 'normal_var', 0, 1, value=0.5)])
+        results = []
+        for direct in (False, True):
+            netmodel = pset.NetModel('TrickyWP_p1_5', acts, suffs, [], nf='bngl_files/TrickyWP_p1_5.net')
+            netmodel.bng_command = self.bng_command
+            netmodel.set_direct(direct)
+            job = algorithms.Job([netmodel], ps, 'direct%i' % direct, '.', calc_future=None, norm_settings=None,
+                                 timeout=None, postproc_settings=dict(), delete_folder=True)
+            res = job.run_simulation()
+            assert isinstance(res, algorithms.Result)
+            results.append(res.simdata['TrickyWP_p1_5'])
+        for suff in ('s1', 's2'):
+            assert results[0][suff].cols == results[1][suff].cols
+            np.testing.assert_allclose(results[0][suff].data, results[1][suff].data)
+        # The actions are parsed once on the template model, and shared by the copy made for each job
+        assert len(netmodel._direct_actions) == 2
+        assert netmodel.copy_with_param_set(ps)._direct_actions is netmodel._direct_actions
+        netmodel = pset.NetModel('TrickyWP_p1_5', ['simulate({method=>"nf",t_end=>10})'], [], [],
+                                 nf='bngl_files/TrickyWP_p1_5.net')
+        netmodel.set_direct(True)
+        assert netmodel._direct_actions == []
+
+    def test_direct_actions(self):
+        assert len(pset.NetModel.parse_direct_actions(
+            ['simulate({method=>"ssa",t_end=>10,n_steps=>5,suffix=>"a"})', 'resetConcentrations()',
+             'simulate_ode({t_end=>5,suffix=>"b"}) # comment', ''])) == 2
+        # Actions that run_network can't do on its own
+        assert pset.NetModel.parse_direct_actions(['simulate({method=>"ode",t_end=>10})',
+                                                   'simulate({method=>"ode",t_end=>20})']) is None
+        assert pset.NetModel.parse_direct_actions(['simulate({method=>"ode",t_end=>T})']) is None
+        assert pset.NetModel.parse_direct_actions(['simulate({method=>"nf",t_end=>10})']) is None
+        assert pset.NetModel.parse_direct_actions(['setParameter("koff",1)']) is None
+
+    def test_scratch_job(self):
+        job = algorithms.Job([self.model], self.pset, 'sim_scr', '.', calc_future=None, norm_settings=None,
+                             timeout=None, postproc_settings=dict(), delete_folder=True, scratch_dir='scratch_test')
+        res = job.run_simulation()
+        assert isinstance(res, algorithms.Result)
+        assert res.simdata['Tricky'].keys() == set(['p1_5', 'thing'])
+        # Successful jobs leave nothing behind in the Simulations folder, and the scratch folder is emptied for reuse
+        assert not isdir('sim_scr')
+        scratch_folders = listdir('scratch_test')
+        assert len(scratch_folders) == 1
+        assert listdir('scratch_test/' + scratch_folders[0]) == []
+
+        job_keep = algorithms.Job([self.model], self.pset, 'sim_scr_keep', '.', calc_future=None, norm_settings=None,
+                                  timeout=None, postproc_settings=dict(), delete_folder=False,
+                                  scratch_dir='scratch_test')
+        job_keep.run_simulation()
+        assert isfile('sim_scr_keep/Tricky_sim_scr_keep.bngl')
+        assert isdir('sim_scr_keep/Tricky_sim_scr_keep_thing')
+        assert listdir('scratch_test') == scratch_folders
+
+    def test_scratch_job_error(self):
+        class BrokenFuture:
+            def result(self):
+                raise RuntimeError('No calculator')
+
+        job = algorithms.Job([self.model], self.pset, 'sim_scr_err', '.', calc_future=BrokenFuture(),
+                             norm_settings=None, timeout=None, postproc_settings=dict(), delete_folder=True,
+                             scratch_dir='scratch_test')
+        shared_folder = job.folder
+        try:
+            job.run_simulation()
+        except RuntimeError:
+            pass
+        else:
+            assert False
+        # The job's folder is restored, and its files are kept for debugging
+        assert job.folder == shared_folder
+        assert isfile('sim_scr_err/Tricky_sim_scr_err.bngl')
+        for folder in listdir('scratch_test'):
+            assert listdir('scratch_test/' + folder) == []
+
     def test_timeout(self):
         res = self.job_to.run_simulation()
         assert isinstance(res, algorithms.FailedSimulation)
 
+    def test_run_jobs(self):
+        jobs = [algorithms.Job([self.model], self.pset, 'sim_batch1', '.', calc_future=None, norm_settings=None,
+                               timeout=None, postproc_settings=dict()),
+                algorithms.Job([self.model], self.pset, 'sim_batch2', '.', calc_future=None, norm_settings=None,
+                               timeout=0, postproc_settings=dict())]
+        results = algorithms.run_jobs(jobs)
+        assert [r.name for r in results] == ['sim_batch1', 'sim_batch2']
+        assert not isinstance(results[0], algorithms.FailedSimulation)
+        assert isinstance(results[1], algorithms.FailedSimulation)
+
+    def test_shared_settings(self):
+        job = algorithms.Job(None, self.pset, 'sim_shared', '.', calc_future=None, norm_settings=None, timeout=None,
+                             postproc_settings=None, settings_id=1)
+        settings = [None, algorithms.JobSettings([self.model], None, dict())]
+        res = algorithms.run_job(job, settings=settings)
+        assert not isinstance(res, algorithms.FailedSimulation)
+        assert res.simdata['Tricky'].keys() == set(['p1_5', 'thing'])
+
     def test_add_failedsimulation(self):
         a = algorithms.Algorithm(
             config.Configuration({"models": {"bngl_files/parabola.bngl"}, 'exp_data': {'bngl_files/par1.exp'},
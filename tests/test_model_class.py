@@ -184,6 +184,23 @@ class TestModel:
         netmodel = pset.NetModel('TrickyWP_p1_5', [], [], [], nf=self.file5)
         assert len(netmodel.netfile_lines) == 48
 
+    def test_netfile_template(self):
+        netmodel = pset.NetModel('TrickyWP_p1_5', [], [], [], nf=self.file5)
+        # Only numerical parameters can be substituted; expressions such as Vecf are left alone
+        assert [slot[0] for slot in netmodel._template[1]] == ['f', 'NA', 'T', 'Vchannel', 'Nchannel', 'Ag_conc1',
+                                                               'koff', 'kase', 'pase', 'H_tot']
+        # With no parameters changed, the copy is identical to the original
+        empty = netmodel.copy_with_param_set(pset.PSet([pset.FreeParameter('x', 'normal_var', 0, 1, value=1)]))
+        assert empty.netfile_text == netmodel.netfile_text
+        # A copy of a copy keeps the values set by the first PSet
+        ps1 = pset.PSet([pset.FreeParameter('koff', 'normal_var', 0, 1, value=2.5)])
+        ps2 = pset.PSet([pset.FreeParameter('T', 'normal_var', 0, 1, value=30.)])
+        copy1 = netmodel.copy_with_param_set(ps1)
+        copy2 = copy1.copy_with_param_set(ps2)
+        assert re.search('T\s+30.0\n', copy2.netfile_lines[4])
+        assert re.search('koff\s+2.5\n', copy2.netfile_lines[13])
+        assert copy1.netfile_lines[4] == netmodel.netfile_lines[4]
+
     def test_netfile_pcopy_and_save(self):
         netmodel = pset.NetModel('TrickyWP_p1_5', [], [], [], nf=self.file5)
         params = [pset.FreeParameter('Vchannel', 'normal_var', 0, 1, value=1e-5),
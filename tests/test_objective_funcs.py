@@ -141,3 +141,74 @@ class TestObjectiveFunctions:
     @raises(printing.PybnfError)
     def test_unused_row(self):
         self.sos.evaluate(self.d1s, self.d1e_extrarow)
+
+    def test_pointwise_agrees(self):
+        # The array evaluation must agree with the point-by-point reference implementation
+        sod = objective.SumOfDiffsObjective()
+        for obj in (self.sos, sod, self.norm_sos, self.ave_norm_sos):
+            npt.assert_almost_equal(obj.evaluate(self.d1s, self.d1e), obj.evaluate_pointwise(self.d1s, self.d1e))
+            assert obj.evaluate_pointwise(self.d1s_nan, self.d1e) is None
+        npt.assert_almost_equal(self.chi_sq.evaluate(self.d1s, self.d1e_sd),
+                                self.chi_sq.evaluate_pointwise(self.d1s, self.d1e_sd))
+
+    def test_pointwise_agrees_random(self):
+        rng = np.random.RandomState(0)
+        exp = data.Data()
+        exp.data = exp._read_file_lines(['# time A B A_SD B_SD\n'] +
+                                        ['%s %s %s %s %s\n' % (t, a, b, sa, sb) for t, a, b, sa, sb in
+                                         zip(range(0, 40, 2), rng.rand(20), rng.rand(20), rng.rand(20) + 0.1,
+                                             rng.rand(20) + 0.1)], '\s+')
+        exp.data[3, 1] = np.nan  # Missing data point
+        exp.weights = rng.randint(0, 3, size=exp.data.shape)
+        sim = data.Data()
+        sim.data = sim._read_file_lines(['# time A B C\n'] + ['%s %s %s 1\n' % (t, a, b) for t, a, b in
+                                                               zip(np.linspace(0, 50, 101), rng.rand(101),
+                                                                   rng.rand(101))], '\s+')
+        shuffled = data.Data()
+        shuffled.data = shuffled._read_file_lines(['# time A B C\n'] +
+                                                  ['%s %s %s %s\n' % tuple(row) for row in rng.permutation(sim.data)],
+                                                  '\s+')
+        for obj in (objective.ChiSquareObjective(), objective.SumOfSquaresObjective(),
+                    objective.SumOfDiffsObjective(), objective.NormSumOfSquaresObjective(),
+                    objective.AveNormSumOfSquaresObjective(), objective.SumOfSquaresObjective(ind_var_rounding=1)):
+            for s in (sim, shuffled):
+                npt.assert_almost_equal(obj.evaluate(s, exp, show_warnings=False),
+                                        obj.evaluate_pointwise(s, exp, show_warnings=False))
+
+    @raises(printing.PybnfError)
+    def test_unused_row_pointwise(self):
+        self.sos.evaluate_pointwise(self.d1s, self.d1e_extrarow)
+
+    def test_row_cache(self):
+        calc = objective.ObjectiveCalculator(self.sos, {'m': {'s': self.d1e}}, ())
+        npt.assert_almost_equal(calc.evaluate_objective({'m': {'s': self.d1s}}), 0.1)
+        npt.assert_almost_equal(calc.evaluate_objective({'m': {'s': self.d1s}}), 0.1)
+        assert calc.row_cache.misses == 1
+        assert calc.row_cache.hits == 1
+        # A different simulation grid is searched again and cached separately
+        npt.assert_almost_equal(calc.evaluate_objective({'m': {'s': self.d1e}}), 0.)
+        assert calc.row_cache.misses == 2
+        npt.assert_almost_equal(calc.evaluate_objective({'m': {'s': self.d1s}}), 0.1)
+        assert calc.row_cache.hits == 2
+
+    def test_aligned_outputs(self):
+        # Scoring the kept outputs must agree with evaluate_multiple(), also after the weights change
+        exp = data.Data()
+        exp.data = exp._read_file_lines(self.data1e, '\s+')
+        exp_dict = {'m': {'s': exp}}
+        sim_dict = {'m': {'s': self.d1s, 'unused': self.d1e_extracol}}
+        calc = objective.ObjectiveCalculator(self.sos, exp_dict, (), keep_outputs=True)
+        score, outputs = calc.evaluate_outputs(sim_dict)
+        npt.assert_almost_equal(score, self.sos.evaluate_multiple(sim_dict, exp_dict))
+        assert list(outputs.values) == [('m', 's')]
+        assert outputs.values['m', 's'][0] == ['obs1', 'obs3']
+        assert outputs.values['m', 's'][1].shape == (3, 2)
+        assert outputs.nbytes < self.d1s.data.nbytes + self.d1e_extracol.data.nbytes + 200
+
+        np.random.seed(0)
+        exp.gen_bootstrap_weights()
+        npt.assert_almost_equal(self.sos.evaluate_outputs(outputs, exp_dict),
+                                self.sos.evaluate_multiple(sim_dict, exp_dict))
+        assert self.sos.evaluate_outputs(self.sos.aligned_outputs({'m': {'s': self.d1s_nan}}, exp_dict,
+                                                                  show_warnings=False), exp_dict) is None
+        assert self.sos.evaluate_outputs(self.sos.aligned_outputs({}, exp_dict), exp_dict) == np.inf
@@ -1,4 +1,5 @@
 from .context import data, algorithms, pset, objective, config, parse
+import numpy as np
 import numpy.testing as npt
 from os import mkdir, path
 from shutil import rmtree
@@ -111,6 +112,27 @@ class TestParticleSwarm:
                 assert ps.bests[i][0] in start_params
         assert count == 1
 
+    def test_swarm_arrays(self):
+        ps = algorithms.ParticleSwarm(deepcopy(self.config2))
+        ps.config.config['v_stop'] = 1e-10
+        start_params = ps.start_run()
+        assert ps.positions.shape == (15, 3)
+        assert np.all(ps.velocities == 0.)
+        next_params = []
+        for i, p in enumerate(start_params):
+            new_result = algorithms.Result(p, self.d2s, 'sim_1')
+            new_result.score = float(i)
+            next_params += ps.got_result(new_result)
+        assert len(next_params) == 15
+        npt.assert_allclose(ps.global_best_position, start_params[0].search_vector())
+        schema = start_params[0].schema
+        for i in range(15):
+            npt.assert_allclose(ps.positions[i], ps.swarm[i][0].search_vector())
+            assert schema.in_bounds(ps.swarm[i][0].vector)
+            assert ps.speeds[i] == np.max(np.abs(ps.velocities[i]))
+            npt.assert_allclose(ps.best_positions[i], start_params[i].search_vector())
+        assert ps.swarm[0][0] in next_params
+
     def test_latin_hypercube(self):
         ps = algorithms.ParticleSwarm(self.lh_config)
         ps.start_run()
@@ -1,6 +1,8 @@
 from .context import pset
 from .context import printing
 from nose.tools import raises
+import numpy as np
+import pickle
 
 
 class TestPSet:
@@ -59,3 +61,38 @@ class TestPSet:
     def test_immutable(self):
         ps1 = pset.PSet(self.fps0)
         ps1['var0__FREE'] = 1.5
+
+    def test_vector(self):
+        ps1 = pset.PSet(self.fps0)
+        ps2 = pset.PSet.from_vector(ps1.schema, [1.0, 0.1, 99.0])
+        assert ps2 == ps1
+        assert hash(ps2) == hash(ps1)
+        assert ps2['var2__FREE'] == 99.0
+        assert ps2.get_param('var1__FREE') == self.p1
+        # Same parameters listed in a different order
+        ps3 = pset.PSet([self.p2, self.p0, self.p1])
+        assert ps3 == ps1
+        assert hash(ps3) == hash(ps1)
+        assert pset.PSet.from_vector(ps1.schema, [1.0, 0.1, 98.0]) != ps1
+        assert np.allclose(ps1.search_vector(), [1.0, -1.0, np.log10(99.)])
+
+    def test_add_search_vector(self):
+        ps1 = pset.PSet(self.fps0)
+        deltas = [[0.5, 0.5, 0.5], [-3.5, 0.2, -2.], [-1., -5., -3.5], [0., 0., 11.3]]
+        for delta in deltas:
+            new = ps1.add_search_vector(np.array(delta))
+            old = pset.PSet([fp.add(d) for fp, d in zip(ps1, delta)])
+            assert np.allclose(new.vector, old.vector)
+
+    @raises(pset.OutOfBoundsException)
+    def test_add_search_vector_no_reflect(self):
+        ps1 = pset.PSet(self.fps0)
+        ps1.add_search_vector(np.array([0., 0., 0.5]), reflect=False)
+
+    def test_pickle(self):
+        ps1 = pset.PSet.from_vector(pset.PSet(self.fps0).schema, [2.0, 0.3, 5.0])
+        ps1.name = 'p'
+        ps2 = pickle.loads(pickle.dumps(ps1))
+        assert ps2 == ps1
+        assert ps2.name == 'p'
+        assert ps2.schema is ps1.schema
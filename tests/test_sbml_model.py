@@ -3,6 +3,7 @@ from nose.tools import raises
 import os
 import numpy as np
 import shutil
+import subprocess
 
 
 class TestSbmlModel:
@@ -93,6 +94,72 @@ class TestSbmlModel:
         assert abs(dat['R'][-1] - 0.358949) < 0.01
         assert dat.cols['time'] == 0
 
+    def test_runner_reuse(self):
+        action = pset.TimeCourse({'time': '1000', 'step': '10'})
+        m = pset.SbmlModelNoTimeout(self.file, self.abs_file, actions=(action,))
+        m.add_mutant(pset.MutationSet((pset.Mutation('K3', '*', 4),), suffix='k3x4'))
+        key = (m.abs_file_path, m.integrator)
+        runner = pset._runner_cache[key][-1]
+
+        # Mutated run with K3=2000, then an unmutated run with K3=8000 on the same cached instance
+        m1 = m.copy_with_param_set(pset.PSet(self.params2))
+        m2 = m.copy_with_param_set(pset.PSet(self.params))
+        res1 = m1.execute(os.getcwd(), self.savefile2, None)
+        assert pset._runner_cache[key][-1] is runner
+        res2 = m2.execute(os.getcwd(), self.savefile2, None)
+        assert pset._runner_cache[key][-1] is runner
+        for res in (res1['time_coursek3x4'], res2['time_course']):
+            assert abs(res['RIRI'][-1] - 2.94514) < 0.01
+            assert abs(res['R'][-1] - 0.358949) < 0.01
+        assert m1.mutants[1] is not m.mutants[1]
+
+    def test_persistent_execute(self):
+        action = pset.TimeCourse({'time': '1000', 'step': '10'})
+        m = pset.SbmlModel(self.file, self.abs_file, actions=(action,))
+        m.persistent = True
+        pids = []
+        for params in (self.params, self.params):
+            result = m.copy_with_param_set(pset.PSet(params)).execute(os.getcwd(), self.savefile2, 1000)
+            dat = result['time_course']
+            assert abs(dat['RIRI'][-1] - 2.94514) < 0.01
+            assert abs(dat['R'][-1] - 0.358949) < 0.01
+            pids.append(pset._sbml_processes[-1].proc.pid)
+        assert pids[0] == pids[1]
+
+    @raises(subprocess.TimeoutExpired)
+    def test_persistent_timeout(self):
+        action = pset.TimeCourse({'time': '1000000', 'step': '0.01'})
+        m = pset.SbmlModel(self.file, self.abs_file, pset=pset.PSet(self.params), actions=(action,))
+        m.persistent = True
+        pset._stop_sbml_processes()
+        try:
+            m.execute(os.getcwd(), self.savefile2, 0.5)
+        finally:
+            # The timed out process was killed rather than returned to the pool
+            assert len(pset._sbml_processes) == 0
+
+    def test_persistent_dead_process(self):
+        action = pset.TimeCourse({'time': '1000', 'step': '10'})
+        m = pset.SbmlModel(self.file, self.abs_file, pset=pset.PSet(self.params), actions=(action,))
+        m.persistent = True
+        pset._stop_sbml_processes()
+        m.execute(os.getcwd(), self.savefile2, 1000)
+        dead = pset._sbml_processes[-1]
+        # A pooled process that dies while idle is discarded rather than given the next job
+        dead.proc.kill()
+        dead.proc.wait()
+        assert not dead.alive()
+        dat = m.execute(os.getcwd(), self.savefile2, 1000)['time_course']
+        assert abs(dat['RIRI'][-1] - 2.94514) < 0.01
+        assert len(pset._sbml_processes) == 1
+        assert pset._sbml_processes[0] is not dead
+
+    @raises(subprocess.TimeoutExpired)
+    def test_persistent_zero_timeout(self):
+        action = pset.TimeCourse({'time': '1000', 'step': '10'})
+        m = pset.SbmlModel(self.file, self.abs_file, pset=pset.PSet(self.params), actions=(action,))
+        m.persistent = True
+        m.execute(os.getcwd(), self.savefile2, 0)
 
     @raises(printing.PybnfError)
     def test_missing_key(self):
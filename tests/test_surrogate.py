@@ -0,0 +1,133 @@
+from .context import algorithms, config
+
+import numpy as np
+import pickle
+import shutil
+import time
+
+
+class TestSurrogate:
+    def __init__(self):
+        pass
+
+    @classmethod
+    def setup_class(cls):
+        cls.settings = {
+            'population_size': 20, 'max_iterations': 20, 'mutation_rate': 1.0, 'fit_type': 'de', 'surrogate': 1,
+            'surrogate_budget': 0.5,
+            ('uniform_var', 'v1__FREE'): [0, 10], ('uniform_var', 'v2__FREE'): [0, 10], ('uniform_var', 'v3__FREE'): [0, 10],
+            'models': {'bngl_files/parabola.bngl'}, 'exp_data': {'bngl_files/par1.exp'}, 'initialization': 'lh',
+            'bngl_files/parabola.bngl': ['bngl_files/par1.exp'],
+            'output_dir': 'test_surrogate'}
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree('test_surrogate')
+
+    @staticmethod
+    def score(ps):
+        return float(np.sum((ps.vector - 3.) ** 2))
+
+    def test_fit_predict(self):
+        np.random.seed(0)
+        model = algorithms.RBFSurrogate(min_points=10, background=False)
+        assert model.predict(np.zeros((1, 2))) is None
+        x = np.random.uniform(-2, 2, size=(200, 2))
+        for xi in x:
+            model.add(xi, np.sum(xi ** 2))
+        model.add(np.ones(2), np.inf)  # Ignored
+        assert len(model.points) == 200
+        model.fit()
+
+        # Predictions are on the scale log(1 + score - min score), so they should rank new points by their score.
+        test = np.random.uniform(-1.5, 1.5, size=(50, 2))
+        predicted = model.predict(test)
+        true = np.log1p(np.sum(test ** 2, axis=1) - np.min(np.sum(x ** 2, axis=1)))
+        assert np.max(np.abs(predicted - true)) < 0.05
+        scores = np.array(model.scores)
+        assert np.isclose(model.threshold(200), np.median(np.log1p(scores - np.min(scores))), atol=1e-3)
+
+        loaded = pickle.loads(pickle.dumps(model))
+        assert np.allclose(loaded.predict(test), predicted)
+        loaded.add(np.zeros(2), 0.)
+
+    def test_background_fit(self):
+        model = algorithms.RBFSurrogate(min_points=5)
+        for i in range(5):
+            model.add(np.array([i, 0.]), float(i))
+        for _ in range(100):
+            if model.model is not None:
+                break
+            time.sleep(0.05)
+        assert model.model is not None
+        model.close()
+        assert model._thread is None
+
+    def test_refit_every(self):
+        model = algorithms.RBFSurrogate(min_points=5, background=False, refit_every=3)
+        sizes = []
+        for i in range(12):
+            model.add(np.array([i, i % 3]), float(i))
+            sizes.append(model.fit_size)
+        assert model._thread is None
+        assert sizes == [0, 0, 0, 0, 5, 5, 5, 8, 8, 8, 11, 11]
+
+    def test_seeded_surrogate(self):
+        de = algorithms.DifferentialEvolution(config.Configuration(dict(self.settings, random_seed=1)))
+        assert not de.surrogate.background
+        assert de.surrogate.refit_every == de.config.config['population_size']
+
+    def test_screen_de(self):
+        np.random.seed(1)
+        de = algorithms.DifferentialEvolution(config.Configuration(dict(self.settings, islands=2)))
+        start_params = de.start_run()
+        de.surrogate = algorithms.RBFSurrogate(min_points=5, background=False)
+        torun = []
+        for ps in start_params:
+            res = algorithms.Result(ps, None, ps.name)
+            res.score = self.score(ps)
+            de.surrogate.add(ps.search_vector(), res.score)
+            torun += de.got_result(res)
+        assert de.screen_psets(torun) == torun  # No fit yet
+        de.surrogate_screened = 0
+        de.surrogate.fit()
+
+        screened = de.screen_psets(torun)
+        assert de.surrogate_screened == 20
+        assert 1 <= de.surrogate_replaced <= 10
+        assert [ps.name for ps in screened] == [ps.name for ps in torun]
+        assert sum(1 for a, b in zip(screened, torun) if a != b) == de.surrogate_replaced
+        assert len(de.island_map) == 20
+        for ps in screened:
+            island, j = de.island_map[ps]
+            assert de.proposed_individuals[island][j] is ps
+
+    def test_screen_pso(self):
+        np.random.seed(2)
+        pso = algorithms.ParticleSwarm(config.Configuration(dict(self.settings, fit_type='pso', population_size=10,
+                                                                 surrogate_budget=1.)))
+        start_params = pso.start_run()
+        pso.surrogate = algorithms.RBFSurrogate(min_points=5, background=False)
+        for ps in start_params:
+            pso.surrogate.add(ps.search_vector(), self.score(ps))
+        pso.surrogate.fit()
+        threshold = pso.surrogate.threshold(10)
+
+        replaced = 0
+        for ps in start_params:
+            res = algorithms.Result(ps, None, ps.name)
+            res.score = self.score(ps)
+            [proposed] = pso.got_result(res)
+            [new] = pso.screen_psets([proposed])
+            p = pso.pset_map[new]
+            assert new.name == proposed.name
+            assert np.allclose(pso.positions[p], new.search_vector())
+            assert pso.swarm[p][0] is new
+            if new != proposed:
+                replaced += 1
+                assert proposed not in pso.pset_map
+                assert pso.surrogate.predict(new.search_vector()[np.newaxis, :])[0] < \
+                    pso.surrogate.predict(proposed.search_vector()[np.newaxis, :])[0]
+                assert pso.surrogate.predict(proposed.search_vector()[np.newaxis, :])[0] > threshold
+        assert replaced == pso.surrogate_replaced
+        assert len(pso.pset_map) == 10
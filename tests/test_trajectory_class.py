@@ -1,4 +1,6 @@
 import re
+import os
+import numpy as np
 from .context import pset
 from nose.tools import raises
 
@@ -48,7 +50,9 @@ class TestTrajectory:
 
     @classmethod
     def teardown_class(cls):
-        pass
+        for f in ('test_traj_log.bin', 'test_traj_log2.bin'):
+            if os.path.isfile(f):
+                os.remove(f)
 
     def test_build(self):
         traj = pset.Trajectory(1000000)
@@ -99,4 +103,54 @@ class TestTrajectory:
         traj = pset.Trajectory.load_trajectory('bngl_files/traj.txt', self.ps0, 1000)
         assert len(traj._trajectory) == 16
         assert -max(traj._trajectory)[0] == 199.84014809103564
-        assert traj.best_fit_name() == 'iter2p1'
\ No newline at end of file
+        assert traj.best_fit_name() == 'iter2p1'
+
+    def test_incremental_write(self):
+        traj = pset.Trajectory(3)
+        traj.add(self.ps1, self.obj1, 'p1')
+        traj.add(self.ps3, self.obj3, 'p3')
+        assert traj._write() == '#\tSimulation\tObj\tx\ty\tz\n\tp1\t1.0\t3.0\t700.3\t0.00052\n' \
+                                '\tp3\tinf\t3.2\t10000.0\t45.78\n'
+        traj.add(self.ps0, self.obj0, 'p0')
+        traj.add(self.ps2, 0.5, 'p2')
+        assert [e[1] for e in traj.sorted_entries()] == ['p0', 'p2', 'p1']
+        assert traj.best_fit_name() == 'p0'
+
+    def test_log(self):
+        traj = pset.Trajectory(2, log_file='test_traj_log.bin')
+        traj.add(self.ps0, self.obj0, 'p0')
+        traj.add(self.ps1, self.obj1, 'p1')
+        traj.add(self.ps2, self.obj2, 'p2')
+        traj.close()
+        names, records = pset.Trajectory.read_log('test_traj_log.bin')
+        assert names == ['x', 'y', 'z']
+        records = list(records)
+        assert [r[0] for r in records] == ['p0', 'p1', 'p2']
+        assert records[2][1] == np.inf
+        assert np.all(records[1][2] == self.ps1.vector)
+
+        variables = [pset.FreeParameter(n, 'normal_var', 0, 1) for n in ('z', 'y', 'x')]
+        loaded = pset.Trajectory.from_log('test_traj_log.bin', variables, 5)
+        assert len(loaded._trajectory) == 3
+        assert loaded.best_fit_name() == 'p0'
+        assert loaded.best_fit()['z'] == 3.14
+        assert loaded._write().splitlines()[1:] == traj._write().splitlines()[1:] + ['\tp2\tinf\t1.0\t2.0\t3.141']
+
+    def test_log_reordered(self):
+        traj = pset.Trajectory(2, log_file='test_traj_log2.bin')
+        traj.add(self.ps0, self.obj0, 'p0')
+        # The same parameters listed in a different order are logged in the order of the header
+        reordered = pset.PSet([pset.FreeParameter(n, 'normal_var', 0, 1, value=v)
+                               for n, v in (('z', 5.0), ('x', 1.5), ('y', 2.5))])
+        traj.add(reordered, 4.0, 'p1')
+        traj.close()
+        # Records appended after reopening follow the header of the existing file
+        traj = pset.Trajectory(2, log_file='test_traj_log2.bin')
+        traj.add(reordered, 5.0, 'p2')
+        traj.close()
+        names, records = pset.Trajectory.read_log('test_traj_log2.bin')
+        assert names == ['x', 'y', 'z']
+        records = list(records)
+        assert np.all(records[0][2] == [1.0, 2.0, 3.14])
+        assert np.all(records[1][2] == [1.5, 2.5, 5.0])
+        assert np.all(records[2][2] == [1.5, 2.5, 5.0])